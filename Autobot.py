@@ -1,110 +1,332 @@
-import pyautogui
 import time
 import pyperclip
 import os
-from typing import Union, List, Optional
-from tqdm import *
+import logging
+from typing import Union, List, Optional, Tuple, Callable
 import random
 
+try:
+    import pyautogui
+except Exception:
+    # 无显示器的环境（如 CI）导入会失败，此时只能使用模拟后端（见 sim_backend.py）
+    pyautogui = None
+
+try:
+    from pyscreeze import ImageNotFoundException
+except ImportError:
+    class ImageNotFoundException(Exception):
+        pass
+
+from retry_policy import RetryPolicy, ClickResult
+from run_log import get_logger, ensure_configured
+from metrics import REGISTRY, ATTEMPT_BUCKETS
+
+try:
+    from template_store import TemplateStore
+    import matching
+except ImportError:
+    # 未安装 numpy 时直接把图片路径交给后端解码
+    TemplateStore = None
+    matching = None
+
+log = get_logger()
+
+CAPTURE_MS = REGISTRY.histogram('autobot_capture_ms', "截屏耗时（毫秒）")
+MATCH_MS = REGISTRY.histogram('autobot_match_ms', "定位耗时（毫秒，backend 方式包含截屏）",
+                              labels=('method',))
+LOCATES = REGISTRY.counter('autobot_locates_total', "单次定位结果", ('result',))
+CLICK_ATTEMPTS = REGISTRY.histogram('autobot_click_attempts', "每次点击的定位尝试次数",
+                                    ATTEMPT_BUCKETS, ('action', 'result'))
+WAIT_OVERSHOOT_MS = REGISTRY.histogram('autobot_wait_overshoot_ms', "等待比要求多出的时间（毫秒）")
+
 class AutoBot:
-    def __init__(self):
+    def __init__(self, backend=None, clipboard=None, clock=None, image_root=None, fast_locate=False):
+        """
+        backend: 屏幕/输入后端，默认 pyautogui，可替换为 sim_backend.SimulatedScreen
+        clipboard: 剪贴板，需提供 copy(text)，默认 pyperclip
+        clock: 时钟，需提供 time() 和 sleep(seconds)，默认 time 模块
+        image_root: 模板图像根目录，默认为脚本所在目录下的 images
+        fast_locate: 真实屏幕上改用模板存储的灰度金字塔匹配（matching.locate_pyramid）代替 pyscreeze 的彩色匹配。
+            速度更快，但匹配结果可能不同（粗匹配阶段可能漏掉目标），启用前请用 bench_locate.py 对比准确率
+        """
+        if backend is None:
+            if pyautogui is None:
+                raise RuntimeError("pyautogui 不可用（没有显示器？），请传入模拟后端")
+            backend = pyautogui
+        self.gui = backend
+        self.clipboard = clipboard or pyperclip
+        self.clock = clock or time
+        ensure_configured()
         self.last_ad_check = 0
         self.AD_CHECK_INTERVAL = 5
-        self.screen_width, self.screen_height = pyautogui.size()
+        self.screen_width, self.screen_height = self.gui.size()
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        self.image_root = os.path.join(script_dir, "images")
+        self.image_root = image_root or os.path.join(script_dir, "images")
         os.makedirs(self.image_root, exist_ok=True)
         self.mouse_speed = 0.5  # 默认移动速度（秒）
+        self.templates = TemplateStore(self.image_root) if TemplateStore is not None else None
+        # 显式启用、真实屏幕且有 OpenCV 时才用模板存储的金字塔匹配，默认仍由后端（pyscreeze）定位
+        self.fast_locate = (fast_locate and self.gui is pyautogui and self.templates is not None
+                            and matching.cv2 is not None)
     
     #region 核心操作函数
-    def click_left(self, img: str, retry: int = 1):
+    def click_left(self, img: str, retry: int = 1, policy: RetryPolicy = None) -> ClickResult:
         """单击左键"""
-        self._mouse_click(1, "left", img, retry)
-        print(f"单击左键 [{img}]")
+        result = self._mouse_click(1, "left", img, policy or RetryPolicy(attempts=retry))
+        self._report_click('click_left', "单击左键", img, result)
+        return result
 
-    def double_click(self, img: str, retry: int = 1):
+    def double_click(self, img: str, retry: int = 1, policy: RetryPolicy = None) -> ClickResult:
         """双击左键"""
-        self._mouse_click(2, "left", img, retry)
-        print(f"双击左键 [{img}]")
+        result = self._mouse_click(2, "left", img, policy or RetryPolicy(attempts=retry))
+        self._report_click('double_click', "双击左键", img, result)
+        return result
 
-    def click_right(self, img: str, retry: int = 1):
+    def click_right(self, img: str, retry: int = 1, policy: RetryPolicy = None) -> ClickResult:
         """右键单击"""
-        self._mouse_click(1, "right", img, retry)
-        print(f"右键点击 [{img}]")
+        result = self._mouse_click(1, "right", img, policy or RetryPolicy(attempts=retry))
+        self._report_click('click_right', "右键点击", img, result)
+        return result
 
     def input_text(self, text: str, clear: bool = False):
         """输入文本"""
         if clear:
-            pyautogui.hotkey('ctrl', 'a')
-            pyautogui.press('backspace')
+            self.gui.hotkey('ctrl', 'a')
+            self.gui.press('backspace')
         
-        pyperclip.copy(text)
-        pyautogui.hotkey('ctrl', 'v')
-        print(f"输入文本: {text} (清除原文本: {clear})")
-        time.sleep(0.2)
+        self.clipboard.copy(text)
+        self.gui.hotkey('ctrl', 'v')
+        self._event('input_text', "输入文本: %s (清除原文本: %s)", text, clear, text=text, clear=clear)
+        self.clock.sleep(0.2)
 
     def wait(self, seconds: Union[int, float]):
         """等待指定秒数"""
-        print(f"等待 {seconds} 秒")
-        for _ in tqdm(range(seconds)):
-            time.sleep(1)
+        self._event('wait', "等待 %s 秒", seconds, seconds=seconds)
+        started = self.clock.time()
+        self.clock.sleep(seconds)
+        WAIT_OVERSHOOT_MS.observe(max(0.0, self.clock.time() - started - seconds) * 1000)
 
     def scroll(self, amount: int, repeat: int = 1):
         """滚动鼠标滚轮"""
         for _ in range(repeat):
-            pyautogui.scroll(amount)
-            print(f"滚轮滚动 {amount} 单位")
-            time.sleep(0.2)
+            self.gui.scroll(amount)
+            self._event('scroll', "滚轮滚动 %s 单位", amount, amount=amount)
+            self.clock.sleep(0.2)
 
     def hotkey(self, *keys: str, repeat: int = 1):
         """执行热键组合"""
         for _ in range(repeat):
-            pyautogui.hotkey(*keys)
-            print(f"热键操作: {'+'.join(keys)}")
-            time.sleep(0.3)
+            self.gui.hotkey(*keys)
+            self._event('hotkey', "热键操作: %s", '+'.join(keys), keys=list(keys))
+            self.clock.sleep(0.3)
 
     def paste_time(self, time_format: str = "%Y-%m-%d %H:%M:%S"):
         """粘贴当前时间"""
-        localtime = time.strftime(time_format, time.localtime())
-        pyperclip.copy(localtime)
-        pyautogui.hotkey('ctrl', 'v')
-        print(f"粘贴时间: {localtime}")
+        localtime = time.strftime(time_format, time.localtime(self.clock.time()))
+        self.clipboard.copy(localtime)
+        self.gui.hotkey('ctrl', 'v')
+        self._event('paste_time', "粘贴时间: %s", localtime, text=localtime)
 
     def run_command(self, command: str):
         """执行系统命令"""
-        os.system(command)
-        print(f"执行系统命令: {command}")
+        started = self.clock.time()
+        status = os.system(command)
+        self._event('run_command', "执行系统命令: %s", command, started=started,
+                    level=logging.INFO if status == 0 else logging.WARNING,
+                    command=command, status=status)
+
+    def locate_all(self, img: str, confidence: float = 0.9) -> List[tuple]:
+        """截屏一次找出模板的所有位置，返回按阅读顺序排列的中心坐标"""
+        started = self.clock.time()
+        needle = self._load_template(img)
+        if self.fast_locate and hasattr(needle, 'shape'):
+            # 真实屏幕：在整幅截图上做一次向量化匹配和非极大值抑制
+            screen = matching.screen_to_bgr(self._screenshot())
+            match_started = time.perf_counter()
+            matches = [(x, y) for x, y, _ in matching.locate_all(screen, needle, confidence)]
+            MATCH_MS.labels('all').observe((time.perf_counter() - match_started) * 1000)
+        else:
+            # 其他后端（如模拟屏幕）或没有 OpenCV 时，对后端返回的框去重
+            match_started = time.perf_counter()
+            boxes = [tuple(box) for box in self.gui.locateAllOnScreen(needle, confidence=confidence)]
+            MATCH_MS.labels('backend_all').observe((time.perf_counter() - match_started) * 1000)
+            if matching is not None and boxes:
+                boxes = [boxes[i] for i in sorted(matching.non_max_suppression(
+                    boxes, list(range(len(boxes), 0, -1))))]
+            centers = [(int(b[0] + b[2] // 2), int(b[1] + b[3] // 2)) for b in boxes]
+            row_tolerance = min((b[3] for b in boxes), default=0) // 2
+            matches = matching.reading_order(centers, row_tolerance) if matching else centers
+        self._event('locate_all', "找到 %d 个匹配 [%s]", len(matches), img, started=started,
+                    img=img, confidence=confidence, matches=len(matches))
+        return matches
 
-    def silent_click(self, img: str, confidence: float = 0.8):
+    def click_at(self, x: int, y: int, clicks: int = 1, button: str = "left"):
+        """在指定坐标点击"""
+        self.gui.click(x=x, y=y, clicks=clicks, interval=0.2, duration=0.2, button=button)
+        if log.isEnabledFor(logging.DEBUG):
+            self._event('click_at', "点击 (%d, %d)", x, y, level=logging.DEBUG,
+                        x=x, y=y, clicks=clicks, button=button)
+
+    def silent_click(self, img: str, confidence: float = 0.8) -> ClickResult:
         """静默点击（找不到不报错）"""
         try:
-            pos = pyautogui.locateCenterOnScreen(img, confidence=confidence)
-            if pos:
-                pyautogui.click(pos)
-                return True
+            return self._mouse_click(1, "left", img, RetryPolicy(), confidence)
         except Exception as e:
-            pass
-        return False
+            return ClickResult(False, 1, 0.0)
+
+    #endregion
+
+
+    #region 像素探针
+    def pixel_check(self, points: List[Tuple[int, int]], color: Tuple[int, int, int],
+                    tolerance: int = 10, expect: bool = True, timeout: float = 0.0,
+                    interval: float = 0.1) -> bool:
+        """检查一批像素是否都接近指定颜色（一次截取包含所有点的最小区域）
+
+        expect 为 False 时检查颜色不匹配（如等待加载动画消失）；
+        timeout 大于 0 时轮询直到满足条件或超时，返回是否满足
+        """
+        started = self.clock.time()
+        left = min(x for x, _ in points)
+        top = min(y for _, y in points)
+        region = (left, top, max(x for x, _ in points) - left + 1,
+                  max(y for _, y in points) - top + 1)
 
+        def check():
+            image = self._capture(region)
+            return all(self._color_close(image.getpixel((x - left, y - top)), color, tolerance)
+                       for x, y in points)
+        result = self._poll(check, expect, timeout, interval)
+        self._event('pixel_check', "像素检查 %d 个点 %s", len(points), '通过' if result else '未通过',
+                    started=started, points=len(points), expect=expect, result=result)
+        return result
+
+    def color_region_check(self, region: Tuple[int, int, int, int], color: Tuple[int, int, int],
+                           tolerance: int = 10, expect: bool = True, timeout: float = 0.0,
+                           interval: float = 0.1) -> bool:
+        """检查区域 (left, top, width, height) 的平均颜色是否接近指定颜色，参数同 pixel_check"""
+        from PIL import ImageStat
+        started = self.clock.time()
+
+        def check():
+            mean = ImageStat.Stat(self._capture(region)).mean
+            return self._color_close(mean, color, tolerance)
+        result = self._poll(check, expect, timeout, interval)
+        self._event('color_region_check', "区域颜色检查 %s %s", region, '通过' if result else '未通过',
+                    started=started, region=list(region), expect=expect, result=result)
+        return result
     #endregion
 
 
     #region 私有方法
-    def _mouse_click(self, clicks: int, button: str, img: str, retry: int):
-        """通用鼠标点击逻辑"""
-        for _ in range(retry):
-            location = pyautogui.locateCenterOnScreen(img, confidence=0.9)
-            if location:
-                pyautogui.click(
-                    x=location.x,
-                    y=location.y,
-                    clicks=clicks,
-                    interval=0.2,
-                    duration=0.2,
-                    button=button
-                )
-                break
-            time.sleep(0.1)
+    def _event(self, action: str, message: str, *args, level: int = logging.INFO,
+               started: float = None, **params):
+        """记录一个动作事件，级别未启用时直接返回"""
+        if not log.isEnabledFor(level):
+            return
+        extra = {'action': action, 'params': params}
+        if started is not None:
+            extra['elapsed'] = round(self.clock.time() - started, 3)
+        log.log(level, message, *args, extra=extra)
+
+    def _screenshot(self, **kwargs):
+        """截屏并记录耗时"""
+        started = time.perf_counter()
+        image = self.gui.screenshot(**kwargs)
+        CAPTURE_MS.observe((time.perf_counter() - started) * 1000)
+        return image
+
+    def _capture(self, region: Tuple[int, int, int, int]):
+        """截取屏幕区域为 RGB 图像"""
+        return self._screenshot(region=region).convert('RGB')
+
+    @staticmethod
+    def _color_close(actual, expected, tolerance: int) -> bool:
+        """各通道差值都不超过 tolerance"""
+        return all(abs(a - e) <= tolerance for a, e in zip(actual, expected))
+
+    def _poll(self, check: Callable[[], bool], expect: bool, timeout: float, interval: float) -> bool:
+        """轮询 check 直到结果等于 expect 或超时"""
+        deadline = self.clock.time() + timeout
+        while True:
+            if check() == expect:
+                return True
+            if self.clock.time() >= deadline:
+                return False
+            self.clock.sleep(interval)
+
+    def _load_template(self, img: str):
+        """从模板存储加载预解码的模板（先在 image_root 下查找，再查找当前目录）"""
+        if self.templates is None:
+            return img
+        try:
+            return self.templates.needle(img)
+        except FileNotFoundError:
+            return img  # 文件不存在时交给后端报错
+
+    def _locate(self, img: str, confidence: float) -> Optional[Tuple[int, int, Optional[float]]]:
+        """定位模板中心，返回 (x, y, 得分)，找不到返回 None；后端不提供得分时得分为 None"""
+        if self.fast_locate:
+            try:
+                template = self.templates.get(img)
+            except FileNotFoundError:
+                template = None
+            if template is not None:
+                screen = matching.screen_to_gray(self._screenshot())
+                match_started = time.perf_counter()
+                found = matching.locate_pyramid(screen, template, confidence)
+                MATCH_MS.labels('pyramid').observe((time.perf_counter() - match_started) * 1000)
+                LOCATES.labels('hit' if found else 'miss').inc()
+                if log.isEnabledFor(logging.DEBUG):
+                    self._event('locate', "定位 [%s]: %s", img, found, level=logging.DEBUG,
+                                img=img, confidence=confidence, found=found)
+                return found
+        needle = self._load_template(img)
+        match_started = time.perf_counter()
+        try:
+            location = self.gui.locateCenterOnScreen(needle, confidence=confidence)
+        except ImageNotFoundException:
+            location = None
+        MATCH_MS.labels('backend').observe((time.perf_counter() - match_started) * 1000)
+        LOCATES.labels('hit' if location else 'miss').inc()
+        if log.isEnabledFor(logging.DEBUG):
+            self._event('locate', "定位 [%s]: %s", img, location, level=logging.DEBUG,
+                        img=img, confidence=confidence, found=location and [location.x, location.y])
+        return (location.x, location.y, None) if location else None
+
+    def _screen_fingerprint(self) -> bytes:
+        """屏幕缩略图，用于判断画面是否变化"""
+        return self._screenshot().resize((64, 36)).tobytes()
+
+    def _mouse_click(self, clicks: int, button: str, img: str, policy: RetryPolicy,
+                     confidence: float = 0.9) -> ClickResult:
+        """通用鼠标点击逻辑：按重试策略定位，找到后点击"""
+        found, attempts, elapsed = policy.run(lambda: self._locate(img, confidence), self.clock,
+                                              self._screen_fingerprint)
+        if found is None:
+            return ClickResult(False, attempts, elapsed)
+        x, y, score = found
+        self.gui.click(
+            x=x,
+            y=y,
+            clicks=clicks,
+            interval=0.2,
+            duration=0.2,
+            button=button
+        )
+        return ClickResult(True, attempts, elapsed, score, (x, y))
+
+    @staticmethod
+    def _report_click(action: str, label: str, img: str, result: ClickResult):
+        CLICK_ATTEMPTS.labels(action, 'found' if result else 'missing').observe(result.attempts)
+        extra = {'action': action, 'elapsed': round(result.elapsed, 3),
+                 'params': {'img': img, 'attempts': result.attempts,
+                            'confidence': result.confidence, 'location': result.location}}
+        if result:
+            log.info("%s [%s]", label, img, extra=extra)
+        else:
+            log.warning("%s失败，未找到 [%s]（尝试 %d 次，用时 %.1f 秒）", label, img,
+                        result.attempts, result.elapsed, extra=extra)
     #endregion
 
 # 初始化自动化机器人
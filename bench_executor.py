@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作流执行器扩展性基准测试
+生成链式、宽扇出、菱形和嵌套循环等结构的工作流 JSON，用空操作的 AutoBot 替身执行，
+统计加载/编译耗时、单节点调度开销、内存峰值和循环路径展开数量，
+用于在规模变大之前发现平方级和指数级的行为
+"""
+
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import multiprocessing
+from typing import Dict, List, Any, Callable
+
+try:
+    import resource  # 仅 Unix
+except ImportError:
+    resource = None
+
+from workflow_model import graph_from_dict
+from workflow_executor import WorkflowExecutor
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+BODY_TYPES = ['click_left', 'hotkey', 'scroll', 'input_text', 'wait']
+
+
+class NullBot:
+    """空操作的 AutoBot 替身，只统计调用次数"""
+    def __init__(self):
+        self.calls = 0
+
+    def click_left(self, img, retry=1, policy=None):
+        self.calls += 1
+        return True
+
+    def double_click(self, img, retry=1, policy=None):
+        self.calls += 1
+        return True
+
+    def click_right(self, img, retry=1, policy=None):
+        self.calls += 1
+        return True
+
+    def input_text(self, text, clear=False):
+        self.calls += 1
+
+    def wait(self, seconds):
+        self.calls += 1
+
+    def scroll(self, amount, repeat=1):
+        self.calls += 1
+
+    def hotkey(self, *keys, repeat=1):
+        self.calls += 1
+
+    def paste_time(self, time_format="%Y-%m-%d %H:%M:%S"):
+        self.calls += 1
+
+    def run_command(self, command):
+        self.calls += 1
+
+    def locate_all(self, img, confidence=0.9):
+        self.calls += 1
+        return []
+
+    def click_at(self, x, y, clicks=1, button="left"):
+        self.calls += 1
+
+    def pixel_check(self, points, color, tolerance=10, expect=True, timeout=0.0):
+        self.calls += 1
+        return True
+
+    def color_region_check(self, region, color, tolerance=10, expect=True, timeout=0.0):
+        self.calls += 1
+        return True
+
+
+class CountingExecutor(WorkflowExecutor):
+    """统计调度次数和循环路径展开情况的执行器"""
+    def compile(self):
+        self.operations = 0
+        self.path_calls = 0
+        self.loop_paths: List[int] = []
+        super().compile()
+
+    def execute_node_operation(self, node):
+        self.operations += 1
+        return super().execute_node_operation(node)
+
+    def find_loop_body_paths(self, loop_node_id):
+        paths = super().find_loop_body_paths(loop_node_id)
+        self.loop_paths.append(len(paths))
+        return paths
+
+    def build_execution_path_until_end(self, node_id, current_path, all_paths, visited):
+        self.path_calls += 1
+        super().build_execution_path_until_end(node_id, current_path, all_paths, visited)
+
+    def print_error(self, node, error):
+        pass
+
+
+#region 工作流生成
+class WorkflowBuilder:
+    """按网格布局生成工作流字典（与保存格式一致）"""
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.connections: List[Dict[str, str]] = []
+
+    def add(self, node_type: str, **params) -> str:
+        index = len(self.nodes) + 1
+        node_id = f"node_{index}"
+        if not params and node_type in BODY_TYPES:
+            params = {'wait': {'seconds': 0}, 'input_text': {'text': 'x'}}.get(node_type, {})
+        self.nodes[node_id] = {
+            'type': node_type,
+            'x': 50 + (index % 100) * 150,
+            'y': 100 + (index // 100) * 100,
+            'params': params,
+        }
+        return node_id
+
+    def body(self, index: int) -> str:
+        return self.add(BODY_TYPES[index % len(BODY_TYPES)])
+
+    def connect(self, from_node: str, to_node: str):
+        self.connections.append({'from': from_node, 'to': to_node})
+
+    def chain_from(self, start: str, count: int) -> str:
+        """从 start 之后追加 count 个串联节点，返回最后一个节点"""
+        last = start
+        for i in range(count):
+            node = self.body(i)
+            self.connect(last, node)
+            last = node
+        return last
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'nodes': self.nodes, 'connections': self.connections}
+
+
+def gen_chain(size: int) -> Dict[str, Any]:
+    """长链：a -> b -> c -> ..."""
+    builder = WorkflowBuilder()
+    builder.chain_from(builder.body(0), size - 1)
+    return builder.to_dict()
+
+
+def gen_fanout(size: int) -> Dict[str, Any]:
+    """宽扇出：一个起点连接到所有其他节点"""
+    builder = WorkflowBuilder()
+    root = builder.body(0)
+    for i in range(1, size):
+        builder.connect(root, builder.body(i))
+    return builder.to_dict()
+
+
+def gen_diamonds(size: int) -> Dict[str, Any]:
+    """串联的菱形：a -> (b, c) -> d -> (e, f) -> g ..."""
+    builder = WorkflowBuilder()
+    last = builder.body(0)
+    for i in range((size - 1) // 3):
+        left, right, join = builder.body(i), builder.body(i + 1), builder.body(i + 2)
+        builder.connect(last, left)
+        builder.connect(last, right)
+        builder.connect(left, join)
+        builder.connect(right, join)
+        last = join
+    return builder.to_dict()
+
+
+def gen_loop_diamonds(size: int) -> Dict[str, Any]:
+    """循环体内串联菱形，循环路径数随菱形数量指数增长"""
+    builder = WorkflowBuilder()
+    loop = builder.add('for_loop', loop_count=2, loop_name='菱形循环')
+    last = loop
+    for i in range(max(1, (size - 2) // 3)):
+        left, right, join = builder.body(i), builder.body(i + 1), builder.body(i + 2)
+        builder.connect(last, left)
+        builder.connect(last, right)
+        builder.connect(left, join)
+        builder.connect(right, join)
+        last = join
+    builder.connect(last, builder.add('loop_end', end_name='菱形循环结束'))
+    return builder.to_dict()
+
+
+def gen_nested_loops(size: int) -> Dict[str, Any]:
+    """串联的嵌套循环块：for -> for -> 循环体 -> end -> 循环体 -> end"""
+    builder = WorkflowBuilder()
+    last = builder.body(0)
+    for i in range(max(1, (size - 1) // 8)):
+        outer = builder.add('for_loop', loop_count=2, loop_name=f'外层{i}')
+        inner = builder.add('for_loop', loop_count=2, loop_name=f'内层{i}')
+        builder.connect(last, outer)
+        builder.connect(outer, inner)
+        inner_end = builder.add('loop_end', end_name=f'内层{i}结束')
+        builder.connect(builder.chain_from(inner, 2), inner_end)
+        outer_end = builder.add('loop_end', end_name=f'外层{i}结束')
+        builder.connect(builder.chain_from(inner_end, 2), outer_end)
+        last = outer_end
+    return builder.to_dict()
+
+
+SHAPES: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    'chain': gen_chain,
+    'fanout': gen_fanout,
+    'diamonds': gen_diamonds,
+    'loop_diamonds': gen_loop_diamonds,
+    'nested_loops': gen_nested_loops,
+}
+#endregion
+
+
+#region 测量
+def max_rss_kb():
+    """进程的峰值常驻内存（KB），不支持的平台为 None"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+
+
+def load_model(data: Dict[str, Any], model: str):
+    """按指定的存储方式构建节点和连接"""
+    return graph_from_dict(data, compact=(model == 'compact'))
+
+
+def measure_case(shape: str, size: int, trace_memory: bool, model: str = 'objects') -> Dict[str, Any]:
+    """生成、加载、编译并执行一个工作流，返回各阶段指标"""
+    base_rss = max_rss_kb()
+    if trace_memory:
+        tracemalloc.start()
+
+    text = json.dumps(SHAPES[shape](size), ensure_ascii=False)
+
+    t0 = time.perf_counter()
+    data = json.loads(text)
+    before = tracemalloc.get_traced_memory()[0] if trace_memory else 0
+    nodes, connections = load_model(data, model)
+    load_ms = (time.perf_counter() - t0) * 1000
+    graph_bytes = tracemalloc.get_traced_memory()[0] - before if trace_memory else None
+    del data
+
+    bot = NullBot()
+    t0 = time.perf_counter()
+    executor = CountingExecutor(nodes, connections, bot)
+    compile_ms = (time.perf_counter() - t0) * 1000
+
+    stats = {
+        'nodes': len(nodes),
+        'connections': len(connections),
+        'json_bytes': len(text.encode('utf-8')),
+        'load_ms': load_ms,
+        'compile_ms': compile_ms,
+    }
+
+    t0 = time.perf_counter()
+    try:
+        executor.run()
+        stats['status'] = 'ok'
+    except RecursionError:
+        stats['status'] = 'recursion_error'
+    run_ms = (time.perf_counter() - t0) * 1000
+
+    stats.update({
+        'run_ms': run_ms,
+        'operations': executor.operations,
+        'bot_calls': bot.calls,
+        'dispatch_us_per_op': run_ms * 1000 / executor.operations if executor.operations else 0.0,
+        'path_calls': executor.path_calls,
+        'loop_paths_total': sum(executor.loop_paths),
+        'loop_paths_max': max(executor.loop_paths, default=0),
+        'max_rss_kb': max_rss_kb(),
+        'rss_growth_kb': max_rss_kb() - base_rss if resource else None,
+    })
+    if trace_memory:
+        stats['graph_alloc_bytes'] = graph_bytes
+        stats['peak_alloc_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return stats
+
+
+def _case_worker(shape: str, size: int, trace_memory: bool, model: str, queue):
+    """子进程入口：隔离每个用例的内存和超时"""
+    # 屏蔽执行器的控制台输出，避免 I/O 干扰计时
+    sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+    try:
+        queue.put(measure_case(shape, size, trace_memory, model))
+    except Exception as e:
+        queue.put({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+
+def run_case(shape: str, size: int, timeout: float, trace_memory: bool,
+             model: str = 'objects') -> Dict[str, Any]:
+    """在子进程中运行用例，超时则终止"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_case_worker,
+                                      args=(shape, size, trace_memory, model, queue))
+    started = time.perf_counter()
+    process.start()
+    try:
+        result = queue.get(timeout=timeout)
+    except Exception:
+        result = {'status': 'timeout'}
+    process.join(1)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    result['wall_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def git_commit():
+    """获取当前提交号，便于跨提交对比"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+#endregion
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="工作流执行器扩展性基准测试")
+    parser.add_argument('--shapes', default=','.join(SHAPES), help="工作流结构列表")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help="节点规模列表")
+    parser.add_argument('--timeout', type=float, default=60.0, help="单个用例的超时时间（秒）")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="使用 tracemalloc 统计分配峰值（会明显变慢）")
+    parser.add_argument('--model', choices=['objects', 'compact'], default='objects',
+                        help="节点存储方式：objects 为 Node/Connection 对象，compact 为 GraphStore 数组")
+    parser.add_argument('--dump', help="将生成的工作流 JSON 写入该目录")
+    parser.add_argument('--output', default='bench_executor.json', help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    shapes = [shape.strip() for shape in args.shapes.split(',') if shape.strip()]
+    unknown = [shape for shape in shapes if shape not in SHAPES]
+    if unknown:
+        parser.error(f"未知结构: {', '.join(unknown)}")
+    sizes = sorted(int(size) for size in args.sizes.split(',') if size.strip())
+
+    if args.dump:
+        os.makedirs(args.dump, exist_ok=True)
+        for shape in shapes:
+            for size in sizes:
+                path = os.path.join(args.dump, f"{shape}_{size}.json")
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(SHAPES[shape](size), f, ensure_ascii=False)
+        print(f"工作流已写入 {args.dump}")
+
+    results = []
+    for shape in shapes:
+        failed = False
+        for size in sizes:
+            if failed:
+                # 更小的规模已经失败，跳过更大的规模
+                results.append({'shape': shape, 'size': size, 'status': 'skipped'})
+                print(f"{shape:<14} {size:>7} 跳过")
+                continue
+            stats = run_case(shape, size, args.timeout, args.trace_memory, args.model)
+            stats.update({'shape': shape, 'size': size})
+            results.append(stats)
+            failed = stats['status'] != 'ok'
+            if stats['status'] == 'ok':
+                print(f"{shape:<14} {size:>7} 加载={stats['load_ms']:9.2f}ms "
+                      f"编译={stats['compile_ms']:8.2f}ms 执行={stats['run_ms']:10.2f}ms "
+                      f"调度={stats['dispatch_us_per_op']:7.2f}us/节点 "
+                      f"路径={stats['loop_paths_total']}")
+            else:
+                print(f"{shape:<14} {size:>7} {stats['status']} {stats.get('error', '')}")
+
+    report = {
+        'environment': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'recursion_limit': sys.getrecursionlimit(),
+        },
+        'config': {'shapes': shapes, 'sizes': sizes, 'timeout': args.timeout,
+                   'trace_memory': args.trace_memory, 'model': args.model},
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板匹配基准测试
+用 NumPy 生成合成屏幕和模板，在无显示器的环境下测量 AutoBot 可用的各个定位后端，
+输出吞吐量、延迟分位数、内存峰值和命中率，结果写入 JSON 便于跨提交对比
+"""
+
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from typing import Dict, List, Any, Tuple, Optional, Callable
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import pyscreeze
+except ImportError:
+    pyscreeze = None
+
+try:
+    import resource  # 仅 Unix
+except ImportError:
+    resource = None
+
+if cv2 is not None:
+    from template_store import Template, pyr_down
+    from matching import locate_pyramid
+
+# 分辨率配置
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4k': (3840, 2160),
+}
+
+# 场景配置：噪声标准差、模板缩放比例、干扰项数量、模板是否出现在屏幕上
+SCENARIOS = {
+    'clean': {'noise': 0.0, 'scale': 1.0, 'distractors': 0, 'present': True},
+    'noise': {'noise': 6.0, 'scale': 1.0, 'distractors': 0, 'present': True},
+    'scaled': {'noise': 0.0, 'scale': 1.1, 'distractors': 0, 'present': True},
+    'distractors': {'noise': 2.0, 'scale': 1.0, 'distractors': 8, 'present': True},
+    'absent': {'noise': 2.0, 'scale': 1.0, 'distractors': 8, 'present': False},
+}
+
+TEMPLATE_SIZE = (96, 40)  # 模板宽高，接近常见按钮尺寸
+CONFIDENCE = 0.9  # 与 AutoBot._mouse_click 保持一致
+
+
+#region 合成图像
+def make_screen(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """生成带渐变背景、色块和“文字”条纹的合成屏幕（RGB）"""
+    ramp = np.linspace(200, 245, height, dtype=np.float32)[:, None, None]
+    tint = rng.uniform(0.9, 1.0, size=3).astype(np.float32)
+    screen = np.broadcast_to(ramp * tint, (height, width, 3)).astype(np.uint8)
+
+    # 模拟窗口和面板
+    for _ in range(max(20, width * height // 60000)):
+        w = int(rng.integers(40, width // 4))
+        h = int(rng.integers(20, height // 4))
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - h))
+        screen[y:y + h, x:x + w] = rng.integers(0, 256, size=3, dtype=np.uint8)
+
+    # 模拟文字行：细小的随机明暗块
+    for _ in range(max(30, height // 20)):
+        w = int(rng.integers(60, 400))
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - 8))
+        glyphs = rng.random((2, w // 3)) < 0.4
+        glyphs = np.repeat(np.repeat(glyphs, 4, axis=0), 3, axis=1)[:, :w]
+        region = screen[y:y + 8, x:x + glyphs.shape[1]]
+        region[glyphs] = region[glyphs] // 4
+    return screen
+
+
+def make_template(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """生成按钮样式的模板：纯色底、描边和随机图案"""
+    template = np.empty((height, width, 3), dtype=np.uint8)
+    template[:] = rng.integers(30, 220, size=3, dtype=np.uint8)
+    template[[0, -1], :] = 20
+    template[:, [0, -1]] = 20
+    glyphs = rng.random((height // 4, width // 4)) < 0.5
+    glyphs = np.kron(glyphs, np.ones((2, 2), dtype=bool))
+    gh, gw = glyphs.shape
+    oy, ox = (height - gh) // 2, (width - gw) // 2
+    inner = template[oy:oy + gh, ox:ox + gw]
+    inner[glyphs] = 255 - inner[glyphs]
+    return template
+
+
+def make_distractor(rng: np.random.Generator, template: np.ndarray) -> np.ndarray:
+    """生成与模板相似但不相同的干扰项（替换约三分之一的图案）"""
+    distractor = template.copy()
+    h, w = distractor.shape[:2]
+    x0 = int(rng.integers(w // 6, w // 2))
+    distractor[2:-2, x0:x0 + w // 3] = rng.integers(0, 256, size=3, dtype=np.uint8)
+    return distractor
+
+
+def resize_nearest(img: np.ndarray, scale: float) -> np.ndarray:
+    """最近邻缩放（不依赖 OpenCV）"""
+    if scale == 1.0:
+        return img
+    h, w = img.shape[:2]
+    nh, nw = max(1, int(round(h * scale))), max(1, int(round(w * scale)))
+    rows = np.minimum((np.arange(nh) / scale).astype(np.intp), h - 1)
+    cols = np.minimum((np.arange(nw) / scale).astype(np.intp), w - 1)
+    return img[rows[:, None], cols]
+
+
+def add_noise(rng: np.random.Generator, img: np.ndarray, sigma: float) -> np.ndarray:
+    """叠加高斯噪声"""
+    if sigma <= 0:
+        return img
+    noisy = img.astype(np.int16) + rng.normal(0, sigma, img.shape).astype(np.int16)
+    return np.clip(noisy, 0, 255).astype(np.uint8)
+
+
+def random_slot(rng: np.random.Generator, taken: List[Tuple[int, int, int, int]],
+                width: int, height: int, w: int, h: int) -> Tuple[int, int]:
+    """随机选取一个不与已放置图块重叠的位置"""
+    for _ in range(200):
+        x = int(rng.integers(0, width - w))
+        y = int(rng.integers(0, height - h))
+        if all(x + w <= tx or tx + tw <= x or y + h <= ty or ty + th <= y
+               for tx, ty, tw, th in taken):
+            taken.append((x, y, w, h))
+            return x, y
+    taken.append((x, y, w, h))
+    return x, y
+
+
+def make_case(seed: int, resolution: str, scenario: str) -> Dict[str, Any]:
+    """生成一个测试用例：屏幕、模板和真实中心点"""
+    rng = np.random.default_rng(seed)
+    width, height = RESOLUTIONS[resolution]
+    config = SCENARIOS[scenario]
+    tw, th = TEMPLATE_SIZE
+
+    screen = make_screen(rng, width, height)
+    template = make_template(rng, tw, th)
+    taken: List[Tuple[int, int, int, int]] = []
+
+    for _ in range(config['distractors']):
+        distractor = make_distractor(rng, template)
+        x, y = random_slot(rng, taken, width, height, tw, th)
+        screen[y:y + th, x:x + tw] = distractor
+
+    truth = None
+    if config['present']:
+        placed = resize_nearest(template, config['scale'])
+        ph, pw = placed.shape[:2]
+        x, y = random_slot(rng, taken, width, height, pw, ph)
+        screen[y:y + ph, x:x + pw] = placed
+        truth = (x + pw // 2, y + ph // 2)
+
+    screen = add_noise(rng, screen, config['noise'])
+    return {'screen': screen, 'template': template, 'truth': truth}
+#endregion
+
+
+#region 定位后端
+def _pil_pair(needle: np.ndarray, haystack: np.ndarray):
+    """截图和模板在生产环境中都以 PIL 图像的形式交给 pyscreeze"""
+    return Image.fromarray(needle), Image.fromarray(haystack)
+
+
+def _pyscreeze_locate(needle, haystack, **kwargs) -> Optional[Tuple[int, int]]:
+    """调用 pyscreeze.locate，并把“未找到”异常统一为 None"""
+    try:
+        box = pyscreeze.locate(needle, haystack, **kwargs)
+    except pyscreeze.ImageNotFoundException:
+        return None
+    if box is None:
+        return None
+    return (box[0] + box[2] // 2, box[1] + box[3] // 2)
+
+
+def _pillow_locate(needle, haystack) -> Optional[Tuple[int, int]]:
+    """pyscreeze 的纯 Python 精确匹配（未安装 OpenCV 时 AutoBot 实际使用的路径）"""
+    try:
+        for box in pyscreeze._locateAll_pillow(needle, haystack, limit=1):
+            return (box[0] + box[2] // 2, box[1] + box[3] // 2)
+    except pyscreeze.ImageNotFoundException:
+        pass
+    return None
+
+
+def _bgr_pair(needle: np.ndarray, haystack: np.ndarray):
+    """预先解码为 OpenCV 的 BGR 数组"""
+    return (np.ascontiguousarray(needle[:, :, ::-1]),
+            np.ascontiguousarray(haystack[:, :, ::-1]))
+
+
+def _gray_pair(needle: np.ndarray, haystack: np.ndarray):
+    """预先解码为灰度数组"""
+    return (cv2.cvtColor(needle, cv2.COLOR_RGB2GRAY),
+            cv2.cvtColor(haystack, cv2.COLOR_RGB2GRAY))
+
+
+def _pyramid_pair(needle: np.ndarray, haystack: np.ndarray):
+    """模拟模板存储提供的灰度金字塔（见 template_store.py）"""
+    gray, screen = _gray_pair(needle, haystack)
+    pyramid = [gray, pyr_down(gray), pyr_down(pyr_down(gray))]
+    return Template('bench', 'bench.png', needle, gray, pyramid), screen
+
+
+def _pyramid_locate(template, screen) -> Optional[Tuple[int, int]]:
+    """由粗到精的金字塔匹配"""
+    found = locate_pyramid(screen, template, CONFIDENCE)
+    return found[:2] if found else None
+
+
+def _opencv_locate(needle: np.ndarray, haystack: np.ndarray) -> Optional[Tuple[int, int]]:
+    """直接调用 cv2.matchTemplate，作为去掉格式转换后的下限参考"""
+    scores = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    _, best, _, loc = cv2.minMaxLoc(scores)
+    if best < CONFIDENCE:
+        return None
+    h, w = needle.shape[:2]
+    return (loc[0] + w // 2, loc[1] + h // 2)
+
+
+# 后端名称 -> (是否可用, 准备函数, 定位函数)
+# pyscreeze_opencv 与 AutoBot 当前调用完全一致（是否灰度取决于 pyscreeze.GRAYSCALE_DEFAULT）
+BACKENDS: Dict[str, Tuple[Callable[[], bool], Callable, Callable]] = {
+    'pyscreeze_opencv': (
+        lambda: pyscreeze is not None and cv2 is not None and Image is not None,
+        _pil_pair,
+        lambda n, h: _pyscreeze_locate(n, h, confidence=CONFIDENCE),
+    ),
+    'pyscreeze_opencv_color': (
+        lambda: pyscreeze is not None and cv2 is not None and Image is not None,
+        _pil_pair,
+        lambda n, h: _pyscreeze_locate(n, h, confidence=CONFIDENCE, grayscale=False),
+    ),
+    'pyscreeze_pillow': (
+        lambda: pyscreeze is not None and Image is not None
+        and hasattr(pyscreeze, '_locateAll_pillow'),
+        _pil_pair,
+        _pillow_locate,
+    ),
+    'opencv_direct': (
+        lambda: cv2 is not None,
+        _bgr_pair,
+        _opencv_locate,
+    ),
+    'opencv_direct_gray': (
+        lambda: cv2 is not None,
+        _gray_pair,
+        _opencv_locate,
+    ),
+    'store_pyramid': (
+        lambda: cv2 is not None,
+        _pyramid_pair,
+        _pyramid_locate,
+    ),
+}
+#endregion
+
+
+#region 测量与统计
+def percentile(values: List[float], q: float) -> float:
+    """计算分位数（毫秒列表为空时返回 0）"""
+    if not values:
+        return 0.0
+    return float(np.percentile(values, q))
+
+
+def run_backend(name: str, cases: List[Dict[str, Any]], repeats: int,
+                tolerance: int, time_budget: float) -> Dict[str, Any]:
+    """在一组用例上运行单个后端，返回统计结果"""
+    _, prepare, locate = BACKENDS[name]
+    latencies: List[float] = []
+    hits = misses = false_positives = true_negatives = errors = skipped = 0
+    peak_alloc = 0
+    started = time.perf_counter()
+
+    for case in cases:
+        if time.perf_counter() - started > time_budget:
+            skipped += 1
+            continue
+
+        needle, haystack = prepare(case['template'], case['screen'])
+        truth = case['truth']
+
+        # 单独跑一次测量内存峰值，避免 tracemalloc 影响计时
+        tracemalloc.start()
+        try:
+            result = locate(needle, haystack)
+        except Exception:
+            tracemalloc.stop()
+            errors += 1
+            continue
+        peak_alloc = max(peak_alloc, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            result = locate(needle, haystack)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        if truth is None:
+            if result is None:
+                true_negatives += 1
+            else:
+                false_positives += 1
+        elif result is None:
+            misses += 1
+        elif abs(result[0] - truth[0]) <= tolerance and abs(result[1] - truth[1]) <= tolerance:
+            hits += 1
+        else:
+            false_positives += 1
+
+    evaluated = hits + misses + false_positives + true_negatives
+    total_seconds = sum(latencies) / 1000
+    return {
+        'cases': len(cases),
+        'evaluated': evaluated,
+        'skipped': skipped,
+        'errors': errors,
+        'calls': len(latencies),
+        'throughput_per_s': len(latencies) / total_seconds if total_seconds else 0.0,
+        'latency_ms': {
+            'mean': float(np.mean(latencies)) if latencies else 0.0,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies) if latencies else 0.0,
+        },
+        'peak_alloc_bytes': peak_alloc,
+        'hits': hits,
+        'misses': misses,
+        'false_positives': false_positives,
+        'true_negatives': true_negatives,
+        'accuracy': (hits + true_negatives) / evaluated if evaluated else 0.0,
+    }
+
+
+def git_commit() -> Optional[str]:
+    """获取当前提交号，便于跨提交对比"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info() -> Dict[str, Any]:
+    """记录运行环境和库版本"""
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__ if cv2 is not None else None,
+        'pyscreeze': getattr(pyscreeze, '__version__', None) if pyscreeze is not None else None,
+        'pyscreeze_grayscale_default': getattr(pyscreeze, 'GRAYSCALE_DEFAULT', None)
+        if pyscreeze is not None else None,
+    }
+#endregion
+
+
+def parse_list(value: str, choices) -> List[str]:
+    """解析逗号分隔的列表参数"""
+    items = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in items if item not in choices]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知选项: {', '.join(unknown)}")
+    return items
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="AutoBot 模板匹配基准测试（无需显示器）")
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        type=lambda v: parse_list(v, RESOLUTIONS), help="分辨率列表")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        type=lambda v: parse_list(v, SCENARIOS), help="场景列表")
+    parser.add_argument('--backends', default=','.join(BACKENDS),
+                        type=lambda v: parse_list(v, BACKENDS), help="定位后端列表")
+    parser.add_argument('--samples', type=int, default=5, help="每个场景生成的用例数")
+    parser.add_argument('--repeats', type=int, default=3, help="每个用例的计时次数")
+    parser.add_argument('--tolerance', type=int, default=4, help="命中判定的像素误差")
+    parser.add_argument('--time-budget', type=float, default=60.0,
+                        help="每个后端在每个分辨率上的时间预算（秒），超出后跳过剩余用例")
+    parser.add_argument('--seed', type=int, default=0, help="随机种子")
+    parser.add_argument('--output', default='bench_locate.json', help="结果 JSON 文件")
+    args = parser.parse_args(argv)
+
+    backends = [name for name in args.backends if BACKENDS[name][0]()]
+    unavailable = [name for name in args.backends if name not in backends]
+    if unavailable:
+        print(f"跳过不可用的后端: {', '.join(unavailable)}")
+    if not backends:
+        print("没有可用的定位后端")
+        return 1
+
+    results = []
+    for resolution in args.resolutions:
+        for scenario in args.scenarios:
+            cases = [make_case(args.seed + i, resolution, scenario) for i in range(args.samples)]
+            for name in backends:
+                stats = run_backend(name, cases, args.repeats, args.tolerance, args.time_budget)
+                stats.update({'backend': name, 'resolution': resolution, 'scenario': scenario})
+                results.append(stats)
+                print(f"{resolution:>6} {scenario:<12} {name:<22} "
+                      f"p50={stats['latency_ms']['p50']:8.2f}ms "
+                      f"p99={stats['latency_ms']['p99']:8.2f}ms "
+                      f"{stats['throughput_per_s']:7.1f}/s "
+                      f"准确率={stats['accuracy']:.2f} "
+                      f"错误={stats['errors']} 跳过={stats['skipped']}")
+
+    report = {
+        'environment': environment_info(),
+        'config': {
+            'resolutions': args.resolutions,
+            'scenarios': {name: SCENARIOS[name] for name in args.scenarios},
+            'backends': backends,
+            'samples': args.samples,
+            'repeats': args.repeats,
+            'tolerance': args.tolerance,
+            'seed': args.seed,
+            'template_size': TEMPLATE_SIZE,
+            'confidence': CONFIDENCE,
+        },
+        'results': results,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板匹配算法
+基于 OpenCV 的归一化相关匹配，配合模板存储中预先计算的灰度金字塔做由粗到精的定位
+"""
+
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+from template_store import Template, to_gray, pyr_down
+
+MIN_COARSE_SIZE = 12  # 粗匹配时模板的最小边长，太小会丢失特征
+COARSE_MARGIN = 0.15  # 粗匹配阈值相对目标置信度的放宽量
+COARSE_CANDIDATES = 5  # 进入精匹配的候选数量
+NMS_OVERLAP = 0.3  # 非极大值抑制时允许的最大重叠比例（交并比）
+
+
+def _require_cv2():
+    if cv2 is None:
+        raise RuntimeError("模板匹配需要安装 opencv-python")
+
+
+def best_match(haystack: np.ndarray, needle: np.ndarray) -> Tuple[int, int, float]:
+    """返回最佳匹配的左上角坐标和置信度"""
+    _require_cv2()
+    scores = cv2.matchTemplate(haystack, needle, cv2.TM_CCOEFF_NORMED)
+    _, score, _, (x, y) = cv2.minMaxLoc(scores)
+    return x, y, float(score)
+
+
+def top_candidates(scores: np.ndarray, threshold: float, count: int,
+                   radius: Tuple[int, int]) -> List[Tuple[int, int, float]]:
+    """依次取得分最高的位置，并屏蔽其邻域，得到互不重叠的候选"""
+    scores = scores.copy()
+    rx, ry = radius
+    candidates = []
+    for _ in range(count):
+        _, score, _, (x, y) = cv2.minMaxLoc(scores)
+        if score < threshold:
+            break
+        candidates.append((x, y, float(score)))
+        scores[max(0, y - ry):y + ry + 1, max(0, x - rx):x + rx + 1] = -1
+    return candidates
+
+
+def choose_level(template: Template) -> int:
+    """选择粗匹配使用的金字塔层：模板缩小后仍保留足够特征的最深一层"""
+    level = 0
+    for i, layer in enumerate(template.pyramid):
+        if min(layer.shape[:2]) >= MIN_COARSE_SIZE:
+            level = i
+    return level
+
+
+def locate_pyramid(screen_gray: np.ndarray, template: Template,
+                   confidence: float = 0.9) -> Optional[Tuple[int, int, float]]:
+    """由粗到精定位模板，返回中心坐标和置信度；找不到返回 None"""
+    _require_cv2()
+    level = choose_level(template)
+    tw, th = template.size
+    if level == 0:
+        x, y, score = best_match(screen_gray, template.gray)
+        return (x + tw // 2, y + th // 2, score) if score >= confidence else None
+
+    # 在缩小的屏幕上找出候选位置
+    coarse = screen_gray
+    for _ in range(level):
+        coarse = pyr_down(coarse)
+    needle = template.pyramid[level]
+    scores = cv2.matchTemplate(coarse, needle, cv2.TM_CCOEFF_NORMED)
+    candidates = top_candidates(scores, confidence - COARSE_MARGIN, COARSE_CANDIDATES,
+                                (needle.shape[1] // 2, needle.shape[0] // 2))
+
+    # 在原尺寸上只匹配候选附近的小区域
+    scale = 2 ** level
+    pad = scale * 2
+    sh, sw = screen_gray.shape[:2]
+    best = None
+    for cx, cy, _ in candidates:
+        x0, y0 = max(0, cx * scale - pad), max(0, cy * scale - pad)
+        x1, y1 = min(sw, cx * scale + tw + pad), min(sh, cy * scale + th + pad)
+        if x1 - x0 < tw or y1 - y0 < th:
+            continue
+        x, y, score = best_match(screen_gray[y0:y1, x0:x1], template.gray)
+        if best is None or score > best[2]:
+            best = (x0 + x + tw // 2, y0 + y + th // 2, score)
+    if best is None or best[2] < confidence:
+        return None
+    return best
+
+
+def non_max_suppression(boxes: np.ndarray, scores: np.ndarray,
+                        overlap: float = NMS_OVERLAP) -> List[int]:
+    """贪心非极大值抑制：按得分从高到低保留与已保留框交并比不超过 overlap 的框，返回保留的下标
+
+    boxes 为 (N, 4) 的 left, top, width, height 数组，只依赖 NumPy
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    area = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        iw = np.clip(np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest]), 0, None)
+        ih = np.clip(np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest]), 0, None)
+        inter = iw * ih
+        union = area[i] + area[rest] - inter
+        order = rest[inter <= overlap * np.maximum(union, 1e-9)]
+    return keep
+
+
+def reading_order(matches: List[Tuple], row_tolerance: int) -> List[Tuple]:
+    """按阅读顺序排序：纵坐标相差不超过 row_tolerance 视为同一行，行内从左到右"""
+    rows: List[List[Tuple]] = []
+    for match in sorted(matches, key=lambda m: m[1]):
+        if rows and match[1] - rows[-1][0][1] <= row_tolerance:
+            rows[-1].append(match)
+        else:
+            rows.append([match])
+    return [match for row in rows for match in sorted(row, key=lambda m: m[0])]
+
+
+def locate_all(screen: np.ndarray, needle: np.ndarray, confidence: float = 0.9,
+               overlap: float = NMS_OVERLAP) -> List[Tuple[int, int, float]]:
+    """在整幅截图上一次匹配出模板的所有位置，返回按阅读顺序排列的 (中心x, 中心y, 置信度)"""
+    _require_cv2()
+    screen, needle = to_gray(screen), to_gray(needle)
+    scores = cv2.matchTemplate(screen, needle, cv2.TM_CCOEFF_NORMED)
+    # 先取 3x3 邻域内的局部极大值，NMS 只需处理少量峰值
+    peaks = (scores >= confidence) & (scores >= cv2.dilate(scores, np.ones((3, 3), np.uint8)))
+    ys, xs = np.nonzero(peaks)
+    if not len(xs):
+        return []
+    th, tw = needle.shape[:2]
+    boxes = np.column_stack([xs, ys, np.full_like(xs, tw), np.full_like(ys, th)])
+    keep = non_max_suppression(boxes, scores[ys, xs], overlap)
+    matches = [(int(xs[i]) + tw // 2, int(ys[i]) + th // 2, float(scores[ys[i], xs[i]]))
+               for i in keep]
+    return reading_order(matches, th // 2)
+
+
+def screen_to_bgr(screenshot) -> np.ndarray:
+    """把截图（PIL 图像或 RGB 数组）转换为 BGR 数组"""
+    if hasattr(screenshot, 'convert'):
+        screenshot = screenshot.convert('RGB')
+    array = np.asarray(screenshot)
+    if array.ndim == 2:
+        return array
+    return np.ascontiguousarray(array[:, :, ::-1])
+
+
+def screen_to_gray(screenshot) -> np.ndarray:
+    """把截图（PIL 图像或 RGB 数组）转换为灰度数组"""
+    if hasattr(screenshot, 'convert'):
+        return np.asarray(screenshot.convert('L'))
+    array = np.asarray(screenshot)
+    if array.ndim == 2:
+        return array
+    return to_gray(np.ascontiguousarray(array[:, :, ::-1]))
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标
+AutoBot 和执行器在进程内的计数器与直方图（截屏耗时、匹配耗时、每次点击的尝试次数、
+等待超时量、节点耗时和出错次数、运行次数），可通过本地 HTTP 端点以 Prometheus 文本格式暴露，
+也可定期写入快照文件（.prom 为 Prometheus 文本格式，供 node_exporter 的 textfile 收集器读取；
+其他扩展名为 JSON）。多进程运行时，子进程随结果回传快照，由父进程合并后统一暴露。
+"""
+
+import os
+import abc
+import json
+import time
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any, Tuple, Callable, Iterable, Optional
+
+MS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+ATTEMPT_BUCKETS = (1, 2, 3, 5, 8, 13, 21)
+SECONDS_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+SNAPSHOT_INTERVAL = 60.0  # 快照文件默认写入间隔（秒）
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+#region 指标
+class _CounterChild:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self.lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric(abc.ABC):
+    """带标签的指标，labels(...) 返回对应标签值的子指标"""
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """创建一组标签值对应的子指标"""
+
+    def labels(self, *values):
+        child = self._children.get(values)  # 标签值通常是字符串，直接命中
+        if child is None:
+            key = tuple(str(v) for v in values)
+            if len(key) != len(self.label_names):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.label_names}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _samples(self) -> List[Dict[str, Any]]:
+        """各子指标的当前值"""
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'type': self.kind, 'help': self.help, 'samples': self._samples()}
+
+    def _label_dict(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        return [{'labels': self._label_dict(key), 'value': child.value}
+                for key, child in list(self._children.items())]
+
+
+class Histogram(Metric):
+    """固定分桶的直方图"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = MS_BUCKETS,
+                 labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        samples = []
+        for key, child in list(self._children.items()):
+            with child.lock:
+                counts, total = list(child.counts), child.sum
+            samples.append({'labels': self._label_dict(key), 'buckets': list(self.buckets),
+                            'counts': counts, 'sum': total})
+        return samples
+#endregion
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+                    raise ValueError(f"指标 {metric.name} 已以不同的类型或标签注册")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, buckets: Iterable[float] = MS_BUCKETS,
+                  labels: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets, labels))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前所有指标的快照（可 JSON 序列化，可跨进程传递）"""
+        now = time.time()
+        return {'time': now, 'uptime_seconds': now - self.started,
+                'metrics': {name: metric.snapshot() for name, metric in list(self._metrics.items())}}
+
+    def render(self) -> str:
+        return render_snapshot(self.snapshot())
+
+
+# 进程内默认注册表，AutoBot 和执行器的指标都注册在这里
+REGISTRY = MetricsRegistry()
+
+
+#region 快照合并与输出
+def merge_snapshots(snapshots: Iterable[Optional[Dict[str, Any]]]) -> Dict[str, Any]:
+    """合并多个进程的快照：同名同标签的计数器相加，直方图逐桶相加"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    uptime = 0.0
+    for snapshot in snapshots:
+        if not snapshot:
+            continue
+        uptime = max(uptime, snapshot.get('uptime_seconds', 0.0))
+        for name, metric in snapshot['metrics'].items():
+            target = merged.setdefault(name, {'type': metric['type'], 'help': metric['help'],
+                                              'samples': []})
+            index = {tuple(sorted(s['labels'].items())): s for s in target['samples']}
+            for sample in metric['samples']:
+                key = tuple(sorted(sample['labels'].items()))
+                existing = index.get(key)
+                if existing is None:
+                    sample = json.loads(json.dumps(sample))
+                    target['samples'].append(sample)
+                    index[key] = sample
+                elif metric['type'] == 'counter':
+                    existing['value'] += sample['value']
+                elif existing['buckets'] == sample['buckets']:
+                    existing['counts'] = [a + b for a, b in zip(existing['counts'], sample['counts'])]
+                    existing['sum'] += sample['sum']
+    return {'time': time.time(), 'uptime_seconds': uptime, 'metrics': merged}
+
+
+def _format_labels(labels: Dict[str, str], extra: Tuple[str, str] = None) -> str:
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_snapshot(snapshot: Dict[str, Any]) -> str:
+    """把快照格式化为 Prometheus 文本格式"""
+    lines = []
+    for name, metric in sorted(snapshot['metrics'].items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for sample in metric['samples']:
+            labels = sample['labels']
+            if metric['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(sample['value'])}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(sample['buckets']) + ['+Inf'], sample['counts']):
+                cumulative += count
+                le = bound if bound == '+Inf' else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_snapshot(path: str, snapshot: Dict[str, Any]):
+    """原子写入快照文件：.prom 为 Prometheus 文本格式，其他为 JSON"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        if path.endswith('.prom'):
+            f.write(render_snapshot(snapshot))
+        else:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+#endregion
+
+
+#region 导出
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = render_snapshot(self.server.source()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 抓取请求不写入日志
+
+
+class MetricsExporter:
+    """在后台线程中提供 HTTP 端点和/或定期写入快照文件
+
+    source: 返回快照的函数，默认为进程内注册表；多进程时可传入合并子进程快照的函数
+    """
+
+    def __init__(self, source: Callable[[], Dict[str, Any]] = None, port: int = None,
+                 host: str = '127.0.0.1', snapshot_file: str = None,
+                 interval: float = SNAPSHOT_INTERVAL):
+        self.source = source or REGISTRY.snapshot
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        if port is not None:
+            self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.source = self.source
+            self._threads.append(threading.Thread(target=self.server.serve_forever, daemon=True))
+        if snapshot_file:
+            self._threads.append(threading.Thread(target=self._snapshot_loop, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def address(self) -> Optional[Tuple[str, int]]:
+        return self.server.server_address[:2] if self.server is not None else None
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        if self.snapshot_file:
+            write_snapshot(self.snapshot_file, self.source())
+
+    def stop(self):
+        """停止导出，并写入最后一次快照"""
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self.write_snapshot()
+
+
+def add_metrics_arguments(parser):
+    """为命令行程序增加指标参数"""
+    group = parser.add_argument_group("运行指标")
+    group.add_argument('--metrics-port', type=int, help="在该端口提供 Prometheus 指标（/metrics）")
+    group.add_argument('--metrics-host', default='127.0.0.1', help="指标端点监听地址")
+    group.add_argument('--metrics-file', help="定期把指标快照写入该文件（.prom 或 .json）")
+    group.add_argument('--metrics-interval', type=float, default=SNAPSHOT_INTERVAL,
+                       help="快照写入间隔（秒）")
+
+
+def exporter_from_args(args, source: Callable[[], Dict[str, Any]] = None) -> Optional[MetricsExporter]:
+    """按 add_metrics_arguments 增加的参数启动导出，未指定端口和文件时返回 None"""
+    if args.metrics_port is None and not args.metrics_file:
+        return None
+    exporter = MetricsExporter(source, args.metrics_port, args.metrics_host,
+                               args.metrics_file, args.metrics_interval)
+    if exporter.address:
+        host, port = exporter.address
+        print(f"指标端点: http://{host}:{port}/metrics")
+    return exporter
+#endregion
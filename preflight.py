@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作流预检
+在运行前检查环路、不可达节点、不配对的循环、无效热键、缺失的模板图像和子工作流，
+并在后台线程中预先解码模板，避免运行时第一次点击承担解码延迟
+"""
+
+import os
+import sys
+import string
+import argparse
+import threading
+from typing import Dict, List, Optional, Iterable
+
+from workflow_model import Node, Connection, load_workflow_file, connection_pairs
+from workflow_executor import (split_hotkey, parse_color, parse_points, parse_region,
+                               parse_bindings, resolve_workflow_path, LOOP_TYPES, MATCH_ACTIONS,
+                               CLICK_TYPES, PROBE_TYPES, ON_FAIL_ACTIONS, MAX_SUBFLOW_DEPTH)
+
+ERROR = 'error'
+WARNING = 'warning'
+
+IMAGE_NODE_TYPES = CLICK_TYPES + ('for_each_match',)
+DEFAULT_IMAGE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images')
+
+# pyautogui 支持的按键名（与 pyautogui.KEYBOARD_KEYS 一致，预检时不需要显示器）
+KEY_NAMES = set(string.ascii_lowercase + string.digits + string.punctuation + ' \t\n\r') | {
+    'accept', 'add', 'alt', 'altleft', 'altright', 'apps', 'backspace',
+    'browserback', 'browserfavorites', 'browserforward', 'browserhome',
+    'browserrefresh', 'browsersearch', 'browserstop', 'capslock', 'clear',
+    'convert', 'ctrl', 'ctrlleft', 'ctrlright', 'decimal', 'del', 'delete',
+    'divide', 'down', 'end', 'enter', 'esc', 'escape', 'execute', 'final', 'fn',
+    'hanguel', 'hangul', 'hanja', 'help', 'home', 'insert', 'junja', 'kana',
+    'kanji', 'launchapp1', 'launchapp2', 'launchmail', 'launchmediaselect',
+    'left', 'modechange', 'multiply', 'nexttrack', 'nonconvert', 'numlock',
+    'pagedown', 'pageup', 'pause', 'pgdn', 'pgup', 'playpause', 'prevtrack',
+    'print', 'printscreen', 'prntscrn', 'prtsc', 'prtscr', 'return', 'right',
+    'scrolllock', 'select', 'separator', 'shift', 'shiftleft', 'shiftright',
+    'sleep', 'space', 'stop', 'subtract', 'tab', 'up', 'volumedown',
+    'volumemute', 'volumeup', 'win', 'winleft', 'winright', 'yen', 'command',
+    'option', 'optionleft', 'optionright',
+} | {f'f{i}' for i in range(1, 25)} | {f'num{i}' for i in range(10)}
+
+
+class Issue:
+    """一条预检问题"""
+    def __init__(self, level: str, message: str, node_id: str = None):
+        self.level = level
+        self.message = message
+        self.node_id = node_id
+
+    def __str__(self):
+        prefix = '错误' if self.level == ERROR else '警告'
+        where = f" [{self.node_id}]" if self.node_id else ''
+        return f"{prefix}{where}: {self.message}"
+
+
+#region 图结构检查
+def build_successors(nodes: Dict[str, Node], connections: List[Connection]) -> Dict[str, List[str]]:
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    for from_node, to_node in connection_pairs(connections):
+        if from_node in nodes and to_node in nodes:
+            successors[from_node].append(to_node)
+    return successors
+
+
+def find_cycles(successors: Dict[str, List[str]]) -> List[List[str]]:
+    """深度优先搜索查找环路（非递归，适用于很长的链），每条回边对应一个环"""
+    WHITE, GREY, BLACK = 0, 1, 2
+    color = {node_id: WHITE for node_id in successors}
+    cycles = []
+    for root in successors:
+        if color[root] != WHITE:
+            continue
+        color[root] = GREY
+        path = [root]
+        stack = [iter(successors[root])]
+        while stack:
+            next_id = next(stack[-1], None)
+            if next_id is None:
+                color[path.pop()] = BLACK
+                stack.pop()
+            elif color[next_id] == GREY:
+                cycles.append(path[path.index(next_id):] + [next_id])
+            elif color[next_id] == WHITE:
+                color[next_id] = GREY
+                path.append(next_id)
+                stack.append(iter(successors[next_id]))
+    return cycles
+
+
+def reachable_from(successors: Dict[str, List[str]], starts: Iterable[str]) -> set:
+    """从起始节点出发可达的所有节点"""
+    seen = set(starts)
+    stack = list(seen)
+    while stack:
+        for next_id in successors[stack.pop()]:
+            if next_id not in seen:
+                seen.add(next_id)
+                stack.append(next_id)
+    return seen
+
+
+def check_graph(nodes: Dict[str, Node], successors: Dict[str, List[str]]) -> List[Issue]:
+    """检查环路、起始节点、不可达节点以及循环节点配对"""
+    issues = []
+    for cycle in find_cycles(successors):
+        issues.append(Issue(ERROR, f"存在环路: {' -> '.join(cycle)}", cycle[0]))
+
+    has_input = {to for targets in successors.values() for to in targets}
+    starts = [node_id for node_id in nodes if node_id not in has_input]
+    if nodes and not starts:
+        issues.append(Issue(ERROR, "没有找到起始节点（所有节点都有输入连接）"))
+    reachable = reachable_from(successors, starts)
+    for node_id in nodes:
+        if node_id not in reachable:
+            issues.append(Issue(WARNING, "节点从起始节点不可达，不会被执行", node_id))
+
+    # 每个循环节点必须能到达 loop_end，每个 loop_end 应属于某个循环
+    matched_ends = set()
+    for node_id, node in nodes.items():
+        if node.type not in LOOP_TYPES:
+            continue
+        ends = [end_id for end_id in reachable_from(successors, successors[node_id])
+                if nodes[end_id].type == 'loop_end']
+        if not ends:
+            name = node.params.get('loop_name', '循环1' if node.type == 'for_loop' else '匹配循环')
+            issues.append(Issue(ERROR, f"循环 {name} 没有对应的循环结束节点", node_id))
+        matched_ends.update(ends)
+    for node_id, node in nodes.items():
+        if node.type == 'loop_end' and node_id not in matched_ends:
+            issues.append(Issue(WARNING, "循环结束节点之前没有循环开始节点", node_id))
+    return issues
+#endregion
+
+
+#region 参数检查
+def check_params(nodes: Dict[str, Node]) -> List[Issue]:
+    """检查节点参数：热键的按键名、for_each_match 的动作、条件节点的颜色和坐标、on_fail 取值"""
+    issues = []
+    for node_id, node in nodes.items():
+        if node.type in CLICK_TYPES + PROBE_TYPES:
+            on_fail = node.params.get('on_fail', 'continue' if node.type in CLICK_TYPES else 'stop')
+            if on_fail not in ON_FAIL_ACTIONS:
+                issues.append(Issue(ERROR, f"on_fail 应为 {'/'.join(ON_FAIL_ACTIONS)}，而不是 {on_fail}",
+                                    node_id))
+        if node.type == 'for_each_match':
+            action = node.params.get('action', 'click_left')
+            if action not in MATCH_ACTIONS:
+                issues.append(Issue(ERROR, f"未知的动作 {action}", node_id))
+        if node.type in PROBE_TYPES:
+            issues += check_probe(node)
+        if node.type == 'subflow':
+            try:
+                parse_bindings(node.params.get('bindings', ''))
+            except ValueError as e:
+                issues.append(Issue(ERROR, str(e), node_id))
+        if node.type != 'hotkey':
+            continue
+        keys = node.params.get('keys', 'ctrl+c')
+        if '${' in keys:
+            continue
+        for key in split_hotkey(keys):
+            name = key.lower() if len(key) > 1 else key
+            if name not in KEY_NAMES:
+                issues.append(Issue(ERROR, f"无效的按键名 '{key}'（热键 {keys}）", node_id))
+    return issues
+
+
+def check_probe(node: Node) -> List[Issue]:
+    """检查像素/颜色条件节点的参数"""
+    params = dict(node.params)
+    if any(isinstance(v, str) and '${' in v for v in params.values()):
+        return []
+    try:
+        parse_color(params.get('color', '#4CAF50'))
+        if node.type == 'pixel_check':
+            parse_points(params.get('points', '100,100'))
+        else:
+            parse_region(params.get('region', '100,100,20,20'))
+    except (ValueError, TypeError) as e:
+        return [Issue(ERROR, str(e), node.id)]
+    return []
+
+
+def template_images(nodes: Dict[str, Node]) -> Dict[str, List[str]]:
+    """收集工作流引用的模板图像，返回 图像 -> 引用它的节点"""
+    images: Dict[str, List[str]] = {}
+    for node_id, node in nodes.items():
+        if node.type in IMAGE_NODE_TYPES:
+            img = node.params.get('img', 'target.png')
+            if '${' not in img:
+                images.setdefault(img, []).append(node_id)
+    return images
+
+
+def resolve_image(img: str, image_root: str, store=None) -> Optional[str]:
+    """按 AutoBot 的查找顺序解析模板路径，找不到返回 None"""
+    if store is not None:
+        try:
+            return store.resolve(img)
+        except FileNotFoundError:
+            return None
+    candidates = [img] if os.path.isabs(img) else [os.path.join(image_root, img), os.path.abspath(img)]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def check_images(nodes: Dict[str, Node], image_root: str, store=None) -> List[Issue]:
+    """检查引用的模板图像是否存在"""
+    issues = []
+    for img, node_ids in template_images(nodes).items():
+        if resolve_image(img, image_root, store) is None:
+            for node_id in node_ids:
+                issues.append(Issue(ERROR, f"找不到模板图像 {img}", node_id))
+    return issues
+#endregion
+
+
+#region 子工作流检查
+def check_subflows(nodes: Dict[str, Node], workflow_file: str = None, image_root: str = DEFAULT_IMAGE_ROOT,
+                   store=None, stack: tuple = (), checked: set = None) -> List[Issue]:
+    """检查子工作流文件能否加载、是否循环引用，并递归预检被引用的工作流（每个文件只检查一次）
+
+    子工作流中的问题记在引用它的节点上，消息前注明文件和子节点 id
+    """
+    issues = []
+    checked = set() if checked is None else checked
+    stack = stack or ((os.path.abspath(workflow_file),) if workflow_file else ())
+    for node_id, node in nodes.items():
+        if node.type != 'subflow':
+            continue
+        workflow = node.params.get('workflow', '')
+        if '${' in workflow:
+            continue
+        try:
+            path = resolve_workflow_path(workflow, workflow_file)
+        except ValueError as e:
+            issues.append(Issue(ERROR, str(e), node_id))
+            continue
+        name = os.path.basename(path)
+        if path in stack:
+            chain = ' -> '.join(os.path.basename(p) for p in stack + (path,))
+            issues.append(Issue(ERROR, f"子工作流循环引用: {chain}", node_id))
+            continue
+        if len(stack) >= MAX_SUBFLOW_DEPTH:
+            issues.append(Issue(ERROR, f"子工作流嵌套超过 {MAX_SUBFLOW_DEPTH} 层", node_id))
+            continue
+        if path in checked:
+            continue
+        checked.add(path)
+        try:
+            child_nodes, child_connections = load_workflow_file(path)
+        except FileNotFoundError:
+            issues.append(Issue(ERROR, f"找不到子工作流 {workflow}", node_id))
+            continue
+        except (ValueError, KeyError, TypeError) as e:
+            issues.append(Issue(ERROR, f"无法加载子工作流 {workflow}: {e}", node_id))
+            continue
+        child_issues = check_graph(child_nodes, build_successors(child_nodes, child_connections))
+        child_issues += check_params(child_nodes)
+        child_issues += check_images(child_nodes, image_root, store)
+        child_issues += check_subflows(child_nodes, path, image_root, store, stack + (path,), checked)
+        for issue in child_issues:
+            where = f"[{issue.node_id}] " if issue.node_id else ''
+            issues.append(Issue(issue.level, f"子工作流 {name} {where}{issue.message}", node_id))
+    return issues
+#endregion
+
+
+def check_workflow(nodes: Dict[str, Node], connections: List[Connection],
+                   image_root: str = DEFAULT_IMAGE_ROOT, store=None,
+                   workflow_file: str = None) -> List[Issue]:
+    """对工作流做全部预检，错误在前、警告在后；workflow_file 用于解析子工作流的相对路径"""
+    successors = build_successors(nodes, connections)
+    issues = check_graph(nodes, successors)
+    issues += check_params(nodes)
+    issues += check_images(nodes, image_root, store)
+    issues += check_subflows(nodes, workflow_file, image_root, store)
+    issues.sort(key=lambda issue: issue.level != ERROR)
+    return issues
+
+
+def format_issues(issues: List[Issue], limit: int = 20) -> str:
+    """格式化预检结果，超过 limit 条时省略"""
+    lines = [str(issue) for issue in issues[:limit]]
+    if len(issues) > limit:
+        lines.append(f"……另有 {len(issues) - limit} 条")
+    return '\n'.join(lines)
+
+
+class TemplatePrefetcher(threading.Thread):
+    """后台预取模板：导入存储并读入内存映射页"""
+    def __init__(self, store, images: Iterable[str]):
+        super().__init__(daemon=True)
+        self.store = store
+        self.images = list(images)
+        self.loaded = 0
+        self.failed: Dict[str, str] = {}
+
+    def run(self):
+        for img in self.images:
+            try:
+                template = self.store.get(img)
+                # 访问一遍数组，让内存映射的页面进入页缓存
+                for array in [template.color] + list(template.pyramid):
+                    array.max()
+                self.loaded += 1
+            except Exception as e:
+                self.failed[img] = str(e)
+
+
+def prefetch_templates(store, nodes: Dict[str, Node]) -> Optional[TemplatePrefetcher]:
+    """启动后台线程预取工作流引用的模板，没有模板存储时返回 None"""
+    if store is None:
+        return None
+    prefetcher = TemplatePrefetcher(store, template_images(nodes))
+    prefetcher.start()
+    return prefetcher
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="运行前检查工作流")
+    parser.add_argument('workflows', nargs='+', help="工作流 JSON 文件")
+    parser.add_argument('--image-root', default=DEFAULT_IMAGE_ROOT, help="模板图像根目录")
+    parser.add_argument('--prefetch', action='store_true', help="检查后预先导入模板到模板存储")
+    args = parser.parse_args(argv)
+
+    store = None
+    if args.prefetch:
+        from template_store import TemplateStore
+        store = TemplateStore(args.image_root)
+
+    failed = False
+    for workflow in args.workflows:
+        nodes, connections = load_workflow_file(workflow)
+        issues = check_workflow(nodes, connections, args.image_root, store, workflow)
+        errors = sum(1 for issue in issues if issue.level == ERROR)
+        print(f"{workflow}: {errors} 个错误，{len(issues) - errors} 个警告")
+        if issues:
+            print(format_issues(issues, limit=len(issues)))
+        failed = failed or errors > 0
+        prefetcher = prefetch_templates(store, nodes)
+        if prefetcher is not None:
+            prefetcher.join()
+            print(f"已预取 {prefetcher.loaded} 个模板")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
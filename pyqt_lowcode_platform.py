@@ -5,47 +5,33 @@ AutoBot极简低代码平台 - PyQt版本
 基于PyQt5实现的可视化工作流编辑器
 """
 
+import os
 import sys
-import json
+import copy
 import math
-from typing import Dict, List, Any, Tuple
+import html
+import logging
+from typing import Dict, List, Any
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QScrollArea, QPushButton, QLabel, QFrame, QDialog, QFormLayout,
     QLineEdit, QSpinBox, QDoubleSpinBox, QTextEdit, QDialogButtonBox,
-    QMessageBox, QFileDialog, QStatusBar, QSplitter, QCheckBox
+    QMessageBox, QFileDialog, QStatusBar, QSplitter, QCheckBox, QPlainTextEdit
 )
-from PyQt5.QtCore import Qt, QPoint, QRect, pyqtSignal
+from PyQt5.QtCore import Qt, QPoint, QRect, QTimer, QThread, pyqtSignal
 from PyQt5.QtGui import QPainter, QPen, QBrush, QColor, QFont, QPalette
 from Autobot import AutoBot
+from workflow_model import Node, Connection, workflow_to_dict, workflow_from_dict
+from workflow_journal import WorkflowJournal
+from workflow_executor import WorkflowExecutor, BRANCH_WORKERS
+from preflight import check_workflow, format_issues, prefetch_templates, ERROR
+from run_log import ensure_configured, flush as flush_log, set_verbose, TailHandler
 
-class Node:
-    """节点类"""
-    def __init__(self, node_id: str, node_type: str, x: int, y: int):
-        self.id = node_id
-        self.type = node_type
-        self.x = x
-        self.y = y
-        self.width = 120
-        self.height = 60
-        self.params = {}
-        self.selected = False
-        self.hovered = False
-
-    def contains_point(self, x: int, y: int) -> bool:
-        """检查点是否在节点内"""
-        return (self.x <= x <= self.x + self.width and 
-                self.y <= y <= self.y + self.height)
-
-    def get_center(self) -> Tuple[int, int]:
-        """获取节点中心点"""
-        return (self.x + self.width // 2, self.y + self.height // 2)
-
-class Connection:
-    """连接类"""
-    def __init__(self, from_node: str, to_node: str):
-        self.from_node = from_node
-        self.to_node = to_node
+UNTITLED_WORKFLOW = os.path.join(os.path.expanduser('~'), '.autobot', 'untitled.json')  # 未保存工作流的日志位置
+AUTOSAVE_INTERVAL = 30000  # 检查是否需要压缩日志的间隔（毫秒）
+LOG_POLL_INTERVAL = 200  # 日志面板刷新间隔（毫秒）
+LOG_PANEL_LINES = 2000  # 日志面板保留的行数
+LOG_COLORS = {logging.DEBUG: '#95a5a6', logging.WARNING: '#e67e22', logging.ERROR: '#e74c3c'}
 
 class ParameterDialog(QDialog):
     """参数设置对话框"""
@@ -71,15 +57,24 @@ class ParameterDialog(QDialog):
         param_configs = {
             'click_left': [
                 ('img', '目标图片路径', 'str', 'target.png'),
-                ('retry', '重试次数', 'int', 1)
+                ('retry', '重试次数', 'int', 1),
+                ('timeout', '重试时限(秒，0为按次数)', 'float', 0.0),
+                ('on_change', '画面变化时立即重试', 'bool', False),
+                ('on_fail', '找不到时(continue/stop/error)', 'str', 'continue')
             ],
             'double_click': [
                 ('img', '目标图片路径', 'str', 'target.png'),
-                ('retry', '重试次数', 'int', 1)
+                ('retry', '重试次数', 'int', 1),
+                ('timeout', '重试时限(秒，0为按次数)', 'float', 0.0),
+                ('on_change', '画面变化时立即重试', 'bool', False),
+                ('on_fail', '找不到时(continue/stop/error)', 'str', 'continue')
             ],
             'click_right': [
                 ('img', '目标图片路径', 'str', 'target.png'),
-                ('retry', '重试次数', 'int', 1)
+                ('retry', '重试次数', 'int', 1),
+                ('timeout', '重试时限(秒，0为按次数)', 'float', 0.0),
+                ('on_change', '画面变化时立即重试', 'bool', False),
+                ('on_fail', '找不到时(continue/stop/error)', 'str', 'continue')
             ],
             'input_text': [
                 ('text', '输入文本', 'str', 'Hello World'),
@@ -102,6 +97,38 @@ class ParameterDialog(QDialog):
             ],
             'loop_end': [
                 ('end_name', '结束标记名称', 'str', '循环结束')
+            ],
+            'for_each_match': [
+                ('img', '目标图片路径', 'str', 'target.png'),
+                ('confidence', '匹配置信度', 'float', 0.9),
+                ('action', '动作(click_left/double_click/click_right/none)', 'str', 'click_left'),
+                ('loop_name', '循环名称', 'str', '匹配循环')
+            ],
+            'pixel_check': [
+                ('points', '像素坐标(x,y;x,y)', 'str', '100,100'),
+                ('color', '颜色(#RRGGBB)', 'str', '#4CAF50'),
+                ('tolerance', '颜色容差', 'int', 10),
+                ('expect', '期望匹配(取消则等待颜色消失)', 'bool', True),
+                ('timeout', '等待超时(秒，0为只检查一次)', 'float', 0.0),
+                ('on_fail', '不满足时(stop/continue/error)', 'str', 'stop')
+            ],
+            'color_region_check': [
+                ('region', '区域(left,top,width,height)', 'str', '100,100,20,20'),
+                ('color', '平均颜色(#RRGGBB)', 'str', '#4CAF50'),
+                ('tolerance', '颜色容差', 'int', 10),
+                ('expect', '期望匹配(取消则等待颜色消失)', 'bool', True),
+                ('timeout', '等待超时(秒，0为只检查一次)', 'float', 0.0),
+                ('on_fail', '不满足时(stop/continue/error)', 'str', 'stop')
+            ],
+            'paste_time': [
+                ('time_format', '时间格式', 'str', '%Y-%m-%d %H:%M:%S')
+            ],
+            'run_command': [
+                ('command', '系统命令', 'str', 'echo hello')
+            ],
+            'subflow': [
+                ('workflow', '子工作流文件(.json)', 'str', 'subflow.json'),
+                ('bindings', '参数绑定(name=value;name=value)', 'str', '')
             ]
         }
         
@@ -161,6 +188,7 @@ class Canvas(QWidget):
     """画布组件"""
     node_double_clicked = pyqtSignal(str)  # 节点双击信号
     connection_mode_exit = pyqtSignal()  # 连接模式退出信号
+    edited = pyqtSignal(dict)  # 编辑操作信号（写入编辑日志）
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -174,6 +202,7 @@ class Canvas(QWidget):
         # 交互状态
         self.dragging_node = None
         self.drag_offset = QPoint(0, 0)
+        self.drag_start = None
         self.connecting_mode = False
         self.delete_mode = False
         self.connection_start = None
@@ -190,6 +219,7 @@ class Canvas(QWidget):
             
         node = Node(node_id, node_type, x, y)
         self.nodes[node_id] = node
+        self.edited.emit({'op': 'add', 'id': node_id, 'type': node_type, 'x': x, 'y': y})
         self.update()
         
     def remove_node(self, node_id: str):
@@ -199,6 +229,7 @@ class Canvas(QWidget):
             # 删除相关连接
             self.connections = [conn for conn in self.connections 
                               if conn.from_node != node_id and conn.to_node != node_id]
+            self.edited.emit({'op': 'del', 'id': node_id})
             self.update()
     
     def add_connection(self, from_node: str, to_node: str):
@@ -209,8 +240,28 @@ class Canvas(QWidget):
                 if conn.from_node == from_node and conn.to_node == to_node:
                     return
             self.connections.append(Connection(from_node, to_node))
+            self.edited.emit({'op': 'conn', 'from': from_node, 'to': to_node})
             self.update()
     
+    def set_node_params(self, node_id: str, params: Dict[str, Any]):
+        """设置节点参数"""
+        self.nodes[node_id].params = params
+        self.edited.emit({'op': 'params', 'id': node_id, 'params': params})
+        self.update()
+    
+    def clear_all(self):
+        """删除所有节点和连接"""
+        self.nodes.clear()
+        self.connections.clear()
+        self.edited.emit({'op': 'clear'})
+        self.update()
+    
+    def set_workflow(self, nodes: Dict[str, Node], connections: List[Connection]):
+        """替换整个工作流（加载时使用，不产生编辑操作）"""
+        self.nodes = nodes
+        self.connections = connections
+        self.update()
+    
     def get_node_at_pos(self, x: int, y: int) -> str:
         """获取指定位置的节点"""
         for node_id, node in self.nodes.items():
@@ -242,7 +293,13 @@ class Canvas(QWidget):
                 'scroll': '#795548',
                 'hotkey': '#E91E63',
                 'for_loop': '#FF5722',
-                'loop_end': '#9E9E9E'
+                'loop_end': '#9E9E9E',
+                'for_each_match': '#009688',
+                'pixel_check': '#3F51B5',
+                'color_region_check': '#673AB7',
+                'subflow': '#00BCD4',
+                'paste_time': '#8BC34A',
+                'run_command': '#455A64'
             }
             
             base_color = QColor(colors.get(node.type, '#757575'))
@@ -328,6 +385,7 @@ class Canvas(QWidget):
                     node = self.nodes[node_id]
                     self.dragging_node = node_id
                     self.drag_offset = QPoint(x - node.x, y - node.y)
+                    self.drag_start = (node.x, node.y)
                     
                     # 设置选中状态
                     for n in self.nodes.values():
@@ -363,6 +421,10 @@ class Canvas(QWidget):
     def mouseReleaseEvent(self, event):
         """鼠标释放事件"""
         if event.button() == Qt.LeftButton:
+            if self.dragging_node and self.dragging_node in self.nodes:
+                node = self.nodes[self.dragging_node]
+                if (node.x, node.y) != self.drag_start:
+                    self.edited.emit({'op': 'move', 'id': node.id, 'x': node.x, 'y': node.y})
             self.dragging_node = None
     
     def mouseDoubleClickEvent(self, event):
@@ -373,14 +435,46 @@ class Canvas(QWidget):
             if node_id:
                 self.node_double_clicked.emit(node_id)
 
+class WorkflowRunner(QThread):
+    """在后台线程中执行工作流，界面线程照常刷新日志面板"""
+    node_failed = pyqtSignal(object, object)  # 节点出错信号（阻塞连接，用户关闭错误提示后才继续执行）
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.executor = None
+        self.start_nodes = []
+        self.prefetcher = None
+    
+    def run(self):
+        # 在执行线程中等待模板预取完成（不阻塞界面），第一次点击无需再解码
+        if self.prefetcher is not None:
+            self.prefetcher.join()
+        self.executor.run(self.start_nodes)
+
 class PyQtLowCodePlatform(QMainWindow):
     """PyQt低代码平台主窗口"""
     
     def __init__(self):
         super().__init__()
         self.node_counter = 0
+        # 日志面板与控制台、日志文件共用同一个日志队列
+        self.log_tail = TailHandler()
+        ensure_configured().add_handler(self.log_tail)
         self.autobot = AutoBot()
+        self.prefetcher = None
+        self.journal = None
+        self.runner = None
         self.setup_ui()
+        self.open_untitled()
+        
+        # 定期把过长的编辑日志压缩为快照
+        self.autosave_timer = QTimer(self)
+        self.autosave_timer.timeout.connect(self.autosave)
+        self.autosave_timer.start(AUTOSAVE_INTERVAL)
+        
+        self.log_timer = QTimer(self)
+        self.log_timer.timeout.connect(self.show_log)
+        self.log_timer.start(LOG_POLL_INTERVAL)
         
     def setup_ui(self):
         """设置用户界面"""
@@ -447,7 +541,13 @@ class PyQtLowCodePlatform(QMainWindow):
             ('scroll', '滚动', '#795548'),
             ('hotkey', '热键', '#E91E63'),
             ('for_loop', 'For循环', '#FF5722'),
-            ('loop_end', '循环结束', '#9E9E9E')
+            ('loop_end', '循环结束', '#9E9E9E'),
+            ('for_each_match', '逐个匹配', '#009688'),
+            ('pixel_check', '像素检查', '#3F51B5'),
+            ('color_region_check', '区域颜色检查', '#673AB7'),
+            ('subflow', '子工作流', '#00BCD4'),
+            ('paste_time', '粘贴时间', '#8BC34A'),
+            ('run_command', '执行命令', '#455A64')
         ]
         
         for func_name, display_name, color in functions:
@@ -487,8 +587,8 @@ class PyQtLowCodePlatform(QMainWindow):
         self.delete_btn.setCheckable(True)
         self.delete_btn.clicked.connect(self.toggle_delete_mode)
         
-        run_btn = QPushButton("运行工作流")
-        run_btn.clicked.connect(self.run_workflow)
+        self.run_btn = QPushButton("运行工作流")
+        self.run_btn.clicked.connect(self.run_workflow)
         
         save_btn = QPushButton("保存工作流")
         save_btn.clicked.connect(self.save_workflow)
@@ -499,7 +599,7 @@ class PyQtLowCodePlatform(QMainWindow):
         clear_btn = QPushButton("清空画布")
         clear_btn.clicked.connect(self.clear_canvas)
         
-        for btn in [self.connect_btn, self.delete_btn, run_btn, save_btn, load_btn, clear_btn]:
+        for btn in [self.connect_btn, self.delete_btn, self.run_btn, save_btn, load_btn, clear_btn]:
             btn.setStyleSheet("""
                 QPushButton {
                     background-color: #34495e;
@@ -532,9 +632,40 @@ class PyQtLowCodePlatform(QMainWindow):
         self.canvas = Canvas()
         self.canvas.node_double_clicked.connect(self.edit_node_parameters)
         self.canvas.connection_mode_exit.connect(self.on_connection_mode_exit)
+        self.canvas.edited.connect(self.record_edit)
         
         scroll_area.setWidget(self.canvas)
-        parent.addWidget(scroll_area)
+        
+        # 画布下方为运行日志面板
+        vertical = QSplitter(Qt.Vertical)
+        vertical.addWidget(scroll_area)
+        vertical.addWidget(self.setup_log_panel())
+        vertical.setSizes([600, 200])
+        parent.addWidget(vertical)
+    
+    def setup_log_panel(self) -> QWidget:
+        """设置运行日志面板"""
+        panel = QWidget()
+        layout = QVBoxLayout(panel)
+        layout.setContentsMargins(0, 0, 0, 0)
+        
+        header = QHBoxLayout()
+        header.addWidget(QLabel("运行日志"))
+        header.addStretch()
+        verbose_box = QCheckBox("详细")
+        verbose_box.toggled.connect(set_verbose)
+        header.addWidget(verbose_box)
+        clear_btn = QPushButton("清空")
+        header.addWidget(clear_btn)
+        layout.addLayout(header)
+        
+        self.log_view = QPlainTextEdit()
+        self.log_view.setReadOnly(True)
+        self.log_view.setMaximumBlockCount(LOG_PANEL_LINES)
+        self.log_view.setFont(QFont("Consolas", 9))
+        clear_btn.clicked.connect(self.log_view.clear)
+        layout.addWidget(self.log_view)
+        return panel
     
     def setup_status_bar(self):
         """设置状态栏"""
@@ -568,8 +699,7 @@ class PyQtLowCodePlatform(QMainWindow):
             dialog = ParameterDialog(self, node.type, node.params)
             
             if dialog.exec_() == QDialog.Accepted and dialog.result_params is not None:
-                node.params = dialog.result_params
-                self.canvas.update()
+                self.canvas.set_node_params(node_id, dialog.result_params)
                 QMessageBox.information(self, "成功", f"已保存 {node.type} 的参数配置")
     
     def toggle_connection_mode(self):
@@ -622,15 +752,32 @@ class PyQtLowCodePlatform(QMainWindow):
             QMessageBox.warning(self, "警告", "画布上没有节点")
             return
         
+        # 运行前预检，有错误时由用户决定是否继续
+        issues = self.preflight()
+        errors = [issue for issue in issues if issue.level == ERROR]
+        if errors:
+            reply = QMessageBox.question(
+                self, "预检未通过",
+                f"发现 {len(errors)} 个错误：\n{format_issues(issues)}\n\n是否仍然运行？",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        
         # 立即最小化窗口
         self.showMinimized()
         
+        self.start_prefetch()
+        
         # 找到起始节点（没有输入连接的节点）
-        start_nodes = []
-        for node_id in self.canvas.nodes:
-            has_input = any(conn.to_node == node_id for conn in self.canvas.connections)
-            if not has_input:
-                start_nodes.append(node_id)
+        # 执行期间画布仍可编辑，执行器使用当前画布的副本
+        runner = WorkflowRunner(self)
+        nodes, connections = workflow_from_dict(
+            copy.deepcopy(workflow_to_dict(self.canvas.nodes, self.canvas.connections)))
+        executor = WorkflowExecutor(nodes, connections, self.autobot,
+                                    on_error=runner.node_failed.emit,
+                                    workflow_file=self.workflow_file(),
+                                    branch_workers=BRANCH_WORKERS)
+        start_nodes = executor.find_start_nodes()
         
         if not start_nodes:
             # 恢复窗口显示以显示警告
@@ -638,240 +785,119 @@ class PyQtLowCodePlatform(QMainWindow):
             QMessageBox.warning(self, "警告", "没有找到起始节点")
             return
         
-        # 执行工作流
-        executed = set()
-        for start_node in start_nodes:
-            self.execute_from_node(start_node, executed)
+        # 在后台线程中执行工作流，日志面板由 log_timer 实时刷新
+        runner.executor, runner.start_nodes = executor, start_nodes
+        runner.prefetcher = self.prefetcher
+        runner.node_failed.connect(self.show_execution_error, Qt.BlockingQueuedConnection)
+        runner.finished.connect(self.on_run_finished)
+        self.runner = runner
+        self.run_btn.setEnabled(False)
+        runner.start()
+    
+    def on_run_finished(self):
+        """工作流执行结束"""
+        self.runner = None
+        self.run_btn.setEnabled(True)
+        flush_log()
+        self.show_log()
         
         # 恢复窗口显示以显示完成消息
         self.showNormal()
         QMessageBox.information(self, "完成", "工作流执行完成")
     
-    def execute_from_node(self, node_id: str, executed: set):
-        """从指定节点开始执行"""
-        if node_id in executed or node_id not in self.canvas.nodes:
-            return
-        
-        executed.add(node_id)
-        node = self.canvas.nodes[node_id]
-        
-        # 检查是否为for_loop节点
-        if node.type == 'for_loop':
-            loop_count = node.params.get('loop_count', 3)
-            loop_name = node.params.get('loop_name', '循环1')
-            
-            # 获取循环体的所有节点路径
-            loop_body_paths = self.find_loop_body_paths(node_id)
-            
-            # 执行循环
-            for i in range(loop_count):
-                print(f"执行 {loop_name} 第 {i+1}/{loop_count} 次")
-                # 为每次循环执行完整的循环体路径
-                for path in loop_body_paths:
-                    for path_node in path:
-                        if path_node in self.canvas.nodes:
-                            node_obj = self.canvas.nodes[path_node]
-                            if node_obj.type != 'loop_end':  # 不执行loop_end节点
-                                self.execute_node_operation(node_obj)
-            
-            # 循环执行完毕后，查找loop_end节点并继续执行其后续节点
-            self.execute_after_loop(node_id, executed)
-        else:
-            # 执行普通节点操作
-            self.execute_node_operation(node)
-            
-            # 执行后续节点
-            for conn in self.canvas.connections:
-                if conn.from_node == node_id:
-                    self.execute_from_node(conn.to_node, executed)
-    
-    def find_loop_body_paths(self, loop_node_id: str):
-        """找到循环体的所有执行路径（从for_loop到loop_end之间的节点）"""
-        paths = []
-        
-        # 找到循环节点的直接后续节点作为起始点
-        start_nodes = []
-        for conn in self.canvas.connections:
-            if conn.from_node == loop_node_id:
-                start_nodes.append(conn.to_node)
-        
-        # 为每个起始节点构建执行路径，直到遇到loop_end节点
-        for start_node in start_nodes:
-            current_path = []
-            self.build_execution_path_until_end(start_node, current_path, paths, set())
-        
-        return paths if paths else [[]]  # 如果没有路径，返回空路径列表
-    
-    def build_execution_path_until_end(self, node_id: str, current_path: list, all_paths: list, visited: set):
-        """递归构建执行路径，直到遇到loop_end节点"""
-        if node_id in visited or node_id not in self.canvas.nodes:
-            return
-        
-        visited.add(node_id)
-        current_path.append(node_id)
-        
-        # 检查是否为loop_end节点
-        node = self.canvas.nodes[node_id]
-        if node.type == 'loop_end':
-            # 遇到循环结束节点，当前路径结束
-            all_paths.append(current_path.copy())
-            return
-        
-        # 找到当前节点的后续节点
-        next_nodes = []
-        for conn in self.canvas.connections:
-            if conn.from_node == node_id:
-                next_nodes.append(conn.to_node)
-        
-        if not next_nodes:  # 如果没有后续节点且不是loop_end，当前路径结束
-            all_paths.append(current_path.copy())
-        else:
-            # 继续构建路径
-            for next_node in next_nodes:
-                self.build_execution_path_until_end(next_node, current_path, all_paths, visited.copy())
-        
-        current_path.pop()  # 回溯
-    
-    def execute_after_loop(self, loop_node_id: str, executed: set):
-        """执行循环结束后的节点"""
-        # 查找与此循环相关的loop_end节点
-        loop_end_nodes = self.find_loop_end_nodes(loop_node_id)
-        
-        # 执行loop_end节点之后的节点
-        for loop_end_id in loop_end_nodes:
-            if loop_end_id not in executed:
-                executed.add(loop_end_id)
-                # 执行loop_end节点后续的所有节点
-                for conn in self.canvas.connections:
-                    if conn.from_node == loop_end_id:
-                        self.execute_from_node(conn.to_node, executed)
-    
-    def find_loop_end_nodes(self, loop_node_id: str):
-        """查找与指定循环节点相关的loop_end节点"""
-        loop_end_nodes = []
-        
-        # 从循环节点开始，递归查找所有可达的loop_end节点
-        visited = set()
-        self.search_loop_end_nodes(loop_node_id, loop_end_nodes, visited)
-        
-        return loop_end_nodes
-    
-    def search_loop_end_nodes(self, node_id: str, loop_end_nodes: list, visited: set):
-        """递归搜索loop_end节点"""
-        if node_id in visited or node_id not in self.canvas.nodes:
+    def preflight(self):
+        """预检当前画布上的工作流"""
+        return check_workflow(self.canvas.nodes, self.canvas.connections,
+                              self.autobot.image_root, self.autobot.templates, self.workflow_file())
+    
+    def workflow_file(self):
+        """当前工作流文件，未保存时为 None（子工作流路径相对当前目录解析）"""
+        if self.journal is None or self.journal.filename == os.path.abspath(UNTITLED_WORKFLOW):
+            return None
+        return self.journal.filename
+    
+    def start_prefetch(self):
+        """在后台线程中预取工作流引用的模板（已在预取时不重复启动）"""
+        if self.prefetcher is not None and self.prefetcher.is_alive():
             return
-        
-        visited.add(node_id)
-        node = self.canvas.nodes[node_id]
-        
-        # 如果是loop_end节点，添加到结果中
-        if node.type == 'loop_end':
-            loop_end_nodes.append(node_id)
-            return  # 找到loop_end后停止搜索
-        
-        # 继续搜索后续节点
-        for conn in self.canvas.connections:
-            if conn.from_node == node_id:
-                self.search_loop_end_nodes(conn.to_node, loop_end_nodes, visited)
+        self.prefetcher = prefetch_templates(self.autobot.templates, self.canvas.nodes)
+    
+    def show_execution_error(self, node: Node, error: Exception):
+        """显示节点执行错误"""
+        QMessageBox.critical(self, "执行错误", f"执行节点 {node.type} 时出错：{str(error)}")
+    
+    #region 编辑日志与自动保存
+    def record_edit(self, op: Dict[str, Any]):
+        """把画布的编辑操作追加到日志"""
+        if self.journal is not None:
+            self.journal.append(op)
+    
+    def open_untitled(self):
+        """打开未保存工作流的日志，上次有未保存的编辑时询问是否恢复"""
+        journal = WorkflowJournal(UNTITLED_WORKFLOW)
+        nodes, connections = journal.load()
+        if nodes:
+            reply = QMessageBox.question(self, "恢复编辑", f"发现上次未保存的工作流（{len(nodes)} 个节点），是否恢复？",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.switch_journal(journal, nodes, connections)
+                return
+        self.discard_untitled(journal)
+        self.journal = journal
+    
+    @staticmethod
+    def discard_untitled(journal: WorkflowJournal):
+        """删除未保存工作流的日志和快照"""
+        journal.discard()
+        if os.path.exists(journal.filename):
+            os.remove(journal.filename)
+    
+    def switch_journal(self, journal: WorkflowJournal, nodes: Dict[str, Node], connections: List[Connection]):
+        """切换到另一个工作流文件的日志并显示其内容"""
+        if self.journal is not None and self.journal is not journal:
+            self.journal.close()
+        self.journal = journal
+        self.canvas.set_workflow(nodes, connections)
+        # 更新节点计数器
+        self.node_counter = max([int(node_id.split('_')[1]) for node_id in nodes.keys()], default=0)
+        self.update_status()
     
-    def execute_loop_body(self, node_id: str, executed: set):
-        """执行循环体内的节点"""
-        if node_id in executed or node_id not in self.canvas.nodes:
+    def autosave(self):
+        """日志过长时压缩为快照"""
+        if self.journal is not None and self.journal.needs_compaction:
+            self.journal.compact(self.canvas.nodes, self.canvas.connections)
+    
+    def closeEvent(self, event):
+        """关闭时把已保存工作流的日志合并进文件；未保存的工作流保留日志，下次启动时可恢复"""
+        if self.runner is not None and self.runner.isRunning():
+            QMessageBox.warning(self, "警告", "工作流正在运行，请等待执行完成后再关闭")
+            event.ignore()
             return
-        
-        executed.add(node_id)
-        node = self.canvas.nodes[node_id]
-        
-        # 如果遇到另一个for_loop节点，递归处理
-        if node.type == 'for_loop':
-            self.execute_from_node(node_id, executed)
-        else:
-            # 执行普通节点操作
-            self.execute_node_operation(node)
-            
-            # 执行后续节点
-            for conn in self.canvas.connections:
-                if conn.from_node == node_id:
-                    self.execute_loop_body(conn.to_node, executed)
-    
-    def execute_node_operation(self, node: Node):
-        """执行节点操作"""
-        try:
-            if node.type == 'click_left':
-                img = node.params.get('img', 'target.png')
-                retry = node.params.get('retry', 1)
-                self.autobot.click_left(img, retry)
-            
-            elif node.type == 'double_click':
-                img = node.params.get('img', 'target.png')
-                retry = node.params.get('retry', 1)
-                self.autobot.double_click(img, retry)
-            
-            elif node.type == 'click_right':
-                img = node.params.get('img', 'target.png')
-                retry = node.params.get('retry', 1)
-                self.autobot.click_right(img, retry)
-            
-            elif node.type == 'input_text':
-                text = node.params.get('text', '')
-                clear = node.params.get('clear', False)
-                if text:
-                    self.autobot.input_text(text, clear)
-            
-            elif node.type == 'wait':
-                seconds = node.params.get('seconds', 1.0)
-                self.autobot.wait(seconds)
-            
-            elif node.type == 'scroll':
-                amount = node.params.get('amount', 100)
-                repeat = node.params.get('repeat', 1)
-                self.autobot.scroll(amount, repeat)
-            
-            elif node.type == 'hotkey':
-                keys = node.params.get('keys', 'ctrl+c')
-                repeat = node.params.get('repeat', 1)
-                # 将热键字符串拆分成多个参数
-                key_list = keys.replace('+', ',').split(',')
-                key_list = [key.strip() for key in key_list]  # 去除空格
-                for _ in range(repeat):
-                    self.autobot.hotkey(*key_list)
-            
-            elif node.type == 'for_loop':
-                # for_loop节点不执行具体操作，只是标记循环开始
-                # 实际的循环逻辑在execute_from_node中处理
-                pass
-            
-            elif node.type == 'loop_end':
-                # loop_end节点本身不执行具体操作，仅作为循环结束的标记
-                print(f"循环结束标记: {node.params.get('end_name', '循环结束')}")
-                pass
-                    
-        except Exception as e:
-            QMessageBox.critical(self, "执行错误", f"执行节点 {node.type} 时出错：{str(e)}")
+        if self.journal is not None:
+            if self.journal.ops and self.journal.filename != os.path.abspath(UNTITLED_WORKFLOW):
+                self.journal.compact(self.canvas.nodes, self.canvas.connections)
+            self.journal.close()
+        super().closeEvent(event)
+    #endregion
     
     def save_workflow(self):
-        """保存工作流"""
+        """保存工作流：写入快照并把之后的编辑记录到该文件的日志"""
         filename, _ = QFileDialog.getSaveFileName(self, "保存工作流", "", "JSON Files (*.json)")
         if filename:
             try:
-                workflow_data = {
-                    'nodes': {
-                        node_id: {
-                            'type': node.type,
-                            'x': node.x,
-                            'y': node.y,
-                            'params': node.params
-                        }
-                        for node_id, node in self.canvas.nodes.items()
-                    },
-                    'connections': [
-                        {'from': conn.from_node, 'to': conn.to_node}
-                        for conn in self.canvas.connections
-                    ]
-                }
-                
-                with open(filename, 'w', encoding='utf-8') as f:
-                    json.dump(workflow_data, f, ensure_ascii=False, indent=2)
+                journal = self.journal
+                if journal is None or journal.filename != os.path.abspath(filename):
+                    if journal is not None and journal.filename == os.path.abspath(UNTITLED_WORKFLOW):
+                        self.discard_untitled(journal)
+                    elif journal is not None and journal.ops:
+                        # 另存为：原文件的日志已是其内容的一部分，合并进原文件，不留给下次打开时重放
+                        journal.compact(self.canvas.nodes, self.canvas.connections)
+                    elif journal is not None:
+                        journal.close()
+                    journal = WorkflowJournal(filename)
+                    journal.discard()
+                journal.compact(self.canvas.nodes, self.canvas.connections)
+                self.journal = journal
                 
                 QMessageBox.information(self, "成功", "工作流已保存")
             except Exception as e:
@@ -882,28 +908,20 @@ class PyQtLowCodePlatform(QMainWindow):
         filename, _ = QFileDialog.getOpenFileName(self, "加载工作流", "", "JSON Files (*.json)")
         if filename:
             try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    workflow_data = json.load(f)
-                
-                # 清空当前画布
-                self.clear_canvas()
-                
-                # 加载节点
-                for node_id, node_data in workflow_data.get('nodes', {}).items():
-                    self.canvas.add_node(node_id, node_data['type'], node_data['x'], node_data['y'])
-                    self.canvas.nodes[node_id].params = node_data.get('params', {})
-                
-                # 加载连接
-                for conn_data in workflow_data.get('connections', []):
-                    self.canvas.add_connection(conn_data['from'], conn_data['to'])
+                # 读取快照并重放上次未压缩的编辑日志
+                journal = WorkflowJournal(filename)
+                nodes, connections = journal.load()
+                self.switch_journal(journal, nodes, connections)
                 
-                # 更新节点计数器
-                if self.canvas.nodes:
-                    max_counter = max([int(node_id.split('_')[1]) for node_id in self.canvas.nodes.keys()])
-                    self.node_counter = max_counter
-                
-                self.update_status()
-                QMessageBox.information(self, "成功", "工作流已加载")
+                self.start_prefetch()
+                message = "工作流已加载"
+                if journal.ops:
+                    message += f"，已恢复 {journal.ops} 条未合并的编辑"
+                issues = self.preflight()
+                if issues:
+                    QMessageBox.warning(self, "工作流已加载", f"{message}\n预检发现以下问题：\n{format_issues(issues)}")
+                else:
+                    QMessageBox.information(self, "成功", message)
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"加载失败：{str(e)}")
     
@@ -914,12 +932,23 @@ class PyQtLowCodePlatform(QMainWindow):
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            self.canvas.nodes.clear()
-            self.canvas.connections.clear()
-            self.canvas.update()
+            self.canvas.clear_all()
             self.node_counter = 0
             self.update_status()
     
+    def show_log(self):
+        """把日志队列写出的新事件追加到日志面板"""
+        for record in self.log_tail.drain():
+            when = logging.Formatter().formatTime(record, '%H:%M:%S')
+            node = f" [{record.node}]" if getattr(record, 'node', None) else ''
+            elapsed = f" ({record.elapsed}s)" if getattr(record, 'elapsed', None) is not None else ''
+            line = f"{when}{node} {record.getMessage()}{elapsed}"
+            color = LOG_COLORS.get(record.levelno)
+            if color:
+                self.log_view.appendHtml(f'<span style="color:{color}">{html.escape(line)}</span>')
+            else:
+                self.log_view.appendPlainText(line)
+    
     def update_status(self):
         """更新状态栏"""
         node_count = len(self.canvas.nodes)
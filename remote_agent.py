@@ -0,0 +1,750 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+远程执行代理
+代理进程持有 AutoBot 和执行器，通过 TCP 或 Unix 套接字接收工作流并执行，实时回传事件和结果；
+协调器把任务分发给多台机器上的代理。工作流、子工作流和模板按内容哈希打包，
+代理已有的文件不再重复发送。同一模块提供代理和协调器的命令行：
+
+    python remote_agent.py serve --listen 0.0.0.0:7700 --token 口令
+    python remote_agent.py run a.json b.json --agent host1:7700 --agent host2:7700 --token 口令
+    python remote_agent.py run a.json --local 2 --sim manifest.json   # 本机模拟屏幕上的代理
+
+代理会执行收到的任何工作流（包括执行命令节点），监听非本机地址时必须设置口令（否则需显式 --insecure）。
+口令和数据都以明文传输，跨网络时请通过 SSH 隧道或 TLS 隧道连接。
+
+协议：每帧为 8 字节帧头（JSON 头长度、负载长度，均为网络字节序的无符号 32 位整数），
+之后是 UTF-8 JSON 头和原始字节负载。请求和响应的 JSON 头用 op 区分：
+    hello  认证并返回代理信息
+    have   询问哪些文件代理还没有，返回 missing
+    put    上传一个文件，负载为文件内容，代理校验哈希后保存
+    run    执行工作流，执行期间回传 event，最后回传 result
+    error  请求失败，连接仍可继续使用
+"""
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import struct
+import socket
+import getpass
+import hashlib
+import argparse
+import logging
+import tempfile
+import threading
+import socketserver
+import multiprocessing
+from typing import Dict, List, Any, Tuple, Callable, Optional
+
+import run_log
+import metrics
+from preflight import IMAGE_NODE_TYPES, DEFAULT_IMAGE_ROOT, resolve_image
+from workflow_model import load_workflow_data
+from workflow_executor import resolve_workflow_path
+
+PROTOCOL_VERSION = 1
+DEFAULT_PORT = 7700
+DEFAULT_ROOT = os.path.join(os.path.expanduser('~'), '.autobot', 'agent')
+TOKEN_ENV = 'AUTOBOT_AGENT_TOKEN'
+FRAME = struct.Struct('!II')  # JSON 头长度、负载长度
+MAX_HEADER = 1 << 20
+MAX_PAYLOAD = 256 << 20  # 单个文件的上限
+MAX_TRACE = 5000  # 结果中保留的事件数
+MAX_JOB_ATTEMPTS = 2  # 代理连接中断时任务最多执行的次数
+CONNECT_TIMEOUT = 10.0
+LOCAL_HOSTS = ('127.0.0.1', '::1', 'localhost')  # 不要求口令的监听地址
+AF_UNIX = getattr(socket, 'AF_UNIX', None)  # Windows 上的 Python 没有 Unix 套接字
+REF_PATTERN = re.compile(r'^[0-9a-f]{64}/[^/\\]+$')  # 文件引用：<sha256>/<文件名>
+
+BLOBS_RECEIVED = metrics.REGISTRY.counter('agent_blobs_received_total', "代理收到的文件数")
+BLOB_BYTES = metrics.REGISTRY.counter('agent_blob_bytes_total', "代理收到的文件字节数")
+AGENT_JOBS = metrics.REGISTRY.counter('agent_jobs_total', "代理执行的任务数", ('status',))
+
+
+class ProtocolError(Exception):
+    """帧格式错误或对端不按协议响应"""
+
+
+class RemoteError(RuntimeError):
+    """代理拒绝或无法完成请求（连接仍然可用）"""
+
+
+#region 帧
+def parse_address(text: str) -> Tuple[int, Any]:
+    """解析代理地址：host:port 为 TCP，包含路径分隔符或以 .sock 结尾为 Unix 套接字"""
+    if os.sep in text or text.endswith('.sock'):
+        if AF_UNIX is None:
+            raise ValueError(f"当前平台不支持 Unix 套接字地址 {text}，请使用 host:port")
+        return AF_UNIX, text
+    host, sep, port = text.rpartition(':')
+    if not sep:
+        host, port = text, DEFAULT_PORT
+    host = host.strip('[]') or '127.0.0.1'
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError(f"无效的代理地址 {text}（应为 host:port 或套接字路径）") from None
+    return (socket.AF_INET6 if ':' in host else socket.AF_INET), (host, port)
+
+
+class FrameConnection:
+    """在套接字上收发帧，发送加锁（执行事件和结果来自不同线程）"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._send_lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any], payload: bytes = b''):
+        header = json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with self._send_lock:
+            self.sock.sendall(FRAME.pack(len(header), len(payload)) + header)
+            if payload:
+                self.sock.sendall(payload)
+
+    def _recv_exactly(self, size: int) -> bytearray:
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if count == 0:
+                raise ConnectionError("连接已关闭")
+            received += count
+        return buffer
+
+    def recv(self) -> Tuple[Optional[Dict[str, Any]], bytes]:
+        """接收一帧，对端在帧边界正常关闭时返回 (None, b'')"""
+        try:
+            head = self._recv_exactly(FRAME.size)
+        except ConnectionError:
+            return None, b''
+        header_size, payload_size = FRAME.unpack(head)
+        if header_size > MAX_HEADER or payload_size > MAX_PAYLOAD:
+            raise ProtocolError(f"帧过大（头 {header_size} 字节，负载 {payload_size} 字节）")
+        try:
+            message = json.loads(self._recv_exactly(header_size).decode('utf-8'))
+        except ValueError as e:
+            raise ProtocolError(f"无效的帧头: {e}") from None
+        if not isinstance(message, dict) or 'op' not in message:
+            raise ProtocolError("帧头缺少 op")
+        payload = bytes(self._recv_exactly(payload_size)) if payload_size else b''
+        return message, payload
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+#endregion
+
+
+#region 打包
+class Bundle:
+    """工作流及其引用的子工作流和模板，按内容哈希寻址
+
+    模板的 img 参数改写为 <哈希>/<文件名>（相对代理的模板根目录），子工作流的 workflow 参数改写为
+    ../<哈希>/<文件名>（相对上级工作流所在目录），文件名不变，模拟屏幕按文件名匹配的目标仍然有效。
+    文件名含 ${...} 的模板无法打包，在代理上按原名解析。
+    """
+
+    def __init__(self, workflow_file: str, image_root: str = DEFAULT_IMAGE_ROOT):
+        self.image_root = image_root
+        self.files: Dict[str, bytes] = {}  # 引用 -> 内容
+        self.missing: List[str] = []  # 找不到的模板
+        self.workflow = self._add_workflow(os.path.abspath(workflow_file), ())
+
+    def _add_file(self, name: str, data: bytes) -> str:
+        ref = f"{hashlib.sha256(data).hexdigest()}/{name}"
+        self.files[ref] = data
+        return ref
+
+    def _add_workflow(self, path: str, stack: Tuple[str, ...]) -> str:
+        if path in stack:
+            chain = ' -> '.join(os.path.basename(p) for p in stack + (path,))
+            raise ValueError(f"子工作流循环引用: {chain}")
+        data = load_workflow_data(path)  # 包括编辑器尚未压缩的日志
+        for node in data.get('nodes', {}).values():
+            params = node.get('params', {})
+            if node.get('type') in IMAGE_NODE_TYPES:
+                img = params.get('img', 'target.png')
+                if '${' in img:
+                    continue
+                found = resolve_image(img, self.image_root)
+                if found is None:
+                    self.missing.append(img)
+                    continue
+                with open(found, 'rb') as f:
+                    params['img'] = self._add_file(os.path.basename(found), f.read())
+            elif node.get('type') == 'subflow' and '${' not in params.get('workflow', '${'):
+                child = resolve_workflow_path(params['workflow'], path)
+                params['workflow'] = '../' + self._add_workflow(child, stack + (path,))
+        content = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        return self._add_file(os.path.basename(path), content)
+#endregion
+
+
+#region 代理
+class _CaptureHandler(logging.Handler):
+    """把执行期间的事件作为 event 帧回传，并保留一份作为结果中的轨迹"""
+
+    def __init__(self, conn: FrameConnection, job_id: str):
+        super().__init__()
+        self.conn = conn
+        self.job_id = job_id
+        self.trace: List[Dict[str, Any]] = []
+        self.connected = True
+
+    def emit(self, record: logging.LogRecord):
+        event = {'ts': round(record.created, 3), 'level': record.levelname, 'msg': record.getMessage()}
+        for field in run_log.EVENT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        event = json.loads(json.dumps(event, default=str))  # 参数中可能有不能序列化的对象
+        if len(self.trace) < MAX_TRACE:
+            self.trace.append(event)
+        if self.connected:
+            try:
+                self.conn.send(dict(event, op='event', job_id=self.job_id))
+            except OSError:
+                self.connected = False  # 客户端已断开，执行继续，只是不再回传
+
+
+class RemoteAgent:
+    """远程执行代理：文件保存在 root/blobs 下，同一时刻只执行一个任务（一个屏幕）"""
+
+    def __init__(self, root: str = DEFAULT_ROOT, sim_manifest: str = None, token: str = None,
+                 name: str = None):
+        self.root = os.path.abspath(root)
+        self.blobs = os.path.join(self.root, 'blobs')
+        os.makedirs(self.blobs, exist_ok=True)
+        self.sim_manifest = sim_manifest
+        self.token = token
+        self.name = name or socket.gethostname()
+        self.run_lock = threading.Lock()
+        self.server = None
+        from workflow_executor import PlanCache
+        self.plans = PlanCache()  # 文件按内容寻址，不会变化，计划编译一次后一直有效
+        self.bot = None
+        if sim_manifest is None:
+            from Autobot import AutoBot
+            self.bot = AutoBot(image_root=self.blobs)
+
+    def hello(self) -> Dict[str, Any]:
+        return {'op': 'hello', 'version': PROTOCOL_VERSION, 'agent': self.name, 'pid': os.getpid(),
+                'display': os.environ.get('DISPLAY'), 'sim': self.sim_manifest is not None}
+
+    def authenticate(self, message: Dict[str, Any]) -> bool:
+        if message.get('op') != 'hello' or message.get('version') != PROTOCOL_VERSION:
+            return False
+        if not self.token:
+            return True
+        return hmac.compare_digest(str(message.get('token', '')).encode('utf-8'),
+                                   self.token.encode('utf-8'))
+
+    def path_of(self, ref: str) -> str:
+        """引用对应的本地路径，引用格式不对时抛出 ValueError（防止写到 blobs 之外）"""
+        if not isinstance(ref, str) or not REF_PATTERN.match(ref) or ref.endswith(('/.', '/..')):
+            raise ValueError(f"无效的文件引用 {ref}")
+        return os.path.join(self.blobs, *ref.split('/'))
+
+    def handle(self, conn: FrameConnection, message: Dict[str, Any], payload: bytes):
+        """处理一条请求"""
+        op = message['op']
+        if op == 'have':
+            missing = [ref for ref in message.get('refs', []) if not os.path.isfile(self.path_of(ref))]
+            conn.send({'op': 'have', 'missing': missing})
+        elif op == 'put':
+            self.store(message.get('ref'), payload)
+            conn.send({'op': 'put', 'ok': True})
+        elif op == 'run':
+            conn.send(self.run_job(conn, message))
+        elif op == 'metrics':
+            conn.send({'op': 'metrics', 'metrics': metrics.REGISTRY.snapshot()})
+        else:
+            raise ValueError(f"未知请求: {op}")
+
+    def store(self, ref: str, data: bytes):
+        """校验内容哈希后原子写入"""
+        path = self.path_of(ref)
+        if hashlib.sha256(data).hexdigest() != ref.split('/')[0]:
+            raise ValueError(f"文件 {ref} 的内容与哈希不符")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        BLOBS_RECEIVED.inc()
+        BLOB_BYTES.inc(len(data))
+
+    def run_job(self, conn: FrameConnection, request: Dict[str, Any]) -> Dict[str, Any]:
+        """执行一个任务，执行期间的事件实时回传，返回 result 帧"""
+        from workflow_executor import WorkflowExecutor, BRANCH_WORKERS
+        job_id = request.get('job_id')
+        path = self.path_of(request.get('workflow'))
+        errors = []
+        inputs = None
+        capture = _CaptureHandler(conn, job_id)
+        with self.run_lock:
+            log = run_log.ensure_configured()
+            log.add_handler(capture)
+            started = time.time()
+            try:
+                bot, screen = self.bot, None
+                if self.sim_manifest is not None:
+                    # 模拟屏幕每个任务重新开始，结果可重复
+                    from sim_backend import SimulatedScreen, create_sim_bot
+                    screen = SimulatedScreen.from_manifest(self.sim_manifest)
+                    bot = create_sim_bot(screen, self.blobs)
+                plan = self.plans.get(path)
+                executor = WorkflowExecutor(
+                    plan.bind(request.get('variables')), plan.connections, bot,
+                    on_error=lambda node, e: errors.append(
+                        {'node': node.id, 'type': node.type, 'error': str(e)}),
+                    workflow_file=path, plans=self.plans, plan=plan,
+                    branch_workers=0 if screen is not None else BRANCH_WORKERS)
+                executor.run()
+                status = 'failed' if errors else 'ok'
+                if screen is not None:
+                    inputs = screen.events
+            except Exception as e:
+                errors.append({'error': f"{type(e).__name__}: {e}"})
+                status = 'failed'
+            run_log.flush()  # 事件先于结果送达
+            log.remove_handler(capture)
+        AGENT_JOBS.labels(status).inc()
+        result = {'op': 'result', 'job_id': job_id, 'agent': self.name, 'status': status,
+                  'errors': errors, 'started': started, 'seconds': time.time() - started,
+                  'trace': capture.trace, 'metrics': metrics.REGISTRY.snapshot()}
+        if inputs is not None:
+            result['inputs'] = inputs
+        return result
+
+    def serve_forever(self, address: str, ready: Callable[[str], None] = None, insecure: bool = False):
+        """监听地址（host:port 或 Unix 套接字路径）；ready 在开始监听后以实际地址调用
+
+        代理会执行收到的任何工作流（包括执行命令节点），监听非本机地址时必须设置口令，
+        除非 insecure 为 True。口令在首帧中明文发送，跨网络时应通过 TLS 隧道或 SSH 隧道连接
+        """
+        family, addr = parse_address(address)
+        if family != AF_UNIX and addr[0] not in LOCAL_HOSTS:
+            if not self.token and not insecure:
+                raise ValueError(f"监听非本机地址 {address} 时必须设置口令（--token 或 {TOKEN_ENV}），"
+                                 f"确实不需要口令时请加 --insecure")
+            print("注意：口令和工作流以明文传输，跨越不可信网络时请通过 SSH 隧道或 TLS 隧道（如 stunnel）连接")
+        if family == AF_UNIX:
+            if os.path.exists(addr):
+                os.unlink(addr)
+            self.server = _UnixAgentServer(addr, _AgentHandler)
+            actual = addr
+        else:
+            server_class = _TCPAgentServer6 if family == socket.AF_INET6 else _TCPAgentServer
+            self.server = server_class(addr, _AgentHandler)
+            host, port = self.server.server_address[:2]
+            actual = f"[{host}]:{port}" if family == socket.AF_INET6 else f"{host}:{port}"
+            if not self.token and host not in LOCAL_HOSTS:
+                print("警告：代理监听在非本机地址且未设置口令，任何能连接的人都可以在本机执行工作流")
+        self.server.agent = self
+        print(f"执行代理已启动: {actual}（{'模拟屏幕' if self.sim_manifest else '真实屏幕'}）")
+        if ready is not None:
+            ready(actual)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if family == AF_UNIX and os.path.exists(addr):
+                os.unlink(addr)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class _AgentHandler(socketserver.BaseRequestHandler):
+    """每个连接先认证，再依次处理请求直到客户端断开"""
+    def handle(self):
+        if self.request.family != AF_UNIX:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = FrameConnection(self.request)
+        agent = self.server.agent
+        try:
+            message, _ = conn.recv()
+            if message is None:
+                return
+            if not agent.authenticate(message):
+                conn.send({'op': 'error', 'error': "认证失败或协议版本不一致"})
+                return
+            conn.send(agent.hello())
+            while True:
+                message, payload = conn.recv()
+                if message is None:
+                    return
+                try:
+                    agent.handle(conn, message, payload)
+                except (ValueError, OSError) as e:
+                    conn.send({'op': 'error', 'error': str(e)})
+        except (ConnectionError, ProtocolError, OSError):
+            pass  # 客户端断开或发送了无效的帧，关闭连接
+
+
+class _TCPAgentServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _TCPAgentServer6(_TCPAgentServer):
+    address_family = socket.AF_INET6
+
+
+if AF_UNIX is not None:
+    class _UnixAgentServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+def _agent_main(address: str, root: str, sim_manifest: str, token: str,
+                log_settings: Dict[str, Any], ready_conn):
+    """本机代理进程入口：开始监听后把实际地址发回父进程"""
+    run_log.setup_logging(**(log_settings or {}))
+    agent = RemoteAgent(root, sim_manifest, token, name=f"local-{os.getpid()}")
+
+    def ready(actual):
+        ready_conn.send(actual)
+        ready_conn.close()
+    agent.serve_forever(address, ready)
+#endregion
+
+
+#region 客户端与协调器
+class AgentClient:
+    """连接一个代理：同步文件、执行任务"""
+
+    def __init__(self, address: str, token: str = None, timeout: float = CONNECT_TIMEOUT):
+        self.address = address
+        family, addr = parse_address(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(addr)
+            if family != AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            self.conn = FrameConnection(sock)
+            self.info = self.request({'op': 'hello', 'version': PROTOCOL_VERSION, 'token': token or ''})
+        except BaseException:
+            sock.close()
+            raise
+        sock.settimeout(None)  # 任务可能执行很久
+        self.synced: set = set()  # 已确认代理拥有的文件
+        self.bytes_sent = 0
+
+    def request(self, message: Dict[str, Any], payload: bytes = b'') -> Dict[str, Any]:
+        self.conn.send(message, payload)
+        return self._reply(message['op'])
+
+    def _reply(self, op: str) -> Dict[str, Any]:
+        reply, _ = self.conn.recv()
+        if reply is None:
+            raise ConnectionError(f"代理 {self.address} 关闭了连接")
+        if reply['op'] == 'error':
+            raise RemoteError(reply.get('error', '未知错误'))
+        if reply['op'] != op:
+            raise ProtocolError(f"期望 {op} 响应，收到 {reply['op']}")
+        return reply
+
+    def sync(self, bundle: Bundle) -> int:
+        """上传代理还没有的文件，返回上传的文件数"""
+        refs = [ref for ref in bundle.files if ref not in self.synced]
+        if not refs:
+            return 0
+        missing = self.request({'op': 'have', 'refs': refs})['missing']
+        for ref in missing:
+            data = bundle.files[ref]
+            self.request({'op': 'put', 'ref': ref}, data)
+            self.bytes_sent += len(data)
+        self.synced.update(refs)
+        return len(missing)
+
+    def run(self, bundle: Bundle, job_id: str, variables: Dict[str, Any] = None,
+            on_event: Callable[[Dict[str, Any]], None] = None) -> Dict[str, Any]:
+        """同步文件后执行任务，事件交给 on_event，返回结果"""
+        self.sync(bundle)
+        self.conn.send({'op': 'run', 'job_id': job_id, 'workflow': bundle.workflow,
+                        'variables': variables or {}})
+        while True:
+            message, _ = self.conn.recv()
+            if message is None:
+                raise ConnectionError(f"代理 {self.address} 在执行任务时断开")
+            if message['op'] == 'event':
+                if on_event is not None:
+                    on_event(message)
+            elif message['op'] == 'error':
+                raise RemoteError(message.get('error', '未知错误'))
+            elif message['op'] == 'result':
+                return message
+            else:
+                raise ProtocolError(f"执行期间收到意外的 {message['op']}")
+
+    def close(self):
+        self.conn.close()
+
+
+class Coordinator:
+    """把任务分发给多个代理：每个代理一个线程，空闲即取下一个任务；连接中断的任务交给其他代理重试"""
+
+    def __init__(self, agents: List[str], token: str = None, image_root: str = DEFAULT_IMAGE_ROOT,
+                 on_event: Callable[[str, Dict[str, Any]], None] = None):
+        self.agents = list(agents)
+        self.token = token
+        self.image_root = image_root
+        self.on_event = on_event
+        self.cond = threading.Condition()
+        self.pending: List[Dict[str, Any]] = []
+        self.attempts: Dict[str, int] = {}
+        self.finished: Dict[str, Dict[str, Any]] = {}
+        self.bundles: Dict[str, Bundle] = {}
+        self.job_counter = 0
+        self.alive = 0
+        self.agent_metrics: Dict[str, Dict[str, Any]] = {}  # 各代理最近回传的指标快照
+        self.agent_stats: Dict[str, Dict[str, Any]] = {}
+
+    def submit(self, workflow: str, variables: Dict[str, Any] = None) -> str:
+        """提交一次工作流运行，返回任务编号；工作流只打包一次"""
+        path = os.path.abspath(workflow)
+        if path not in self.bundles:
+            bundle = self.bundles[path] = Bundle(path, self.image_root)
+            for img in sorted(set(bundle.missing)):
+                print(f"警告：{os.path.basename(path)} 引用的模板 {img} 不存在，未打包")
+        with self.cond:
+            self.job_counter += 1
+            job = {'id': f"job_{self.job_counter}", 'workflow': path, 'variables': variables or {}}
+            self.pending.append(job)
+            self.attempts[job['id']] = 0
+        return job['id']
+
+    def submit_shards(self, workflow: str, items: List[Any], var: str = 'item') -> List[str]:
+        """把数据拆成分片，每个分片作为一次运行，通过 ${var} 传入工作流"""
+        return [self.submit(workflow, {var: item}) for item in items]
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """取下一个任务；队列为空但仍有任务在其他代理上执行时等待（它们可能被放回队列）"""
+        with self.cond:
+            while not self.pending and len(self.finished) < len(self.attempts):
+                self.cond.wait()
+            if not self.pending:
+                return None
+            job = self.pending.pop(0)
+            self.attempts[job['id']] += 1
+            return job
+
+    def _finish(self, job: Dict[str, Any], result: Dict[str, Any]):
+        with self.cond:
+            result['attempts'] = self.attempts[job['id']]
+            self.finished[job['id']] = result
+            self.cond.notify_all()
+
+    def _requeue(self, job: Dict[str, Any], reason: str):
+        with self.cond:
+            if self.attempts[job['id']] < MAX_JOB_ATTEMPTS and self.alive > 0:
+                self.pending.insert(0, job)
+            else:
+                self.finished[job['id']] = {'job_id': job['id'], 'status': 'crashed',
+                                            'attempts': self.attempts[job['id']],
+                                            'errors': [{'error': reason}]}
+            self.cond.notify_all()
+
+    def _agent_down(self, address: str, reason: str):
+        """代理不可用；没有可用代理时，剩余任务全部记为失败"""
+        print(f"执行代理 {address} 不可用：{reason}")
+        with self.cond:
+            self.alive -= 1
+            if self.alive == 0:
+                for job in self.pending:
+                    self.finished[job['id']] = {'job_id': job['id'], 'status': 'crashed',
+                                                'attempts': self.attempts[job['id']],
+                                                'errors': [{'error': "没有可用的执行代理"}]}
+                self.pending.clear()
+            self.cond.notify_all()
+
+    def _agent_loop(self, address: str):
+        stats = self.agent_stats[address] = {'agent': address, 'runs': 0, 'failed': 0,
+                                             'busy_seconds': 0.0, 'files_sent': 0, 'bytes_sent': 0}
+        try:
+            client = AgentClient(address, self.token)
+        except (OSError, ProtocolError, RemoteError) as e:
+            self._agent_down(address, str(e))
+            return
+        stats['name'] = client.info.get('agent')
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                bundle = self.bundles[job['workflow']]
+                on_event = (lambda event: self.on_event(address, event)) if self.on_event else None
+                try:
+                    stats['files_sent'] += client.sync(bundle)
+                    result = client.run(bundle, job['id'], job['variables'], on_event)
+                except RemoteError as e:
+                    result = {'job_id': job['id'], 'status': 'failed', 'seconds': 0.0,
+                              'errors': [{'error': str(e)}]}
+                except (OSError, ProtocolError) as e:
+                    # 先标记代理不可用，任务只放回给其余仍可用的代理
+                    self._agent_down(address, str(e))
+                    self._requeue(job, f"执行代理 {address} 连接中断：{e}")
+                    return
+                self.agent_metrics[address] = result.pop('metrics', None)
+                result['agent'] = address
+                stats['runs'] += 1
+                stats['failed'] += result['status'] != 'ok'
+                stats['busy_seconds'] += result.get('seconds', 0.0)
+                print(f"任务 {job['id']} 在代理 {address} 上完成：{result['status']}"
+                      f"（{result.get('seconds', 0.0):.1f} 秒）")
+                self._finish(job, result)
+        finally:
+            stats['bytes_sent'] = client.bytes_sent
+            client.close()
+
+    def run(self) -> Dict[str, Dict[str, Any]]:
+        """执行所有已提交的任务，返回各任务结果"""
+        self.alive = len(self.agents)
+        threads = [threading.Thread(target=self._agent_loop, args=(address,), daemon=True)
+                   for address in self.agents]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.finished
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """合并本进程和各代理的指标快照"""
+        return metrics.merge_snapshots([metrics.REGISTRY.snapshot()] + list(self.agent_metrics.values()))
+
+
+def start_local_agents(count: int, sim_manifest: str = None, root: str = None,
+                       token: str = None) -> Tuple[List[multiprocessing.Process], List[str]]:
+    """在本机启动若干代理进程（监听 127.0.0.1 的随机端口），返回进程和地址"""
+    context = multiprocessing.get_context('spawn')
+    # 同一用户的本机代理共用文件目录；Windows 没有 os.getuid，用用户名区分
+    user = getattr(os, 'getuid', getpass.getuser)()
+    root = root or os.path.join(tempfile.gettempdir(), f"autobot-agent-{user}")
+    processes, addresses = [], []
+    for i in range(count):
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_agent_main, args=('127.0.0.1:0', root, sim_manifest, token,
+                                      run_log.child_settings(f'agent{i}'), child_conn),
+            daemon=True)
+        process.start()
+        child_conn.close()
+        if not parent_conn.poll(30):
+            process.terminate()
+            raise RuntimeError(f"本机代理 {i} 启动超时")
+        processes.append(process)
+        addresses.append(parent_conn.recv())
+    return processes, addresses
+#endregion
+
+
+def parse_variables(items: List[str]) -> Dict[str, str]:
+    """解析 name=value 形式的变量"""
+    variables = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        variables[name] = value
+    return variables
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="AutoBot 远程执行代理及协调器")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help="启动执行代理")
+    serve.add_argument('--listen', default=f'127.0.0.1:{DEFAULT_PORT}',
+                       help="监听地址 host:port 或 Unix 套接字路径")
+    serve.add_argument('--root', default=DEFAULT_ROOT, help="接收的工作流和模板的存放目录")
+    serve.add_argument('--display', help="使用的显示器（默认取 DISPLAY 环境变量）")
+    serve.add_argument('--sim', help="使用模拟屏幕的画面清单（见 sim_backend.py）")
+    serve.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                       help=f"连接口令（默认取 {TOKEN_ENV} 环境变量）；口令明文传输，跨网络请使用 SSH 隧道或 TLS 隧道")
+    serve.add_argument('--insecure', action='store_true',
+                       help="允许在非本机地址上不设口令监听（任何能连接的人都可以在本机执行命令）")
+
+    run = sub.add_parser('run', help="把工作流分发给代理执行")
+    run.add_argument('workflows', nargs='+', help="工作流 JSON 文件")
+    run.add_argument('--agent', action='append', default=[], help="代理地址 host:port，可重复")
+    run.add_argument('--local', type=int, default=0, help="在本机启动该数量的代理")
+    run.add_argument('--sim', help="本机代理使用的模拟屏幕画面清单")
+    run.add_argument('--image-root', default=DEFAULT_IMAGE_ROOT, help="模板图像根目录")
+    run.add_argument('--token', default=os.environ.get(TOKEN_ENV),
+                     help=f"连接口令（默认取 {TOKEN_ENV} 环境变量）")
+    run.add_argument('--shards', help="数据分片文件，每行一个分片")
+    run.add_argument('--var', default='item', help="分片在工作流中的变量名")
+    run.add_argument('--set', action='append', dest='variables', help="变量 name=value，可重复")
+    run.add_argument('--output', help="将结果写入该 JSON 文件")
+    for p in (serve, run):
+        run_log.add_log_arguments(p)
+        metrics.add_metrics_arguments(p)
+    args = parser.parse_args(argv)
+    run_log.setup_from_args(args)
+
+    if args.command == 'serve':
+        if args.display:
+            os.environ['DISPLAY'] = args.display  # 必须在导入 AutoBot 之前设置
+        agent = RemoteAgent(args.root, args.sim, args.token)
+        exporter = metrics.exporter_from_args(args)
+        try:
+            agent.serve_forever(args.listen, insecure=args.insecure)
+        except ValueError as e:
+            parser.error(str(e))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if exporter is not None:
+                exporter.stop()
+        return 0
+
+    processes = []
+    agents = list(args.agent)
+    if args.local:
+        processes, local = start_local_agents(args.local, args.sim, token=args.token)
+        agents += local
+    if not agents:
+        parser.error("请用 --agent 指定代理地址，或用 --local 在本机启动代理")
+
+    def on_event(address, event):
+        print(f"[{address} {event['job_id']}] {event['msg']}")
+    coordinator = Coordinator(agents, args.token, args.image_root, on_event)
+    variables = parse_variables(args.variables)
+    for workflow in args.workflows:
+        if args.shards:
+            with open(args.shards, 'r', encoding='utf-8') as f:
+                items = [line.strip() for line in f if line.strip()]
+            for item in items:
+                coordinator.submit(workflow, dict(variables, **{args.var: item}))
+        else:
+            coordinator.submit(workflow, variables)
+
+    exporter = metrics.exporter_from_args(args, coordinator.metrics_snapshot)
+    try:
+        results = coordinator.run()
+    finally:
+        for process in processes:
+            process.terminate()
+        if exporter is not None:
+            exporter.stop()
+
+    report = {'jobs': list(results.values()), 'agents': list(coordinator.agent_stats.values())}
+    failed = sum(1 for r in results.values() if r['status'] != 'ok')
+    print(f"共 {len(results)} 个任务，失败 {failed} 个")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
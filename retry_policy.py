@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+重试策略与点击结果
+按总时限和/或尝试次数重试，间隔指数退避并加随机抖动；
+可选在等待期间监视屏幕变化，画面一变立即重试，慢页面无需设置很大的固定重试次数
+"""
+
+import random
+from typing import Callable, Iterator, Optional, Tuple, Any
+
+
+class RetryPolicy:
+    """重试策略
+
+    attempts: 最多尝试次数，None 表示只受 deadline 限制
+    deadline: 总时限（秒），None 表示只受 attempts 限制
+    base_delay/multiplier/max_delay: 第 n 次失败后等待 base_delay * multiplier**n 秒，不超过 max_delay
+    jitter: 抖动比例，实际等待在 [1 - jitter, 1 + jitter] 倍之间
+    on_change: 等待期间每 change_interval 秒比较一次屏幕指纹，画面变化时提前重试
+    """
+
+    def __init__(self, attempts: Optional[int] = 1, deadline: Optional[float] = None,
+                 base_delay: float = 0.1, multiplier: float = 2.0, max_delay: float = 1.0,
+                 jitter: float = 0.2, on_change: bool = False, change_interval: float = 0.05,
+                 rng: random.Random = None):
+        if attempts is None and deadline is None:
+            attempts = 1
+        self.attempts = attempts
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.on_change = on_change
+        self.change_interval = change_interval
+        self.rng = rng or random
+
+    @classmethod
+    def from_params(cls, retry: int = 1, timeout: float = 0.0, on_change: bool = False) -> 'RetryPolicy':
+        """由节点参数构建：timeout 大于 0 时按总时限重试，否则按 retry 次数"""
+        if timeout and timeout > 0:
+            return cls(attempts=None, deadline=timeout, on_change=on_change)
+        return cls(attempts=max(1, int(retry)), on_change=on_change)
+
+    def delays(self) -> Iterator[float]:
+        """依次产生每次失败后的等待时间"""
+        delay = self.base_delay
+        while True:
+            yield delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+            delay = min(self.max_delay, delay * self.multiplier)
+
+    def run(self, attempt: Callable[[], Any], clock,
+            fingerprint: Callable[[], Any] = None) -> Tuple[Any, int, float]:
+        """反复调用 attempt 直到返回非 None 或用完次数/时限，返回 (结果, 尝试次数, 耗时)"""
+        start = clock.time()
+        end = start + self.deadline if self.deadline is not None else None
+        delays = self.delays()
+        count = 0
+        while True:
+            count += 1
+            result = attempt()
+            if result is not None:
+                return result, count, clock.time() - start
+            if self.attempts is not None and count >= self.attempts:
+                break
+            now = clock.time()
+            if end is not None and now >= end:
+                break
+            wait_until = now + next(delays)
+            if end is not None:
+                wait_until = min(wait_until, end)
+            self._wait(clock, wait_until, fingerprint if self.on_change else None)
+        return None, count, clock.time() - start
+
+    def _wait(self, clock, wait_until: float, fingerprint: Callable[[], Any] = None):
+        """等待到 wait_until；监视屏幕时画面一变化就提前返回"""
+        if fingerprint is None:
+            remaining = wait_until - clock.time()
+            if remaining > 0:
+                clock.sleep(remaining)
+            return
+        before = fingerprint()
+        while True:
+            remaining = wait_until - clock.time()
+            if remaining <= 0:
+                return
+            clock.sleep(min(self.change_interval, remaining))
+            if fingerprint() != before:
+                return
+
+
+class ClickResult:
+    """点击结果，可直接作为布尔值使用（是否找到并点击）"""
+    def __init__(self, found: bool, attempts: int, elapsed: float,
+                 confidence: Optional[float] = None, location: Optional[Tuple[int, int]] = None):
+        self.found = found
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.confidence = confidence  # 后端不提供匹配得分时为 None
+        self.location = location
+
+    def __bool__(self):
+        return self.found
+
+    def __repr__(self):
+        return (f"ClickResult(found={self.found}, attempts={self.attempts}, "
+                f"elapsed={self.elapsed:.3f}, confidence={self.confidence}, location={self.location})")
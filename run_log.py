@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行日志
+AutoBot 和执行器的每个动作都记录为带级别的结构化事件（节点、动作、参数、耗时）。
+事件先放入有界队列，由后台线程写到控制台、JSONL 文件或滚动日志文件，
+自动化线程不会被终端或磁盘阻塞；队列满时丢弃新事件并计数。
+详细模式（DEBUG）关闭时，详细事件在调用处即被跳过，不构造参数也不计时。
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+import contextvars
+import collections
+from typing import Dict, List, Any, Optional
+
+LOGGER_NAME = 'autobot'
+QUEUE_SIZE = 10000  # 队列容量，写出线程跟不上时丢弃多出的事件
+MAX_BYTES = 10 * 1024 * 1024  # 日志文件超过该大小时滚动
+BACKUPS = 5  # 保留的历史日志文件数
+TAIL_SIZE = 2000  # 界面日志面板保留的事件数
+
+CONSOLE_FORMAT = '%(message)s'  # 与原来的 print 输出一致
+FILE_FORMAT = '%(asctime)s %(levelname)s [%(node)s] %(message)s'
+EVENT_FIELDS = ('node', 'action', 'params', 'elapsed')
+
+# 当前正在执行的节点 id，由执行器设置，记录事件时自动附加
+current_node: contextvars.ContextVar = contextvars.ContextVar('current_node', default=None)
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """获取 autobot 日志器（或其子日志器，如 autobot.executor）"""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}' if name else LOGGER_NAME)
+
+
+#region 处理器与格式
+class NodeContextFilter(logging.Filter):
+    """在记录事件的线程中补上当前节点 id 和缺省的事件字段"""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'node', None) is None:
+            record.node = current_node.get()
+        for field in ('action', 'params', 'elapsed'):
+            if not hasattr(record, field):
+                setattr(record, field, None)
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """写入有界队列，队列满时丢弃事件而不阻塞调用方"""
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+        self.addFilter(NodeContextFilter())
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每个事件格式化为一行 JSON"""
+    def format(self, record: logging.LogRecord) -> str:
+        event = {'ts': round(record.created, 3), 'level': record.levelname,
+                 'logger': record.name, 'msg': record.getMessage()}
+        for field in EVENT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                event[field] = value
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class TailHandler(logging.Handler):
+    """保留最近的事件，供界面定时取走显示（写出线程追加，界面线程读取）"""
+    def __init__(self, capacity: int = TAIL_SIZE):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+    def drain(self) -> List[logging.LogRecord]:
+        """取走目前积累的事件"""
+        records = []
+        while True:
+            try:
+                records.append(self.records.popleft())
+            except IndexError:
+                return records
+#endregion
+
+
+class RunLog:
+    """日志管道：日志器 -> 有界队列 -> 后台写出线程 -> 各个输出"""
+
+    def __init__(self, handlers: List[logging.Handler], level: int = logging.INFO,
+                 queue_size: int = QUEUE_SIZE):
+        self.pid = os.getpid()
+        self.queue = queue.Queue(queue_size)
+        self.handler = BoundedQueueHandler(self.queue)
+        self.listener = logging.handlers.QueueListener(self.queue, *handlers,
+                                                       respect_handler_level=True)
+        self.logger = get_logger()
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def add_handler(self, handler: logging.Handler):
+        """增加一个输出（如界面日志面板）"""
+        self.listener.handlers = self.listener.handlers + (handler,)
+
+    def remove_handler(self, handler: logging.Handler):
+        self.listener.handlers = tuple(h for h in self.listener.handlers if h is not handler)
+
+    def flush(self):
+        """等待队列中的事件全部写出"""
+        self.queue.join()
+
+    def close(self):
+        """停止写出线程并关闭输出，有丢弃的事件时补记一条警告"""
+        self.logger.removeHandler(self.handler)
+        if self.pid != os.getpid():
+            return  # fork 出的子进程中没有写出线程，不能等待它
+        self.listener.stop()
+        if self.dropped:
+            record = logging.makeLogRecord({
+                'name': LOGGER_NAME, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"日志队列已满，丢弃了 {self.dropped} 条事件"})
+            NodeContextFilter().filter(record)
+            self.listener.handle(record)
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+_active: Optional[RunLog] = None
+_settings: Dict[str, Any] = {}
+
+
+def setup_logging(verbose: bool = False, jsonl: str = None, log_file: str = None,
+                  console: bool = True, queue_size: int = QUEUE_SIZE,
+                  max_bytes: int = MAX_BYTES, backups: int = BACKUPS) -> RunLog:
+    """配置运行日志（替换之前的配置），返回日志管道
+
+    verbose: 记录 DEBUG 级的详细事件
+    jsonl: 以 JSONL 格式写入该文件；log_file: 以文本格式写入该文件；两者都按 max_bytes 滚动
+    console: 输出到标准输出（在调用时取 sys.stdout，可先重定向再配置）
+    """
+    global _active, _settings
+    if _active is not None:
+        _active.close()
+    _settings = {'verbose': verbose, 'jsonl': jsonl, 'log_file': log_file, 'console': console,
+                 'queue_size': queue_size, 'max_bytes': max_bytes, 'backups': backups}
+
+    handlers = []
+    if console:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(handler)
+    for path, formatter in ((jsonl, JsonLinesFormatter()), (log_file, logging.Formatter(FILE_FORMAT))):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            handler.setFormatter(formatter)
+            handlers.append(handler)
+    _active = RunLog(handlers, logging.DEBUG if verbose else logging.INFO, queue_size)
+    return _active
+
+
+def ensure_configured() -> RunLog:
+    """尚未配置时按默认（或父进程的）设置配置；fork 出的子进程会重新启动写出线程"""
+    if _active is None or _active.pid != os.getpid():
+        return setup_logging(**_settings)
+    return _active
+
+
+def flush():
+    """等待已记录的事件全部写出"""
+    if _active is not None and _active.pid == os.getpid():
+        _active.flush()
+
+
+def child_settings(suffix: str) -> Dict[str, Any]:
+    """子进程使用的日志设置：日志文件名加上后缀，避免多个进程滚动同一个文件"""
+    settings = dict(_settings)
+    for key in ('jsonl', 'log_file'):
+        if settings.get(key):
+            root, ext = os.path.splitext(settings[key])
+            settings[key] = f"{root}.{suffix}{ext}"
+    return settings
+
+
+def set_verbose(verbose: bool):
+    """运行中切换详细模式"""
+    get_logger().setLevel(logging.DEBUG if verbose else logging.INFO)
+    _settings['verbose'] = verbose
+
+
+def add_log_arguments(parser):
+    """为命令行程序增加日志参数"""
+    group = parser.add_argument_group("运行日志")
+    group.add_argument('--verbose', action='store_true', help="记录详细事件（每次定位、每个节点的参数和耗时）")
+    group.add_argument('--log-jsonl', help="以 JSONL 格式把事件写入该文件（按大小滚动）")
+    group.add_argument('--log-file', help="以文本格式把事件写入该滚动日志文件")
+    group.add_argument('--quiet', action='store_true', help="不在控制台输出事件")
+
+
+def setup_from_args(args) -> RunLog:
+    """按 add_log_arguments 增加的参数配置日志"""
+    return setup_logging(verbose=args.verbose, jsonl=args.log_jsonl, log_file=args.log_file,
+                         console=not args.quiet)
+
+
+@atexit.register
+def _close_at_exit():
+    if _active is not None:
+        _active.close()
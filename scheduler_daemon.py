@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+常驻调度守护进程
+工作流只加载编译一次，每个显示器由一个长驻的执行进程持有预热的 AutoBot（模板已解码）；
+通过本地 Unix 套接字或类 cron 定时计划接收任务，按优先级排队，同一显示器上的任务不会重叠，
+并返回运行结果和统计指标。同一模块也提供轻量的命令行客户端：
+
+    python scheduler_daemon.py serve
+    python scheduler_daemon.py submit workflow.json --priority 5 --var name=张三
+    python scheduler_daemon.py tail job_1 -f
+    python scheduler_daemon.py schedule workflow.json --cron "*/10 9-18 * * 1-5"
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import getpass
+import socket
+import argparse
+import tempfile
+import threading
+import socketserver
+import multiprocessing
+from typing import Dict, List, Any, Optional, Iterator
+
+import run_log
+import metrics
+
+# 每个用户一个套接字；Windows 没有 os.getuid，用用户名区分
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(),
+                              f"autopipeline-{getattr(os, 'getuid', getpass.getuser)()}.sock")
+MAX_LOG_LINES = 5000  # 每个任务在内存中保留的日志行数
+
+
+#region 定时计划
+def parse_cron_field(field: str, low: int, high: int) -> set:
+    """解析 cron 的单个字段，支持 *、*/n、a-b、a-b/n 和逗号列表"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = end = int(part)
+        if start < low or end > high or step < 1:
+            raise ValueError(f"cron 字段超出范围: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """五段式 cron 表达式：分 时 日 月 周（周日为 0；日和周同时限定时需同时满足）"""
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段: {expression}")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in parse_cron_field(fields[4], 0, 7)}
+
+    def matches(self, t: time.struct_time) -> bool:
+        return (t.tm_min in self.minutes and t.tm_hour in self.hours
+                and t.tm_mday in self.days and t.tm_mon in self.months
+                and (t.tm_wday + 1) % 7 in self.weekdays)
+#endregion
+
+
+#region 执行通道
+class _PipeWriter:
+    """把 print 输出逐行转发给守护进程"""
+    def __init__(self, conn):
+        self.conn = conn
+        self.buffer = ''
+        self.lock = threading.Lock()  # 日志写出线程和主线程都会写入
+
+    def write(self, text: str):
+        with self.lock:
+            self.buffer += text
+            while '\n' in self.buffer:
+                line, self.buffer = self.buffer.split('\n', 1)
+                self.conn.send(('log', line))
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            if self.buffer:
+                self.conn.send(('log', self.buffer))
+                self.buffer = ''
+
+
+def _lane_main(display: Optional[str], conn, sim_manifest: str = None,
+               log_settings: Dict[str, Any] = None):
+    """执行进程入口：长驻持有 AutoBot 和工作流缓存，逐个执行任务"""
+    if display:
+        os.environ['DISPLAY'] = display
+    sys.stdout = _PipeWriter(conn)
+    # 控制台输出进入管道，成为任务日志
+    run_log.setup_logging(**(log_settings or {}))
+    from workflow_executor import WorkflowExecutor, PlanCache, BRANCH_WORKERS
+
+    if sim_manifest:
+        from sim_backend import SimulatedScreen, create_sim_bot
+        bot = None
+    else:
+        from Autobot import AutoBot
+        bot = AutoBot()
+    cache = PlanCache()  # 任务和子工作流共用，文件未变化时不重新加载和编译
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        errors = []
+        started = time.time()
+        try:
+            if sim_manifest:
+                # 模拟屏幕每个任务重新开始，结果可重复
+                bot = create_sim_bot(SimulatedScreen.from_manifest(sim_manifest))
+            plan = cache.get(job['workflow'])
+            # 缓存的节点是共享的，带变量运行时只复制引用了变量的节点
+            executor = WorkflowExecutor(
+                plan.bind(job.get('variables')), plan.connections, bot,
+                on_error=lambda node, e: errors.append(
+                    {'node': node.id, 'type': node.type, 'error': str(e)}),
+                workflow_file=job['workflow'], plans=cache, plan=plan,
+                branch_workers=0 if sim_manifest else BRANCH_WORKERS)
+            executor.run()
+            status = 'failed' if errors else 'ok'
+        except Exception as e:
+            errors.append({'error': f"{type(e).__name__}: {e}"})
+            status = 'failed'
+        run_log.flush()
+        sys.stdout.flush()
+        conn.send(('result', {'status': status, 'errors': errors,
+                              'run_seconds': time.time() - started,
+                              'cache_hits': cache.hits, 'cache_misses': cache.misses,
+                              'metrics': metrics.REGISTRY.snapshot()}))
+
+
+class Job:
+    """一次排队的工作流运行"""
+    def __init__(self, job_id: str, spec: Dict[str, Any]):
+        self.id = job_id
+        self.name = spec.get('name') or os.path.basename(spec['workflow'])
+        self.workflow = spec['workflow']
+        self.priority = int(spec.get('priority', 0))
+        self.display = spec.get('display')
+        self.variables = spec.get('variables') or {}
+        self.schedule_id = spec.get('schedule_id')
+        self.status = 'queued'
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.errors: List[Dict[str, Any]] = []
+        self.log: List[str] = []
+        self.log_dropped = 0
+        self.cancel_requested = False
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('ok', 'failed', 'cancelled')
+
+    def add_log(self, line: str):
+        self.log.append(line)
+        if len(self.log) > MAX_LOG_LINES:
+            drop = len(self.log) - MAX_LOG_LINES
+            del self.log[:drop]
+            self.log_dropped += drop
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id, 'name': self.name, 'workflow': self.workflow,
+            'priority': self.priority, 'display': self.display, 'status': self.status,
+            'submitted': self.submitted, 'started': self.started, 'finished': self.finished,
+            'queue_seconds': (self.started or time.time()) - self.submitted,
+            'run_seconds': (self.finished or time.time()) - self.started if self.started else None,
+            'errors': self.errors, 'log_lines': self.log_dropped + len(self.log),
+        }
+
+
+class Lane:
+    """一个显示器的执行通道：同一时间只运行一个任务"""
+    def __init__(self, scheduler: 'SchedulerDaemon', display: Optional[str]):
+        self.scheduler = scheduler
+        self.display = display
+        self.queue: List[Any] = []  # (-优先级, 序号, 任务)
+        self.running: Optional[Job] = None
+        self.context = multiprocessing.get_context('spawn')
+        self.process = None
+        self.conn = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.last_metrics = None  # 执行进程最近回传的指标快照
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+
+    def start_process(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_lane_main, args=(self.display, child_conn, self.scheduler.sim_manifest,
+                                     run_log.child_settings((self.display or 'default').strip(':'))),
+            daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        if self.process is not None and self.process.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+
+    def cancel_running(self):
+        """终止执行进程以取消正在运行的任务，之后会自动重启"""
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+
+    def loop(self):
+        cond = self.scheduler.cond
+        while True:
+            with cond:
+                while not self.queue and not self.scheduler.stopping:
+                    cond.wait()
+                if self.scheduler.stopping:
+                    return
+                job = heapq.heappop(self.queue)[2]
+                if job.cancel_requested:
+                    continue
+                job.status = 'running'
+                job.started = time.time()
+                self.running = job
+            self.execute(job)
+
+    def execute(self, job: Job):
+        """把任务交给执行进程，转发日志直到收到结果"""
+        if self.process is None or not self.process.is_alive():
+            self.start_process()
+        result = None
+        try:
+            self.conn.send({'workflow': job.workflow, 'variables': job.variables})
+            while True:
+                kind, payload = self.conn.recv()
+                if kind == 'log':
+                    with self.scheduler.cond:
+                        job.add_log(payload)
+                        self.scheduler.cond.notify_all()
+                else:
+                    result = payload
+                    break
+        except (EOFError, OSError):
+            self.process = None  # 进程已退出，下次任务前重启
+
+        with self.scheduler.cond:
+            if result is not None:
+                job.status = result['status']
+                job.errors = result['errors']
+                self.cache_hits = result['cache_hits']
+                self.cache_misses = result['cache_misses']
+                self.last_metrics = result.get('metrics')
+            elif job.cancel_requested:
+                job.status = 'cancelled'
+            else:
+                job.status = 'failed'
+                job.errors = [{'error': '执行进程意外退出'}]
+            job.finished = time.time()
+            self.running = None
+            self.scheduler.record_finished(job)
+            self.scheduler.cond.notify_all()
+#endregion
+
+
+class SchedulerDaemon:
+    """调度守护进程"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, default_display: str = None,
+                 sim_manifest: str = None):
+        self.socket_path = socket_path
+        self.default_display = default_display or os.environ.get('DISPLAY')
+        self.sim_manifest = os.path.abspath(sim_manifest) if sim_manifest else None
+        self.cond = threading.Condition()
+        self.lanes: Dict[Optional[str], Lane] = {}
+        self.jobs: Dict[str, Job] = {}
+        self.schedules: Dict[str, Dict[str, Any]] = {}
+        self.job_counter = 0
+        self.schedule_counter = 0
+        self.sequence = 0
+        self.stopping = False
+        self.started = time.time()
+        self.stats = {'submitted': 0, 'ok': 0, 'failed': 0, 'cancelled': 0,
+                      'run_seconds': 0.0, 'queue_seconds': 0.0}
+        self.server = None
+        # 守护进程自身的任务指标，与各执行进程回传的 AutoBot/执行器指标合并后导出
+        self.registry = metrics.MetricsRegistry()
+        self.jobs_total = self.registry.counter('scheduler_jobs_total', "结束的任务数", ('status',))
+        self.job_queue_seconds = self.registry.histogram(
+            'scheduler_job_queue_seconds', "任务排队时间（秒）", metrics.SECONDS_BUCKETS)
+        self.job_run_seconds = self.registry.histogram(
+            'scheduler_job_run_seconds', "任务运行时间（秒）", metrics.SECONDS_BUCKETS)
+
+    #region 任务管理
+    def lane_for(self, display: Optional[str]) -> Lane:
+        """获取显示器对应的执行通道（调用方需持有锁）"""
+        if display not in self.lanes:
+            lane = Lane(self, display)
+            self.lanes[display] = lane
+            lane.thread.start()
+        return self.lanes[display]
+
+    def submit(self, spec: Dict[str, Any]) -> Job:
+        """提交任务并按优先级排队"""
+        with self.cond:
+            self.job_counter += 1
+            self.sequence += 1
+            job = Job(f"job_{self.job_counter}", spec)
+            job.display = job.display or self.default_display
+            self.jobs[job.id] = job
+            heapq.heappush(self.lane_for(job.display).queue, (-job.priority, self.sequence, job))
+            self.stats['submitted'] += 1
+            self.cond.notify_all()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_requested = True
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished = time.time()
+                self.record_finished(job)
+            else:
+                self.lanes[job.display].cancel_running()
+            self.cond.notify_all()
+            return True
+
+    def record_finished(self, job: Job):
+        """更新统计（调用方需持有锁）"""
+        self.stats[job.status] = self.stats.get(job.status, 0) + 1
+        self.jobs_total.labels(job.status).inc()
+        if job.started:
+            self.stats['queue_seconds'] += job.started - job.submitted
+            self.stats['run_seconds'] += job.finished - job.started
+            self.job_queue_seconds.observe(job.started - job.submitted)
+            self.job_run_seconds.observe(job.finished - job.started)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.cond:
+            completed = self.stats['ok'] + self.stats['failed']
+            return {
+                'uptime_seconds': time.time() - self.started,
+                **self.stats,
+                'avg_run_seconds': self.stats['run_seconds'] / completed if completed else 0.0,
+                'avg_queue_seconds': self.stats['queue_seconds'] / completed if completed else 0.0,
+                'lanes': [{
+                    'display': display,
+                    'queued': len(lane.queue),
+                    'running': lane.running.id if lane.running else None,
+                    'cache_hits': lane.cache_hits,
+                    'cache_misses': lane.cache_misses,
+                } for display, lane in self.lanes.items()],
+                'schedules': len(self.schedules),
+            }
+    #endregion
+
+    #region 定时计划
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """合并守护进程和各执行进程的指标快照"""
+        with self.cond:
+            lane_snapshots = [lane.last_metrics for lane in self.lanes.values()]
+        return metrics.merge_snapshots([self.registry.snapshot()] + lane_snapshots)
+
+    def add_schedule(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        if spec.get('cron'):
+            CronSchedule(spec['cron'])  # 提前校验表达式
+        elif not spec.get('every'):
+            raise ValueError("定时计划需要 cron 或 every")
+        with self.cond:
+            self.schedule_counter += 1
+            schedule = {key: value for key, value in spec.items() if key != 'command'}
+            schedule.update(id=f"schedule_{self.schedule_counter}", last_run=None)
+            self.schedules[schedule['id']] = schedule
+            return schedule
+
+    def schedule_loop(self):
+        """每秒检查一次定时计划；cron 计划每分钟最多触发一次"""
+        last_minute = None
+        while not self.stopping:
+            now = time.time()
+            local = time.localtime(now)
+            minute = (local.tm_year, local.tm_yday, local.tm_hour, local.tm_min)
+            with self.cond:
+                due = []
+                for schedule in self.schedules.values():
+                    if schedule.get('cron'):
+                        if minute != last_minute and CronSchedule(schedule['cron']).matches(local):
+                            due.append(schedule)
+                    elif schedule['last_run'] is None or now - schedule['last_run'] >= schedule['every']:
+                        due.append(schedule)
+                for schedule in due:
+                    schedule['last_run'] = now
+            last_minute = minute
+            for schedule in due:
+                self.submit(dict(schedule, schedule_id=schedule['id']))
+            time.sleep(1)
+    #endregion
+
+    #region 请求处理
+    def handle_request(self, request: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """处理一条客户端请求，逐条产生响应"""
+        command = request.get('command')
+        if command == 'submit':
+            job = self.submit(request)
+            yield {'ok': True, 'job': job.to_dict()}
+            if request.get('wait'):
+                with self.cond:
+                    self.cond.wait_for(lambda: job.done)
+                yield {'ok': True, 'job': job.to_dict()}
+        elif command == 'status':
+            job = self.jobs.get(request.get('job_id'))
+            yield {'ok': True, 'job': job.to_dict()} if job else {'ok': False, 'error': '任务不存在'}
+        elif command == 'list':
+            with self.cond:
+                jobs = [job.to_dict() for job in self.jobs.values()]
+            yield {'ok': True, 'jobs': jobs}
+        elif command == 'tail':
+            yield from self.tail(request.get('job_id'), request.get('follow', False))
+        elif command == 'cancel':
+            yield {'ok': self.cancel(request.get('job_id'))}
+        elif command == 'schedule':
+            yield {'ok': True, 'schedule': self.add_schedule(request)}
+        elif command == 'schedules':
+            with self.cond:
+                schedules = [dict(schedule) for schedule in self.schedules.values()]
+            yield {'ok': True, 'schedules': schedules}
+        elif command == 'unschedule':
+            with self.cond:
+                removed = self.schedules.pop(request.get('schedule_id'), None)
+            yield {'ok': removed is not None}
+        elif command == 'metrics':
+            yield {'ok': True, 'metrics': self.metrics()}
+        elif command == 'shutdown':
+            yield {'ok': True}
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        else:
+            yield {'ok': False, 'error': f"未知命令: {command}"}
+
+    def tail(self, job_id: str, follow: bool) -> Iterator[Dict[str, Any]]:
+        """输出任务日志；follow 时持续输出直到任务结束"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            yield {'ok': False, 'error': '任务不存在'}
+            return
+        offset = 0
+        while True:
+            with self.cond:
+                start = max(offset - job.log_dropped, 0)
+                lines = job.log[start:]
+                offset = job.log_dropped + len(job.log)
+                done = job.done
+                if not lines and not done and follow:
+                    self.cond.wait(1.0)
+                    continue
+            for line in lines:
+                yield {'log': line}
+            if done or not follow:
+                yield {'ok': True, 'job': job.to_dict()}
+                return
+
+    def serve_forever(self):
+        """监听 Unix 套接字"""
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError("当前平台不支持 Unix 套接字，无法启动调度守护进程")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = _SchedulerServer(self.socket_path, _RequestHandler)
+        self.server.scheduler = self
+        threading.Thread(target=self.schedule_loop, daemon=True).start()
+        print(f"调度守护进程已启动: {self.socket_path}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        for lane in self.lanes.values():
+            lane.stop()
+        if self.server is not None:
+            self.server.shutdown()
+    #endregion
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class _SchedulerServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """每个连接处理一条 JSON 请求，响应为逐行 JSON"""
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            for response in self.server.scheduler.handle_request(request):
+                self.wfile.write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+                self.wfile.flush()
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response, ensure_ascii=False) + '\n').encode('utf-8'))
+
+
+#region 客户端
+def send_request(payload: Dict[str, Any], socket_path: str = DEFAULT_SOCKET) -> Iterator[Dict[str, Any]]:
+    """向守护进程发送请求，逐条返回响应"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(payload, ensure_ascii=False) + '\n').encode('utf-8'))
+        with sock.makefile('r', encoding='utf-8') as reader:
+            for line in reader:
+                yield json.loads(line)
+
+
+def parse_variables(items: List[str]) -> Dict[str, str]:
+    """解析 name=value 形式的变量"""
+    variables = {}
+    for item in items or []:
+        name, _, value = item.partition('=')
+        variables[name] = value
+    return variables
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="AutoBot 常驻调度守护进程及客户端")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help="Unix 套接字路径")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help="启动守护进程")
+    serve.add_argument('--display', help="默认显示器（默认取 DISPLAY 环境变量）")
+    serve.add_argument('--sim', help="使用模拟屏幕的画面清单试运行（见 sim_backend.py）")
+    run_log.add_log_arguments(serve)
+    metrics.add_metrics_arguments(serve)
+
+    for name, help_text in (('submit', "提交任务"), ('schedule', "添加定时计划")):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('workflow', help="工作流 JSON 文件")
+        p.add_argument('--priority', type=int, default=0, help="优先级，数值越大越先执行")
+        p.add_argument('--display', help="目标显示器")
+        p.add_argument('--name', help="任务名称")
+        p.add_argument('--var', action='append', help="变量 name=value，可重复")
+        if name == 'submit':
+            p.add_argument('--wait', action='store_true', help="等待任务结束")
+        else:
+            p.add_argument('--cron', help="cron 表达式，如 \"*/10 9-18 * * 1-5\"")
+            p.add_argument('--every', type=float, help="每隔多少秒执行一次")
+
+    for name, help_text in (('status', "查看任务状态"), ('cancel', "取消任务")):
+        sub.add_parser(name, help=help_text).add_argument('job_id')
+    tail = sub.add_parser('tail', help="查看任务日志")
+    tail.add_argument('job_id')
+    tail.add_argument('-f', '--follow', action='store_true', help="持续输出直到任务结束")
+    sub.add_parser('unschedule', help="删除定时计划").add_argument('schedule_id')
+    for name, help_text in (('list', "列出任务"), ('schedules', "列出定时计划"),
+                            ('metrics', "查看统计指标"), ('shutdown', "停止守护进程")):
+        sub.add_parser(name, help=help_text)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        run_log.setup_from_args(args)
+        daemon = SchedulerDaemon(args.socket, args.display, args.sim)
+        exporter = metrics.exporter_from_args(args, daemon.metrics_snapshot)
+        try:
+            daemon.serve_forever()
+        finally:
+            if exporter is not None:
+                exporter.stop()
+        return 0
+
+    payload = {key: value for key, value in vars(args).items()
+               if key not in ('socket', 'var') and value is not None}
+    if 'workflow' in payload:
+        payload['workflow'] = os.path.abspath(payload['workflow'])
+        payload['variables'] = parse_variables(args.var)
+
+    ok = True
+    for response in send_request(payload, args.socket):
+        if 'log' in response:
+            print(response['log'])
+            continue
+        ok = response.get('ok', False)
+        print(json.dumps({k: v for k, v in response.items() if k != 'ok'} or response,
+                         ensure_ascii=False, indent=2))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
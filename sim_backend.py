@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟屏幕后端
+代替 pyautogui 交给 AutoBot 使用：按虚拟时钟回放录制或脚本化的画面帧，
+根据当前帧回答图像定位请求，记录所有注入的输入，sleep 立即返回。
+可在无显示器的 CI 环境中快速、确定地回归测试工作流。
+
+画面清单（manifest）格式：
+{
+  "size": [1920, 1080],
+  "frames": [
+    {"at": 0, "image": "frame_000.png"},
+    {"at": 2.5, "targets": {"login.png": [640, 360]}},
+    {"after_inputs": 3, "targets": {"ok.png": [[100, 200], [100, 260]]}}
+  ]
+}
+at 为相对开始的虚拟秒数，after_inputs 为已注入的输入事件数，两个条件都满足的最后一帧即当前帧。
+image 帧用真实模板匹配回答定位；targets 帧按模板文件名直接给出中心坐标。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from collections import namedtuple
+from typing import Dict, List, Any, Optional
+
+import run_log
+import metrics
+
+Point = namedtuple('Point', 'x y')
+Box = namedtuple('Box', 'left top width height')
+
+
+class VirtualClock:
+    """虚拟时钟：sleep 只推进时间，不真正等待"""
+    def __init__(self, start: float = None):
+        self.start = time.time() if start is None else start
+        self.now = self.start
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            self.now += seconds
+
+    def elapsed(self) -> float:
+        """自开始以来经过的虚拟秒数"""
+        return self.now - self.start
+
+
+class SimulatedScreen:
+    """模拟的 pyautogui 后端，同时充当剪贴板"""
+
+    def __init__(self, frames: List[Dict[str, Any]], size=(1920, 1080),
+                 clock: VirtualClock = None, base_dir: str = '.', locate_cost: float = 0.0):
+        """
+        frames: 画面帧列表（格式见模块说明）
+        locate_cost: 每次定位消耗的虚拟秒数，用于模拟真实的截图和匹配耗时
+        """
+        self.frames = sorted(frames, key=lambda f: (f.get('at', 0), f.get('after_inputs', 0)))
+        self.screen_size = tuple(size)
+        self.clock = clock or VirtualClock()
+        self.base_dir = base_dir
+        self.locate_cost = locate_cost
+        self.events: List[Dict[str, Any]] = []
+        self.clipboard_text = ''
+        self.position = Point(self.screen_size[0] // 2, self.screen_size[1] // 2)
+        self._images: Dict[int, Any] = {}
+
+    @classmethod
+    def from_manifest(cls, filename: str, **kwargs) -> 'SimulatedScreen':
+        """从画面清单文件创建"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        kwargs.setdefault('size', manifest.get('size', (1920, 1080)))
+        kwargs.setdefault('base_dir', os.path.dirname(os.path.abspath(filename)))
+        return cls(manifest.get('frames', []), **kwargs)
+
+    #region 帧回放
+    def current_index(self) -> int:
+        """当前帧的下标"""
+        elapsed = self.clock.time() - self.clock.start
+        inputs = len(self.events)
+        index = 0
+        for i, frame in enumerate(self.frames):
+            if frame.get('at', 0) <= elapsed and frame.get('after_inputs', 0) <= inputs:
+                index = i
+        return index
+
+    def current_frame(self) -> Dict[str, Any]:
+        if not self.frames:
+            return {}
+        return self.frames[self.current_index()]
+
+    def _frame_image(self):
+        """加载当前帧的图像（带缓存），没有图像时返回 None"""
+        index = self.current_index()
+        frame = self.current_frame()
+        if 'image' not in frame:
+            return None
+        if index not in self._images:
+            from PIL import Image
+            image = frame['image']
+            if isinstance(image, str):
+                image = Image.open(os.path.join(self.base_dir, image)).convert('RGB')
+            elif not hasattr(image, 'convert'):
+                image = Image.fromarray(image)
+            self._images[index] = image
+        return self._images[index]
+
+    def _record(self, action: str, **args):
+        """记录一次注入的输入"""
+        self.events.append({'t': round(self.clock.time() - self.clock.start, 6),
+                            'action': action, **args})
+    #endregion
+
+    #region pyautogui 兼容接口
+    def size(self):
+        return self.screen_size
+
+    def screenshot(self, region=None):
+        image = self._frame_image()
+        if image is None:
+            from PIL import Image
+            image = Image.new('RGB', self.screen_size)
+        if region:
+            left, top, width, height = region
+            image = image.crop((left, top, left + width, top + height))
+        return image
+
+    def pixel(self, x: int, y: int):
+        return self.screenshot().getpixel((x, y))
+
+    def locateOnScreen(self, img, confidence: float = 0.999, grayscale: bool = None,
+                       region=None) -> Optional[Box]:
+        """在当前帧中定位图像，找不到返回 None"""
+        self.clock.sleep(self.locate_cost)
+        frame = self.current_frame()
+        targets = frame.get('targets', {})
+        # AutoBot 传入的是缓存的 PIL 图像，按其 filename 匹配脚本化目标
+        name = os.path.basename(img if isinstance(img, str) else getattr(img, 'filename', '') or '')
+        if name in targets:
+            center = targets[name]
+            if center and isinstance(center[0], (list, tuple)):
+                center = center[0]
+            if not center:
+                return None
+            return Box(center[0], center[1], 1, 1)
+
+        image = self._frame_image()
+        if image is None:
+            return None
+        import pyscreeze
+        try:
+            box = pyscreeze.locate(img, image, confidence=confidence,
+                                   grayscale=grayscale, region=region)
+        except pyscreeze.ImageNotFoundException:
+            return None
+        return Box(*(int(v) for v in box)) if box else None
+
+    def locateAllOnScreen(self, img, confidence: float = 0.999, grayscale: bool = None,
+                          region=None) -> List[Box]:
+        """在当前帧中定位图像的所有位置"""
+        self.clock.sleep(self.locate_cost)
+        frame = self.current_frame()
+        targets = frame.get('targets', {})
+        name = os.path.basename(img if isinstance(img, str) else getattr(img, 'filename', '') or '')
+        if name in targets:
+            centers = targets[name] or []
+            if centers and not isinstance(centers[0], (list, tuple)):
+                centers = [centers]
+            return [Box(x, y, 1, 1) for x, y in centers]
+
+        image = self._frame_image()
+        if image is None:
+            return []
+        import pyscreeze
+        try:
+            boxes = pyscreeze.locateAll(img, image, confidence=confidence,
+                                        grayscale=grayscale, region=region)
+            return [Box(*(int(v) for v in box)) for box in boxes]
+        except pyscreeze.ImageNotFoundException:
+            return []
+
+    def locateCenterOnScreen(self, img, **kwargs) -> Optional[Point]:
+        box = self.locateOnScreen(img, **kwargs)
+        if box is None:
+            return None
+        return Point(box.left + box.width // 2, box.top + box.height // 2)
+
+    def moveTo(self, x=None, y=None, duration=0.0, **kwargs):
+        self.position = Point(self.position.x if x is None else x,
+                              self.position.y if y is None else y)
+        self._record('move', x=self.position.x, y=self.position.y)
+        self.clock.sleep(duration)
+
+    def click(self, x=None, y=None, clicks=1, interval=0.0, duration=0.0, button='left', **kwargs):
+        if isinstance(x, tuple):
+            x, y = x[0], x[1]
+        if x is not None or y is not None:
+            self.position = Point(self.position.x if x is None else x,
+                                  self.position.y if y is None else y)
+        self._record('click', x=self.position.x, y=self.position.y,
+                     clicks=clicks, button=button)
+        self.clock.sleep(duration + interval * max(0, clicks - 1))
+
+    def scroll(self, clicks: int, x=None, y=None, **kwargs):
+        self._record('scroll', amount=clicks)
+
+    def hotkey(self, *keys, **kwargs):
+        self._record('hotkey', keys=list(keys))
+
+    def press(self, keys, presses=1, interval=0.0, **kwargs):
+        self._record('press', keys=keys if isinstance(keys, list) else [keys], presses=presses)
+        self.clock.sleep(interval * max(0, presses - 1))
+
+    def write(self, message: str, interval=0.0, **kwargs):
+        self._record('write', text=message)
+        self.clock.sleep(interval * len(message))
+
+    typewrite = write
+    #endregion
+
+    #region 剪贴板接口
+    def copy(self, text: str):
+        self.clipboard_text = str(text)
+        self._record('copy', text=self.clipboard_text)
+
+    def paste(self) -> str:
+        return self.clipboard_text
+    #endregion
+
+
+def create_sim_bot(screen: SimulatedScreen, image_root: str = None):
+    """创建绑定模拟屏幕的 AutoBot"""
+    from Autobot import AutoBot
+    return AutoBot(backend=screen, clipboard=screen, clock=screen.clock, image_root=image_root)
+
+
+def record_frames(out_dir: str, count: int, interval: float):
+    """录制真实屏幕，生成可回放的画面清单"""
+    import pyautogui
+    os.makedirs(out_dir, exist_ok=True)
+    frames = []
+    start = time.time()
+    for i in range(count):
+        name = f"frame_{i:03d}.png"
+        pyautogui.screenshot(os.path.join(out_dir, name))
+        frames.append({'at': round(time.time() - start, 3), 'image': name})
+        print(f"已录制第 {i+1}/{count} 帧")
+        if i + 1 < count:
+            time.sleep(interval)
+    manifest = {'size': list(pyautogui.size()), 'frames': frames}
+    filename = os.path.join(out_dir, 'manifest.json')
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return filename
+
+
+def dry_run(workflow_file: str, manifest_file: str, locate_cost: float = 0.0) -> Dict[str, Any]:
+    """在模拟屏幕上执行工作流，返回输入日志和耗时"""
+    from workflow_model import load_workflow_file
+    from workflow_executor import WorkflowExecutor
+
+    screen = SimulatedScreen.from_manifest(manifest_file, locate_cost=locate_cost)
+    bot = create_sim_bot(screen)
+    nodes, connections = load_workflow_file(workflow_file)
+    errors = []
+    executor = WorkflowExecutor(nodes, connections, bot,
+                                on_error=lambda node, e: errors.append(
+                                    {'node': node.id, 'type': node.type, 'error': str(e)}),
+                                workflow_file=workflow_file)
+    started = time.perf_counter()
+    executor.run()
+    return {
+        'virtual_seconds': screen.clock.elapsed(),
+        'real_seconds': time.perf_counter() - started,
+        'events': screen.events,
+        'errors': errors,
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="在模拟屏幕上快速执行工作流，或录制真实屏幕")
+    parser.add_argument('workflow', nargs='?', help="工作流 JSON 文件")
+    parser.add_argument('--screen', help="画面清单文件（manifest.json）")
+    parser.add_argument('--locate-cost', type=float, default=0.0, help="每次定位消耗的虚拟秒数")
+    parser.add_argument('--log', help="将输入日志写入该 JSON 文件")
+    parser.add_argument('--record', help="录制真实屏幕到该目录")
+    parser.add_argument('--count', type=int, default=10, help="录制帧数")
+    parser.add_argument('--interval', type=float, default=1.0, help="录制间隔（秒）")
+    run_log.add_log_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    run_log.setup_from_args(args)
+
+    if args.record:
+        print(f"画面清单已写入 {record_frames(args.record, args.count, args.interval)}")
+        return 0
+    if not args.workflow or not args.screen:
+        parser.error("需要指定工作流文件和 --screen 画面清单")
+
+    exporter = metrics.exporter_from_args(args)
+    result = dry_run(args.workflow, args.screen, args.locate_cost)
+    run_log.flush()
+    if exporter is not None:
+        exporter.stop()
+    print(f"虚拟耗时 {result['virtual_seconds']:.2f} 秒，实际耗时 {result['real_seconds']:.3f} 秒，"
+          f"输入事件 {len(result['events'])} 个，错误 {len(result['errors'])} 个")
+    if args.log:
+        with open(args.log, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 1 if result['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板存储
+按内容哈希保存模板图像，相同图像在不同工作流之间只存一份；
+彩色、灰度和金字塔各层以 .npy 文件保存，加载时内存映射，多个进程共享同一份页缓存，
+启动时无需再解码 PNG。目录结构：
+
+    images/.store/index.json                     源文件路径 -> (修改时间, 大小, 哈希)
+    images/.store/objects/ab/abcdef.../color.npy  BGR 彩色
+                                       gray.npy   灰度
+                                       pyr1.npy   灰度金字塔第 1 层（1/2 尺寸），以此类推
+"""
+
+import os
+import sys
+import json
+import glob
+import hashlib
+import argparse
+import threading
+from typing import Dict, List, Any
+
+import numpy as np
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+PYRAMID_LEVELS = 2  # 额外保存的金字塔层数
+MIN_PYRAMID_SIZE = 8  # 金字塔层的最小边长
+PRUNE_GRACE = 3600.0  # 清理时跳过最近这么多秒内写入的对象和临时目录（可能仍在被其他进程写入或登记）
+
+
+class TemplateArray(np.ndarray):
+    """带来源文件名的模板数组，可直接交给 pyscreeze/OpenCV"""
+    def __array_finalize__(self, obj):
+        self.filename = getattr(obj, 'filename', None)
+
+
+class Template:
+    """一个已解码的模板：彩色、灰度和金字塔各层（均为只读内存映射）"""
+    def __init__(self, digest: str, path: str, color: np.ndarray, gray: np.ndarray,
+                 pyramid: List[np.ndarray]):
+        self.digest = digest
+        self.path = path
+        self.color = color
+        self.gray = gray
+        self.pyramid = pyramid  # pyramid[0] 为原尺寸灰度，之后每层缩小一半
+
+    @property
+    def size(self):
+        return self.gray.shape[1], self.gray.shape[0]
+
+    def needle(self) -> TemplateArray:
+        """供定位后端使用的 BGR 数组（零拷贝视图）"""
+        needle = self.color.view(TemplateArray)
+        needle.filename = self.path
+        return needle
+
+
+#region 解码
+def decode_image(path: str) -> np.ndarray:
+    """解码图像文件为 BGR 数组"""
+    if cv2 is not None:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise IOError(f"无法读取图像: {path}")
+        return image
+    from PIL import Image
+    with Image.open(path) as image:
+        return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """BGR 转灰度（与 OpenCV 的权重一致）"""
+    if image.ndim == 2:
+        return image
+    if cv2 is not None:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    weights = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+    return np.clip(image.astype(np.float32) @ weights + 0.5, 0, 255).astype(np.uint8)
+
+
+def pyr_down(image: np.ndarray) -> np.ndarray:
+    """缩小一半（金字塔下一层）"""
+    if cv2 is not None:
+        return cv2.pyrDown(image)
+    h, w = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    blocks = image[:h, :w].astype(np.uint16)
+    return ((blocks[0::2, 0::2] + blocks[1::2, 0::2] + blocks[0::2, 1::2]
+             + blocks[1::2, 1::2] + 2) // 4).astype(np.uint8)
+#endregion
+
+
+class TemplateStore:
+    """基于内容哈希的模板存储"""
+
+    def __init__(self, image_root: str, levels: int = PYRAMID_LEVELS):
+        self.image_root = os.path.abspath(image_root)
+        self.root = os.path.join(self.image_root, '.store')
+        self.objects = os.path.join(self.root, 'objects')
+        self.index_path = os.path.join(self.root, 'index.json')
+        self.levels = levels
+        self._lock = threading.Lock()
+        self._index = self._read_index()
+        self._loaded: Dict[str, Template] = {}  # 哈希 -> 已映射的模板
+
+    #region 路径与索引
+    def resolve(self, img: str) -> str:
+        """解析模板路径：绝对路径 > image_root 下 > 当前工作目录下"""
+        if os.path.isabs(img):
+            candidates = [img]
+        else:
+            candidates = [os.path.join(self.image_root, img), os.path.abspath(img)]
+        for candidate in candidates:
+            if os.path.isfile(candidate):
+                return candidate
+        raise FileNotFoundError(f"找不到模板图像: {img}（已查找 {', '.join(candidates)}）")
+
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self):
+        """原子写入索引，并发写入时最后一个生效，丢失的条目会在下次重新计算"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def object_dir(self, digest: str) -> str:
+        return os.path.join(self.objects, digest[:2], digest)
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    #endregion
+
+    #region 导入与加载
+    def digest_for(self, path: str) -> str:
+        """获取源文件的内容哈希，文件未变化时直接使用索引"""
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._index.get(path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry['digest']
+        digest = self.hash_file(path)
+        with self._lock:
+            self._index[path] = {'mtime': stat.st_mtime, 'size': stat.st_size, 'digest': digest}
+            self._write_index()
+        return digest
+
+    def put(self, img: str) -> str:
+        """导入模板：解码并保存各层数组（内容相同的图像只保存一次），返回哈希"""
+        path = self.resolve(img)
+        digest = self.digest_for(path)
+        target = self.object_dir(digest)
+        if os.path.isdir(target):
+            return digest
+
+        color = decode_image(path)
+        gray = to_gray(color)
+        arrays = {'color': color, 'gray': gray}
+        level = gray
+        for i in range(1, self.levels + 1):
+            if min(level.shape[:2]) < MIN_PYRAMID_SIZE * 2:
+                break
+            level = pyr_down(level)
+            arrays[f'pyr{i}'] = level
+
+        # 先写入临时目录再改名，避免其他进程读到不完整的对象
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(array))
+        try:
+            os.rename(tmp, target)
+        except OSError:
+            # 其他进程已经写入了同一对象
+            for name in arrays:
+                os.remove(os.path.join(tmp, f'{name}.npy'))
+            os.rmdir(tmp)
+        return digest
+
+    def get(self, img: str) -> Template:
+        """获取模板（首次使用时自动导入），数组以只读方式内存映射"""
+        path = self.resolve(img)
+        digest = self.put(path)
+        template = self._loaded.get(digest)
+        if template is not None:
+            if template.path != path:
+                # 内容相同的另一个文件，共享数组
+                template = Template(digest, path, template.color, template.gray, template.pyramid)
+            return template
+
+        directory = self.object_dir(digest)
+        load = lambda name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        pyramid = [load('gray')]
+        for i in range(1, self.levels + 1):
+            if not os.path.exists(os.path.join(directory, f'pyr{i}.npy')):
+                break
+            pyramid.append(load(f'pyr{i}'))
+        template = Template(digest, path, load('color'), pyramid[0], pyramid)
+        with self._lock:
+            self._loaded[digest] = template
+        return template
+
+    def needle(self, img: str) -> TemplateArray:
+        """获取供定位后端使用的模板数组"""
+        return self.get(img).needle()
+
+    def import_directory(self, directory: str = None) -> Dict[str, str]:
+        """导入目录下的所有图像，返回 路径 -> 哈希"""
+        directory = directory or self.image_root
+        result = {}
+        for ext in IMAGE_EXTENSIONS:
+            for path in glob.glob(os.path.join(directory, '**', f'*{ext}'), recursive=True):
+                if os.sep + '.store' + os.sep not in path:
+                    result[path] = self.put(path)
+        return result
+    #endregion
+
+    def stats(self) -> Dict[str, Any]:
+        """统计源文件数、去重后的对象数和占用空间"""
+        objects = glob.glob(os.path.join(self.objects, '*', '*'))
+        objects = [d for d in objects if not d.endswith('.tmp')]
+        size = sum(os.path.getsize(f) for d in objects for f in glob.glob(os.path.join(d, '*.npy')))
+        return {'sources': len(self._index), 'objects': len(objects), 'bytes': size}
+
+    def prune(self, grace: float = PRUNE_GRACE) -> int:
+        """删除索引中已不存在的源文件以及不再被引用的对象，返回删除的对象数
+
+        其他进程可能正在写入 .tmp 目录，或刚写完对象还没写入索引，所以只删除 grace 秒之前的条目；
+        超过 grace 的 .tmp 目录是崩溃遗留的，一并删除
+        """
+        import time
+        import shutil
+        with self._lock:
+            self._index = {path: entry for path, entry in self._index.items()
+                           if os.path.isfile(path)}
+            self._write_index()
+            referenced = {entry['digest'] for entry in self._index.values()}
+        removed = 0
+        cutoff = time.time() - grace
+        for directory in glob.glob(os.path.join(self.objects, '*', '*')):
+            try:
+                if os.path.getmtime(directory) > cutoff:
+                    continue
+            except OSError:
+                continue  # 临时目录刚被改名或删除
+            if directory.endswith('.tmp'):
+                shutil.rmtree(directory, ignore_errors=True)
+            elif os.path.basename(directory) not in referenced:
+                shutil.rmtree(directory, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="模板存储：预先解码图像并按内容去重")
+    parser.add_argument('--root', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'images'), help="图像根目录")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('import', help="导入图像").add_argument(
+        'paths', nargs='*', help="图像文件或目录（默认导入整个图像根目录）")
+    sub.add_parser('stats', help="查看存储统计")
+    sub.add_parser('prune', help="清理不再引用的对象")
+    args = parser.parse_args(argv)
+
+    store = TemplateStore(args.root)
+    if args.command == 'import':
+        imported = {}
+        for path in args.paths or [args.root]:
+            if os.path.isdir(path):
+                imported.update(store.import_directory(path))
+            else:
+                imported[path] = store.put(path)
+        print(f"已导入 {len(imported)} 个图像，去重后 {len(set(imported.values()))} 个对象")
+    elif args.command == 'stats':
+        print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    elif args.command == 'prune':
+        print(f"已删除 {store.prune()} 个对象")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
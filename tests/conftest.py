@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""测试共用设置：模块位于仓库根目录，直接加入导入路径"""
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def write_json(tmp_path):
+    """把字典写成 tmp_path 下的 JSON 文件，返回路径"""
+    def write(name, data):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding='utf-8')
+        return str(path)
+    return write
+
+
+def workflow(nodes, connections=()):
+    """由 {编号: (类型, 参数)} 和 (起点, 终点) 列表构建工作流字典"""
+    return {
+        'nodes': {node_id: {'type': node_type, 'x': 0, 'y': 0, 'params': dict(params)}
+                  for node_id, (node_type, params) in nodes.items()},
+        'connections': [{'from': a, 'to': b} for a, b in connections],
+    }
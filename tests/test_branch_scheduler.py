@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from conftest import workflow
+from workflow_model import Node, workflow_from_dict, load_workflow_data
+from workflow_executor import (WorkflowExecutor, PlanCache, node_resources,
+                               SCREEN, CLIPBOARD)
+
+
+class RecordingBot:
+    """记录调用顺序和所在线程的 AutoBot 替身"""
+    def __init__(self):
+        self.calls = []
+        self.threads = {}
+        self.lock = threading.Lock()
+
+    def _record(self, call):
+        with self.lock:
+            self.calls.append(call)
+            self.threads[call] = threading.current_thread()
+
+    def hotkey(self, *keys):
+        self._record('+'.join(keys))
+
+    def wait(self, seconds):
+        self._record(f'wait {seconds}')
+
+    def run_command(self, command):
+        self._record(command)
+
+
+def executor_for(data, bot, workflow_file=None, **kwargs):
+    nodes, connections = workflow_from_dict(data)
+    return WorkflowExecutor(nodes, connections, bot, workflow_file=workflow_file,
+                            plans=PlanCache(), **kwargs)
+
+
+def test_node_resources():
+    assert node_resources(Node('a', 'wait', 0, 0)) == frozenset()
+    assert node_resources(Node('a', 'run_command', 0, 0)) == frozenset()
+    assert node_resources(Node('a', 'input_text', 0, 0)) == {SCREEN, CLIPBOARD}
+    assert node_resources(Node('a', 'click_left', 0, 0)) == {SCREEN}
+    assert node_resources(Node('a', 'hotkey', 0, 0)) == {SCREEN}
+
+
+def test_loop_resources_include_body():
+    data = workflow({'loop': ('for_loop', {'loop_count': 2}), 'w': ('wait', {}),
+                     'end': ('loop_end', {}), 'after': ('hotkey', {})},
+                    [('loop', 'w'), ('w', 'end'), ('end', 'after')])
+    executor = executor_for(data, RecordingBot())
+    assert executor.resources_of('loop') == frozenset()
+
+    data['nodes']['w']['type'] = 'hotkey'
+    executor = executor_for(data, RecordingBot())
+    assert executor.resources_of('loop') == {SCREEN}
+
+
+def test_subflow_resources_resolve_against_parent(tmp_path, write_json):
+    (tmp_path / 'sub').mkdir()
+    write_json('sub/inner.json', workflow({'w': ('wait', {})}))
+    write_json('sub/outer.json', workflow({'s': ('subflow', {'workflow': 'inner.json'})}))
+    main = write_json('main.json', workflow({'s': ('subflow', {'workflow': 'sub/outer.json'}),
+                                             'v': ('subflow', {'workflow': '${name}.json'}),
+                                             'm': ('subflow', {'workflow': 'missing.json'})}))
+    executor = executor_for(load_workflow_data(main), RecordingBot(), workflow_file=main)
+    assert executor.resources_of('s') == frozenset()
+    # 路径含变量或无法加载时按需要屏幕处理
+    assert executor.resources_of('v') == {SCREEN}
+    assert executor.resources_of('m') == {SCREEN}
+
+
+def test_subflow_cycle_needs_screen(write_json):
+    write_json('a.json', workflow({'s': ('subflow', {'workflow': 'b.json'})}))
+    write_json('b.json', workflow({'s': ('subflow', {'workflow': 'a.json'})}))
+    main = write_json('main.json', workflow({'s': ('subflow', {'workflow': 'a.json'})}))
+    executor = executor_for(load_workflow_data(main), RecordingBot(), workflow_file=main)
+    assert executor.resources_of('s') == {SCREEN}
+
+
+BRANCHY = workflow({'root': ('hotkey', {'keys': 'a'}),
+                    'left': ('hotkey', {'keys': 'b'}),
+                    'right': ('hotkey', {'keys': 'c'}),
+                    'join': ('hotkey', {'keys': 'd'}),
+                    'tail': ('hotkey', {'keys': 'e'}),
+                    'side': ('wait', {'seconds': 0}),
+                    'cmd': ('run_command', {'command': 'cmd'})},
+                   [('root', 'left'), ('root', 'right'), ('left', 'join'),
+                    ('right', 'join'), ('join', 'tail'), ('root', 'side'), ('side', 'cmd')])
+
+
+def test_ui_order_matches_sequential():
+    sequential = RecordingBot()
+    executed = executor_for(BRANCHY, sequential).run()
+    scheduled = RecordingBot()
+    executed_scheduled = executor_for(BRANCHY, scheduled, branch_workers=2).run()
+
+    assert executed == executed_scheduled == set(BRANCHY['nodes'])
+    ui_calls = [c for c in scheduled.calls if len(c) == 1]
+    assert ui_calls == [c for c in sequential.calls if len(c) == 1] == ['a', 'b', 'd', 'e', 'c']
+
+
+def test_resource_free_branch_runs_in_pool():
+    bot = RecordingBot()
+    executor_for(BRANCHY, bot, branch_workers=2).run()
+    main = threading.current_thread()
+    assert bot.threads['a'] is main and bot.threads['e'] is main
+    assert bot.threads['wait 0'] is not main
+    assert bot.threads['cmd'] is not main
+
+
+def test_on_error_called_on_calling_thread():
+    data = workflow({'w': ('run_command', {'command': 'boom'}), 'h': ('hotkey', {'keys': 'x'})},
+                    [('w', 'h')])
+
+    class FailingBot(RecordingBot):
+        def run_command(self, command):
+            super().run_command(command)
+            raise RuntimeError('命令失败')
+
+    seen = []
+    bot = FailingBot()
+    executor = executor_for(data, bot, branch_workers=2,
+                            on_error=lambda node, e: seen.append((node.id, threading.current_thread())))
+    executor.run()
+    assert bot.threads['boom'] is not threading.current_thread()
+    assert seen == [('w', threading.current_thread())]
+    assert executor.error_count == 1
+    # 出错的节点返回后仍继续执行后续节点，与顺序执行一致
+    assert 'x' in bot.calls
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from scheduler_daemon import parse_cron_field, CronSchedule
+
+
+def at(year, month, day, hour, minute):
+    return time.localtime(time.mktime((year, month, day, hour, minute, 0, 0, 0, -1)))
+
+
+@pytest.mark.parametrize('field, low, high, expected', [
+    ('*', 0, 5, {0, 1, 2, 3, 4, 5}),
+    ('*/2', 0, 6, {0, 2, 4, 6}),
+    ('3', 0, 59, {3}),
+    ('9-12', 0, 23, {9, 10, 11, 12}),
+    ('10-20/5', 0, 59, {10, 15, 20}),
+    ('1,3,5-6', 0, 7, {1, 3, 5, 6}),
+])
+def test_parse_field(field, low, high, expected):
+    assert parse_cron_field(field, low, high) == expected
+
+
+@pytest.mark.parametrize('field', ['60', '5-70', '*/0', 'x'])
+def test_parse_field_rejects_invalid(field):
+    with pytest.raises(ValueError):
+        parse_cron_field(field, 0, 59)
+
+
+def test_expression_needs_five_fields():
+    with pytest.raises(ValueError):
+        CronSchedule('* * * *')
+
+
+def test_matches_weekday_window():
+    schedule = CronSchedule('*/10 9-18 * * 1-5')
+    assert schedule.matches(at(2024, 1, 8, 9, 30))       # 周一
+    assert not schedule.matches(at(2024, 1, 8, 9, 31))   # 分钟不整除
+    assert not schedule.matches(at(2024, 1, 8, 19, 0))   # 超出时段
+    assert not schedule.matches(at(2024, 1, 7, 10, 0))   # 周日
+
+
+def test_sunday_is_zero_or_seven():
+    sunday = at(2024, 1, 7, 0, 0)
+    assert CronSchedule('0 0 * * 0').matches(sunday)
+    assert CronSchedule('0 0 * * 7').matches(sunday)
+    assert not CronSchedule('0 0 * * 1').matches(sunday)
+
+
+def test_day_and_month():
+    schedule = CronSchedule('0 12 1 6 *')
+    assert schedule.matches(at(2024, 6, 1, 12, 0))
+    assert not schedule.matches(at(2024, 7, 1, 12, 0))
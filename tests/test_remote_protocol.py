@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import socket
+import hashlib
+import threading
+
+import pytest
+from PIL import Image
+
+from conftest import workflow
+import remote_agent
+from remote_agent import (FrameConnection, ProtocolError, RemoteAgent, AgentClient, Bundle,
+                          RemoteError, parse_address, FRAME, PROTOCOL_VERSION)
+
+
+@pytest.fixture
+def pair():
+    a, b = socket.socketpair()
+    left, right = FrameConnection(a), FrameConnection(b)
+    yield left, right
+    left.close()
+    right.close()
+
+
+@pytest.fixture
+def agent(tmp_path, write_json):
+    manifest = write_json('manifest.json', {'frames': [{'at': 0, 'targets': {'ok.png': [100, 200]}}]})
+    return RemoteAgent(str(tmp_path / 'agent'), sim_manifest=manifest, token='secret', name='test')
+
+
+def test_frame_round_trip(pair):
+    left, right = pair
+    left.send({'op': 'put', 'ref': '名字'}, b'\x00' * 70000)
+    left.send({'op': 'have'})
+    assert right.recv() == ({'op': 'put', 'ref': '名字'}, b'\x00' * 70000)
+    assert right.recv() == ({'op': 'have'}, b'')
+
+
+def test_clean_close_returns_none(pair):
+    left, right = pair
+    left.sock.shutdown(socket.SHUT_WR)
+    assert right.recv() == (None, b'')
+
+
+def test_bad_frames_raise(pair):
+    left, right = pair
+    left.sock.sendall(FRAME.pack(remote_agent.MAX_HEADER + 1, 0))
+    with pytest.raises(ProtocolError):
+        right.recv()
+    header = b'[1, 2]'
+    left.sock.sendall(FRAME.pack(len(header), 0) + header)
+    with pytest.raises(ProtocolError):
+        right.recv()
+
+
+def test_parse_address():
+    assert parse_address('10.0.0.2:7800') == (socket.AF_INET, ('10.0.0.2', 7800))
+    assert parse_address('agent-host') == (socket.AF_INET, ('agent-host', remote_agent.DEFAULT_PORT))
+    assert parse_address(':7800') == (socket.AF_INET, ('127.0.0.1', 7800))
+    assert parse_address('[::1]:7800') == (socket.AF_INET6, ('::1', 7800))
+    with pytest.raises(ValueError):
+        parse_address('host:port')
+
+
+def test_refs_cannot_escape_blobs(agent):
+    digest = hashlib.sha256(b'data').hexdigest()
+    assert agent.path_of(f'{digest}/a.png').startswith(agent.blobs)
+    for ref in ('../../etc/passwd', f'{digest}/..', f'{digest}/../x', f'{digest}/a\\b',
+                f'{digest.upper()}/a.png', None):
+        with pytest.raises(ValueError):
+            agent.path_of(ref)
+
+
+def test_store_checks_hash(agent):
+    digest = hashlib.sha256(b'data').hexdigest()
+    agent.store(f'{digest}/a.png', b'data')
+    with open(agent.path_of(f'{digest}/a.png'), 'rb') as f:
+        assert f.read() == b'data'
+    with pytest.raises(ValueError):
+        agent.store(f'{digest}/b.png', b'other')
+
+
+def test_authenticate(agent):
+    hello = {'op': 'hello', 'version': PROTOCOL_VERSION}
+    assert agent.authenticate(dict(hello, token='secret'))
+    assert not agent.authenticate(dict(hello, token='wrong'))
+    assert not agent.authenticate(hello)
+    assert not agent.authenticate(dict(hello, token='secret', version=PROTOCOL_VERSION + 1))
+    agent.token = None
+    assert agent.authenticate(hello)
+
+
+def test_non_local_address_needs_token(agent):
+    agent.token = None
+    with pytest.raises(ValueError):
+        agent.serve_forever('0.0.0.0:0')
+
+
+def make_bundle(tmp_path, write_json):
+    images = tmp_path / 'images'
+    images.mkdir()
+    Image.new('RGB', (8, 8), 'red').save(images / 'ok.png')
+    write_json('sub.json', workflow({'k': ('hotkey', {'keys': 'ctrl+s'})}))
+    main = write_json('main.json', workflow({'c': ('click_left', {'img': 'ok.png'}),
+                                             's': ('subflow', {'workflow': 'sub.json'})},
+                                            [('c', 's')]))
+    return Bundle(main, str(images))
+
+
+def test_bundle_refs(tmp_path, write_json):
+    bundle = make_bundle(tmp_path, write_json)
+    assert bundle.missing == []
+    assert len(bundle.files) == 3
+    for ref, data in bundle.files.items():
+        assert ref.split('/')[0] == hashlib.sha256(data).hexdigest()
+    assert bundle.workflow.endswith('/main.json')
+    assert sorted(ref.split('/')[1] for ref in bundle.files) == ['main.json', 'ok.png', 'sub.json']
+
+
+def test_run_on_agent(tmp_path, write_json, agent):
+    bundle = make_bundle(tmp_path, write_json)
+    addresses = []
+    ready = threading.Event()
+    thread = threading.Thread(target=agent.serve_forever, daemon=True,
+                              args=('127.0.0.1:0', lambda actual: (addresses.append(actual), ready.set())))
+    thread.start()
+    assert ready.wait(10)
+    try:
+        with pytest.raises(RemoteError):
+            AgentClient(addresses[0], token='wrong')
+        client = AgentClient(addresses[0], token='secret')
+        try:
+            assert client.info['agent'] == 'test' and client.info['sim']
+            events = []
+            result = client.run(bundle, 'job-1', on_event=events.append)
+            assert result['status'] == 'ok', result['errors']
+            actions = [(e['action'], e.get('x'), e.get('y'), e.get('keys')) for e in result['inputs']]
+            assert ('click', 100, 200, None) in actions
+            assert actions[-1] == ('hotkey', None, None, ['ctrl', 's'])
+            assert all(e['job_id'] == 'job-1' for e in events)
+            # 第二次执行不再上传代理已有的文件
+            assert client.sync(bundle) == 0
+            assert client.run(bundle, 'job-2')['status'] == 'ok'
+        finally:
+            client.close()
+    finally:
+        agent.shutdown()
+        thread.join(10)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import random
+
+from retry_policy import RetryPolicy, ClickResult
+from sim_backend import VirtualClock
+
+
+def failing(results):
+    """依次返回 results 中的值，用完后一直返回 None"""
+    values = iter(results)
+    return lambda: next(values, None)
+
+
+def test_delays_grow_exponentially_and_cap():
+    policy = RetryPolicy(base_delay=0.1, multiplier=2.0, max_delay=0.5, jitter=0.0)
+    delays = policy.delays()
+    assert [round(next(delays), 6) for _ in range(5)] == [0.1, 0.2, 0.4, 0.5, 0.5]
+
+
+def test_delays_jitter_stays_in_bounds():
+    policy = RetryPolicy(base_delay=1.0, multiplier=1.0, max_delay=1.0, jitter=0.2,
+                         rng=random.Random(1))
+    delays = policy.delays()
+    for _ in range(100):
+        assert 0.8 <= next(delays) <= 1.2
+
+
+def test_attempts_limit():
+    clock = VirtualClock(start=0)
+    policy = RetryPolicy(attempts=3, jitter=0.0)
+    result, count, elapsed = policy.run(failing([]), clock)
+    assert result is None
+    assert count == 3
+    assert elapsed == clock.elapsed() == 0.1 + 0.2
+
+
+def test_success_stops_retrying():
+    clock = VirtualClock(start=0)
+    result, count, _ = RetryPolicy(attempts=5, jitter=0.0).run(failing([None, 'hit']), clock)
+    assert (result, count) == ('hit', 2)
+
+
+def test_deadline_bounds_total_wait():
+    clock = VirtualClock(start=0)
+    policy = RetryPolicy(attempts=None, deadline=1.0, base_delay=0.1, max_delay=0.4, jitter=0.0)
+    result, count, elapsed = policy.run(failing([]), clock)
+    assert result is None
+    # 0.1 + 0.2 + 0.4 + 0.3（截到时限）
+    assert count == 5
+    assert abs(elapsed - 1.0) < 1e-9
+
+
+def test_from_params_prefers_timeout():
+    assert RetryPolicy.from_params(retry=3).attempts == 3
+    assert RetryPolicy.from_params(retry=0).attempts == 1
+    policy = RetryPolicy.from_params(retry=3, timeout=2.5)
+    assert policy.attempts is None and policy.deadline == 2.5
+
+
+def test_on_change_retries_as_soon_as_screen_changes():
+    clock = VirtualClock(start=0)
+    # 画面在 0.1 秒后变化
+    fingerprint = lambda: clock.elapsed() >= 0.1
+    policy = RetryPolicy(attempts=2, base_delay=1.0, jitter=0.0, on_change=True, change_interval=0.05)
+    _, count, elapsed = policy.run(failing([]), clock, fingerprint)
+    assert count == 2
+    assert elapsed < 0.2
+
+
+def test_click_result_is_truthy_when_found():
+    assert ClickResult(True, 1, 0.0)
+    assert not ClickResult(False, 3, 0.5)
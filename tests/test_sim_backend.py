@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from PIL import Image
+
+from conftest import workflow
+from sim_backend import VirtualClock, SimulatedScreen, Box, Point, create_sim_bot, dry_run
+
+
+def test_virtual_clock():
+    clock = VirtualClock(start=100.0)
+    clock.sleep(2.5)
+    clock.sleep(-1)
+    assert clock.time() == clock.monotonic() == 102.5
+    assert clock.elapsed() == 2.5
+
+
+def test_frame_selection_by_time_and_inputs():
+    screen = SimulatedScreen([{'at': 0, 'name': 'start'},
+                              {'at': 2, 'name': 'later'},
+                              {'after_inputs': 1, 'at': 3, 'name': 'clicked'}],
+                             clock=VirtualClock(start=0))
+    assert screen.current_frame()['name'] == 'start'
+    screen.clock.sleep(3)
+    assert screen.current_frame()['name'] == 'later'  # 还没有输入
+    screen.click(10, 20)
+    assert screen.current_frame()['name'] == 'clicked'
+    assert screen.events == [{'t': 3, 'action': 'click', 'x': 10, 'y': 20, 'clicks': 1, 'button': 'left'}]
+
+
+def test_targets_matched_by_basename(tmp_path):
+    screen = SimulatedScreen([{'targets': {'ok.png': [[5, 6], [7, 8]], 'gone.png': []}}],
+                             locate_cost=0.5)
+    image = Image.new('RGB', (4, 4))
+    image.filename = str(tmp_path / 'nested' / 'ok.png')
+    assert screen.locateOnScreen(image) == Box(5, 6, 1, 1)
+    assert screen.locateCenterOnScreen('ok.png') == Point(5, 6)
+    assert screen.locateAllOnScreen('ok.png') == [Box(5, 6, 1, 1), Box(7, 8, 1, 1)]
+    assert screen.locateOnScreen('gone.png') is None
+    assert screen.locateOnScreen('other.png') is None  # 帧没有图像
+    assert screen.clock.elapsed() == 2.5
+
+
+def test_clipboard_and_keyboard_are_recorded():
+    screen = SimulatedScreen([], clock=VirtualClock(start=0))
+    screen.copy('你好')
+    screen.hotkey('ctrl', 'v')
+    screen.write('ab', interval=0.5)
+    assert screen.paste() == '你好'
+    assert [e['action'] for e in screen.events] == ['copy', 'hotkey', 'write']
+    assert screen.clock.elapsed() == 1.0
+
+
+def test_sim_bot_waits_on_virtual_clock(tmp_path):
+    screen = SimulatedScreen([], clock=VirtualClock(start=0))
+    bot = create_sim_bot(screen, str(tmp_path))
+    bot.wait(30)
+    assert screen.clock.elapsed() == 30
+
+
+def test_dry_run(tmp_path, write_json):
+    images = tmp_path / 'images'
+    images.mkdir()
+    Image.new('RGB', (8, 8), 'blue').save(images / 'login.png')
+    manifest = write_json('manifest.json', {
+        'frames': [{'at': 0, 'targets': {}},
+                   {'at': 5, 'targets': {'login.png': [640, 360]}}]})
+    flow = write_json('flow.json', workflow(
+        {'w': ('wait', {'seconds': 5}),
+         'c': ('click_left', {'img': str(images / 'login.png'), 'on_fail': 'error'}),
+         'h': ('hotkey', {'keys': 'ctrl+a'})},
+        [('w', 'c'), ('c', 'h')]))
+    result = dry_run(flow, manifest)
+    assert result['errors'] == []
+    assert result['virtual_seconds'] >= 5
+    assert [(e['action'], e.get('x'), e.get('y')) for e in result['events']][-2:] == [
+        ('click', 640, 360), ('hotkey', None, None)]
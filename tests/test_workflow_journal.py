@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import json
+
+from conftest import workflow
+from workflow_model import replay, load_workflow_data, load_workflow_file, JOURNAL_SUFFIX
+from workflow_journal import WorkflowJournal
+from workflow_executor import PlanCache
+
+
+def edges(data):
+    return [(conn['from'], conn['to']) for conn in data['connections']]
+
+
+def test_replay_applies_ops_in_order():
+    data = workflow({'node_1': ('wait', {'seconds': 1})})
+    replay(data, [
+        {'op': 'add', 'id': 'node_2', 'type': 'hotkey', 'x': 5, 'y': 6},
+        {'op': 'conn', 'from': 'node_1', 'to': 'node_2'},
+        {'op': 'move', 'id': 'node_1', 'x': 10, 'y': 20},
+        {'op': 'params', 'id': 'node_2', 'params': {'keys': 'ctrl+a'}},
+    ])
+    assert data['nodes']['node_1']['x'] == 10 and data['nodes']['node_1']['y'] == 20
+    assert data['nodes']['node_2']['params'] == {'keys': 'ctrl+a'}
+    assert edges(data) == [('node_1', 'node_2')]
+
+
+def test_replay_follows_canvas_rules():
+    data = workflow({'a': ('wait', {}), 'b': ('wait', {})})
+    replay(data, [
+        {'op': 'conn', 'from': 'a', 'to': 'a'},        # 自环
+        {'op': 'conn', 'from': 'a', 'to': 'missing'},  # 悬空
+        {'op': 'conn', 'from': 'a', 'to': 'b'},
+        {'op': 'conn', 'from': 'a', 'to': 'b'},        # 重复
+    ])
+    assert edges(data) == [('a', 'b')]
+    replay(data, [{'op': 'del', 'id': 'b'}])
+    assert list(data['nodes']) == ['a'] and edges(data) == []
+    replay(data, [{'op': 'clear'}])
+    assert data['nodes'] == {} and data['connections'] == []
+
+
+def test_replay_is_idempotent():
+    ops = [{'op': 'add', 'id': 'b', 'type': 'wait', 'x': 0, 'y': 0},
+           {'op': 'conn', 'from': 'a', 'to': 'b'},
+           {'op': 'disconn', 'from': 'a', 'to': 'b'},
+           {'op': 'conn', 'from': 'a', 'to': 'b'}]
+    once = workflow({'a': ('wait', {})})
+    replay(once, ops)
+    twice = workflow({'a': ('wait', {})})
+    replay(twice, ops)
+    replay(twice, ops)
+    assert once == twice
+
+
+def test_readers_see_journaled_edits(write_json):
+    path = write_json('w.json', workflow({'node_1': ('wait', {})}))
+    journal = WorkflowJournal(path)
+    journal.append({'op': 'add', 'id': 'node_2', 'type': 'hotkey', 'x': 0, 'y': 0})
+    journal.append({'op': 'conn', 'from': 'node_1', 'to': 'node_2'})
+    journal.close()
+
+    assert edges(load_workflow_data(path)) == [('node_1', 'node_2')]
+    nodes, connections = load_workflow_file(path)
+    assert sorted(nodes) == ['node_1', 'node_2'] and len(connections) == 1
+
+    plans = PlanCache()
+    assert plans.get(path).successors['node_1'] == ['node_2']
+    journal.append({'op': 'del', 'id': 'node_2'})
+    journal.close()
+    assert list(plans.get(path).nodes) == ['node_1']
+
+
+def test_torn_last_line_is_skipped(write_json):
+    path = write_json('w.json', workflow({'node_1': ('wait', {})}))
+    with open(path + JOURNAL_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write('{"op":"add","id":"node_2","type":"wait","x":0,"y":0}\n{"op":"add","id":"nod')
+    assert sorted(load_workflow_data(path)['nodes']) == ['node_1', 'node_2']
+    # 之后追加的操作另起一行，不与写了一半的行拼在一起
+    journal = WorkflowJournal(path)
+    journal.append({'op': 'add', 'id': 'node_3', 'type': 'wait', 'x': 0, 'y': 0})
+    journal.close()
+    assert sorted(load_workflow_data(path)['nodes']) == ['node_1', 'node_2', 'node_3']
+
+
+def test_compact_writes_snapshot_and_empties_journal(write_json):
+    path = write_json('w.json', workflow({'node_1': ('wait', {})}))
+    journal = WorkflowJournal(path, compact_ops=2)
+    nodes, connections = journal.load()
+    for op in ({'op': 'add', 'id': 'node_2', 'type': 'wait', 'x': 0, 'y': 0},
+               {'op': 'conn', 'from': 'node_1', 'to': 'node_2'}):
+        journal.append(op)
+    assert journal.needs_compaction
+    nodes, connections = WorkflowJournal(path).load()
+    journal.compact(nodes, connections)
+
+    assert not journal.needs_compaction
+    with open(path + JOURNAL_SUFFIX, encoding='utf-8') as f:
+        assert f.read() == ''
+    with open(path, encoding='utf-8') as f:
+        assert edges(json.load(f)) == [('node_1', 'node_2')]
+    reloaded = WorkflowJournal(path)
+    assert sorted(reloaded.load()[0]) == ['node_1', 'node_2'] and reloaded.ops == 0
+
+
+def test_missing_file_loads_empty(tmp_path):
+    journal = WorkflowJournal(str(tmp_path / 'untitled.json'))
+    assert journal.load() == ({}, [])
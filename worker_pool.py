@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多显示器工作进程池
+为每个工作进程启动独立的 Xvfb 虚拟显示器和目标程序实例，每个显示器绑定一个 AutoBot，
+在独立进程中并行执行排队的工作流或数据分片，并负责健康检查、崩溃重启和结果收集
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import shlex
+import shutil
+import argparse
+import subprocess
+import multiprocessing
+from typing import Dict, List, Any, Optional
+
+import run_log
+import metrics
+
+DEFAULT_SCREEN = '1920x1080x24'
+DEFAULT_BASE_DISPLAY = 90
+MAX_JOB_ATTEMPTS = 2  # 工作进程崩溃时任务最多执行的次数
+
+
+def _worker_main(worker_id: int, display: str, jobs, results, log_settings: Dict[str, Any] = None):
+    """工作进程入口：绑定显示器后循环执行任务"""
+    # pyautogui 在导入时读取 DISPLAY，必须先设置环境变量再导入 AutoBot
+    os.environ['DISPLAY'] = display
+    run_log.setup_logging(**(log_settings or {}))
+    from Autobot import AutoBot
+    from workflow_model import load_workflow_file, apply_variables
+    from workflow_executor import WorkflowExecutor, BRANCH_WORKERS
+
+    bot = AutoBot()
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        errors = []
+        started = time.time()
+        try:
+            nodes, connections = load_workflow_file(job['workflow'])
+            apply_variables(nodes, job.get('variables'))
+            executor = WorkflowExecutor(
+                nodes, connections, bot,
+                on_error=lambda node, e: errors.append(
+                    {'node': node.id, 'type': node.type, 'error': str(e)}),
+                workflow_file=job['workflow'], branch_workers=BRANCH_WORKERS)
+            executor.run()
+            status = 'failed' if errors else 'ok'
+        except Exception as e:
+            errors.append({'error': f"{type(e).__name__}: {e}"})
+            status = 'failed'
+        results.put({'job_id': job['id'], 'worker': worker_id,
+                     'display': display, 'status': status, 'errors': errors,
+                     'started': started, 'seconds': time.time() - started,
+                     'metrics': metrics.REGISTRY.snapshot()})
+
+
+class DisplaySlot:
+    """一个虚拟显示器及其目标程序和工作进程"""
+    def __init__(self, worker_id: int, display_number: int):
+        self.worker_id = worker_id
+        self.display_number = display_number
+        self.display = f":{display_number}"
+        self.xvfb: Optional[subprocess.Popen] = None
+        self.app: Optional[subprocess.Popen] = None
+        self.process: Optional[multiprocessing.Process] = None
+        self.jobs = None
+        self.current_job: Optional[Dict[str, Any]] = None
+        self.restarts = 0
+
+    @property
+    def socket_path(self) -> str:
+        return f"/tmp/.X11-unix/X{self.display_number}"
+
+    def display_alive(self) -> bool:
+        """Xvfb 进程存活且 X 套接字存在"""
+        return (self.xvfb is not None and self.xvfb.poll() is None
+                and os.path.exists(self.socket_path))
+
+
+class WorkerPool:
+    """多显示器工作进程池"""
+
+    def __init__(self, size: int, app_command: str = None, screen: str = DEFAULT_SCREEN,
+                 base_display: int = DEFAULT_BASE_DISPLAY, health_interval: float = 2.0):
+        if shutil.which('Xvfb') is None:
+            raise RuntimeError("未找到 Xvfb，请先安装（如 apt install xvfb）")
+        self.size = size
+        self.app_command = app_command
+        self.screen = screen
+        self.health_interval = health_interval
+        self.context = multiprocessing.get_context('spawn')
+        self.results = self.context.Queue()
+        self.slots = [DisplaySlot(i, base_display + i) for i in range(size)]
+        self.pending: List[Dict[str, Any]] = []
+        self.attempts: Dict[str, int] = {}
+        self.finished: Dict[str, Dict[str, Any]] = {}
+        self.job_counter = 0
+        self.worker_metrics: Dict[int, Dict[str, Any]] = {}  # 各工作进程最近回传的指标快照
+
+    #region 显示器与进程管理
+    def start_display(self, slot: DisplaySlot, timeout: float = 10.0):
+        """启动 Xvfb 并等待 X 套接字就绪"""
+        slot.xvfb = subprocess.Popen(
+            ['Xvfb', slot.display, '-screen', '0', self.screen, '-nolisten', 'tcp'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + timeout
+        while not slot.display_alive():
+            if slot.xvfb.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"虚拟显示器 {slot.display} 启动失败")
+            time.sleep(0.05)
+        if self.app_command:
+            self.start_app(slot)
+
+    def start_app(self, slot: DisplaySlot):
+        """在显示器上启动目标程序"""
+        env = dict(os.environ, DISPLAY=slot.display)
+        slot.app = subprocess.Popen(shlex.split(self.app_command), env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def start_worker(self, slot: DisplaySlot):
+        """启动绑定该显示器的工作进程"""
+        slot.jobs = self.context.Queue()
+        slot.current_job = None
+        slot.process = self.context.Process(
+            target=_worker_main, args=(slot.worker_id, slot.display, slot.jobs, self.results,
+                                       run_log.child_settings(f'w{slot.worker_id}')),
+            daemon=True)
+        slot.process.start()
+
+    def stop_slot(self, slot: DisplaySlot):
+        """停止工作进程、目标程序和显示器"""
+        if slot.process is not None and slot.process.is_alive():
+            slot.process.terminate()
+            slot.process.join(5)
+        for proc in (slot.app, slot.xvfb):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(5)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        slot.process = slot.app = slot.xvfb = None
+
+    def restart_slot(self, slot: DisplaySlot, reason: str):
+        """重启整个显示器槽位，并把未完成的任务放回队列"""
+        print(f"工作进程 {slot.worker_id} ({slot.display}) 重启：{reason}")
+        job = slot.current_job
+        self.stop_slot(slot)
+        slot.restarts += 1
+        if job is not None:
+            self.requeue(job, f"{reason}（工作进程 {slot.worker_id}）")
+        self.start_display(slot)
+        self.start_worker(slot)
+
+    def start(self):
+        """启动所有显示器和工作进程"""
+        for slot in self.slots:
+            self.start_display(slot)
+            self.start_worker(slot)
+        print(f"已启动 {self.size} 个虚拟显示器")
+
+    def stop(self):
+        """停止所有工作进程和显示器"""
+        for slot in self.slots:
+            if slot.process is not None and slot.process.is_alive():
+                slot.jobs.put(None)
+        for slot in self.slots:
+            if slot.process is not None:
+                slot.process.join(5)
+            self.stop_slot(slot)
+    #endregion
+
+    #region 任务调度
+    def submit(self, workflow: str, variables: Dict[str, Any] = None) -> str:
+        """提交一次工作流运行，返回任务编号"""
+        self.job_counter += 1
+        job = {'id': f"job_{self.job_counter}", 'workflow': os.path.abspath(workflow),
+               'variables': variables or {}}
+        self.pending.append(job)
+        self.attempts[job['id']] = 0
+        return job['id']
+
+    def submit_shards(self, workflow: str, items: List[Any], var: str = 'item') -> List[str]:
+        """把数据拆成分片，每个分片作为一次运行，通过 ${var} 传入工作流"""
+        return [self.submit(workflow, {var: item}) for item in items]
+
+    def requeue(self, job: Dict[str, Any], reason: str):
+        """崩溃后重试任务，超过次数则记为失败"""
+        if self.attempts[job['id']] < MAX_JOB_ATTEMPTS:
+            self.pending.insert(0, job)
+        else:
+            self.finished[job['id']] = {'job_id': job['id'], 'status': 'crashed',
+                                        'errors': [{'error': reason}]}
+
+    def dispatch(self):
+        """把排队的任务分配给空闲的工作进程"""
+        for slot in self.slots:
+            if not self.pending:
+                return
+            if slot.current_job is None and slot.process is not None and slot.process.is_alive():
+                job = self.pending.pop(0)
+                self.attempts[job['id']] += 1
+                slot.current_job = job
+                slot.jobs.put(job)
+
+    def collect(self, timeout: float):
+        """接收工作进程回报的事件"""
+        try:
+            message = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return
+        slot = self.slots[message['worker']]
+        self.worker_metrics[message['worker']] = message.pop('metrics', None)
+        message['attempts'] = self.attempts.get(message['job_id'], 1)
+        self.finished[message['job_id']] = message
+        if slot.current_job is not None and slot.current_job['id'] == message['job_id']:
+            slot.current_job = None
+        print(f"任务 {message['job_id']} 在工作进程 {message['worker']} 上完成："
+              f"{message['status']}（{message['seconds']:.1f} 秒）")
+
+    def check_health(self):
+        """健康检查：显示器、目标程序或工作进程退出时重启"""
+        for slot in self.slots:
+            if not slot.display_alive():
+                self.restart_slot(slot, "虚拟显示器已退出")
+            elif slot.process is None or not slot.process.is_alive():
+                self.restart_slot(slot, "工作进程已退出")
+            elif self.app_command and (slot.app is None or slot.app.poll() is not None):
+                print(f"工作进程 {slot.worker_id} ({slot.display}) 的目标程序已退出，重新启动")
+                self.start_app(slot)
+
+    def wait(self) -> Dict[str, Dict[str, Any]]:
+        """运行直到所有任务完成，返回各任务结果"""
+        last_check = 0.0
+        while self.pending or len(self.finished) < len(self.attempts):
+            self.dispatch()
+            self.collect(timeout=0.2)
+            if time.time() - last_check >= self.health_interval:
+                self.check_health()
+                last_check = time.time()
+        return self.finished
+
+    def metrics_snapshot(self) -> Dict[str, Any]:
+        """合并所有工作进程的指标快照"""
+        return metrics.merge_snapshots(list(self.worker_metrics.values()))
+
+    def worker_summary(self) -> List[Dict[str, Any]]:
+        """按工作进程汇总结果"""
+        summary = []
+        for slot in self.slots:
+            runs = [r for r in self.finished.values() if r.get('worker') == slot.worker_id]
+            summary.append({
+                'worker': slot.worker_id,
+                'display': slot.display,
+                'restarts': slot.restarts,
+                'runs': len(runs),
+                'failed': sum(1 for r in runs if r['status'] != 'ok'),
+                'busy_seconds': sum(r.get('seconds', 0) for r in runs),
+            })
+        return summary
+    #endregion
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="在多个虚拟显示器上并行运行工作流")
+    parser.add_argument('workflows', nargs='+', help="工作流 JSON 文件")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="虚拟显示器/工作进程数量")
+    parser.add_argument('--app', help="在每个显示器上启动的目标程序命令")
+    parser.add_argument('--screen', default=DEFAULT_SCREEN, help="显示器尺寸，如 1920x1080x24")
+    parser.add_argument('--base-display', type=int, default=DEFAULT_BASE_DISPLAY,
+                        help="起始显示器编号")
+    parser.add_argument('--shards', help="数据分片文件，每行一个分片")
+    parser.add_argument('--var', default='item', help="分片在工作流中的变量名")
+    parser.add_argument('--output', help="将结果写入该 JSON 文件")
+    run_log.add_log_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args(argv)
+    run_log.setup_from_args(args)
+
+    pool = WorkerPool(args.workers, app_command=args.app, screen=args.screen,
+                      base_display=args.base_display)
+    for workflow in args.workflows:
+        if args.shards:
+            with open(args.shards, 'r', encoding='utf-8') as f:
+                items = [line.strip() for line in f if line.strip()]
+            pool.submit_shards(workflow, items, args.var)
+        else:
+            pool.submit(workflow)
+
+    exporter = metrics.exporter_from_args(args, pool.metrics_snapshot)
+    pool.start()
+    try:
+        results = pool.wait()
+    finally:
+        pool.stop()
+        if exporter is not None:
+            exporter.stop()
+
+    report = {'jobs': list(results.values()), 'workers': pool.worker_summary()}
+    failed = sum(1 for r in results.values() if r['status'] != 'ok')
+    print(f"共 {len(results)} 个任务，失败 {failed} 个")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作流执行器
+按连接顺序驱动 AutoBot 执行节点，不依赖 PyQt，可在无界面环境中运行
+"""
+
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Callable, Optional
+from workflow_model import (Node, Connection, JOURNAL_SUFFIX, connection_pairs, graph_from_dict,
+                            read_workflow_bytes, decode_workflow, apply_variables)
+from retry_policy import RetryPolicy
+from run_log import get_logger, current_node
+from metrics import REGISTRY, SECONDS_BUCKETS
+
+log = get_logger('executor')
+
+NODE_MS = REGISTRY.histogram('executor_node_ms', "节点执行耗时（毫秒）", labels=('type',))
+NODE_ERRORS = REGISTRY.counter('executor_node_errors_total', "节点出错次数", ('type',))
+RUNS = REGISTRY.counter('executor_runs_total', "工作流运行次数", ('status',))
+RUN_SECONDS = REGISTRY.histogram('executor_run_seconds', "工作流运行耗时（秒）", SECONDS_BUCKETS)
+BRANCH_TASKS = REGISTRY.counter('executor_branch_tasks_total', "分支调度执行的单元数", ('lane',))
+SUBFLOW_PLANS = REGISTRY.counter('executor_subflow_plans_total', "子工作流执行计划缓存命中/编译次数",
+                                 ('result',))
+
+
+LOOP_TYPES = ('for_loop', 'for_each_match')
+
+# for_each_match 对每个匹配执行的动作：(点击次数, 按键)
+MATCH_ACTIONS = {
+    'click_left': (1, 'left'),
+    'double_click': (2, 'left'),
+    'click_right': (1, 'right'),
+    'none': None,
+}
+
+
+CLICK_TYPES = ('click_left', 'double_click', 'click_right')
+PROBE_TYPES = ('pixel_check', 'color_region_check')
+# 点击未找到或条件不满足时：stop 跳过后续节点，continue 继续执行，error 交给错误处理并跳过后续节点
+ON_FAIL_ACTIONS = ('stop', 'continue', 'error')
+MAX_SUBFLOW_DEPTH = 16  # 子工作流最多嵌套层数
+
+# 节点需要的资源：screen 为鼠标键盘输入或读取屏幕，clipboard 为剪贴板。
+# 未列出的类型（点击、滚动、热键、条件、逐个匹配）需要 screen；不需要资源的节点可以与其他分支并发执行
+SCREEN = 'screen'
+CLIPBOARD = 'clipboard'
+NODE_RESOURCES = {
+    'input_text': (SCREEN, CLIPBOARD),
+    'paste_time': (SCREEN, CLIPBOARD),
+    'wait': (),
+    'run_command': (),
+    'for_loop': (),
+    'loop_end': (),
+}
+BRANCH_WORKERS = 4  # 真实屏幕上运行时，不需要资源的分支使用的线程数
+
+# 工作线程中暂存的 on_error 调用，由调度线程取回后再调用（界面的错误处理只能在界面线程中执行）
+_deferred = threading.local()
+
+
+def node_resources(node: Node) -> frozenset:
+    """单个节点需要的资源（不展开循环体和子工作流）"""
+    return frozenset(NODE_RESOURCES.get(node.type, (SCREEN,)))
+
+
+def _call_on_error(on_error: Callable[[Node, Exception], None], node: Node, error: Exception):
+    sink = getattr(_deferred, 'errors', None)
+    if sink is not None:
+        sink.append((on_error, node, error))
+    else:
+        on_error(node, error)
+
+
+def split_hotkey(keys: str) -> List[str]:
+    """将热键字符串（如 ctrl+c 或 ctrl,c）拆分为按键列表"""
+    return [key.strip() for key in keys.replace('+', ',').split(',')]
+
+
+def _int_list(value) -> List[int]:
+    if isinstance(value, str):
+        value = value.replace('，', ',').split(',')
+    try:
+        return [int(float(v)) for v in value]
+    except (ValueError, TypeError):
+        raise ValueError(f"无效的数值 {value}") from None
+
+
+def parse_color(value) -> Tuple[int, int, int]:
+    """解析颜色：#RRGGBB、r,g,b 或 [r, g, b]"""
+    if isinstance(value, str) and value.strip().startswith('#'):
+        text = value.strip().lstrip('#')
+        try:
+            if len(text) != 6:
+                raise ValueError
+            return tuple(int(text[i:i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            raise ValueError(f"无效的颜色 {value}") from None
+    color = _int_list(value)
+    if len(color) != 3 or not all(0 <= c <= 255 for c in color):
+        raise ValueError(f"无效的颜色 {value}")
+    return tuple(color)
+
+
+def parse_points(value) -> List[Tuple[int, int]]:
+    """解析坐标列表：x,y;x,y 或 [[x, y], ...]"""
+    items = [p for p in value.split(';') if p.strip()] if isinstance(value, str) else value
+    points = [tuple(_int_list(item)) for item in items]
+    if not points or any(len(p) != 2 for p in points):
+        raise ValueError(f"无效的坐标列表 {value}")
+    return points
+
+
+def parse_region(value) -> Tuple[int, int, int, int]:
+    """解析区域：left,top,width,height"""
+    region = _int_list(value)
+    if len(region) != 4 or region[2] <= 0 or region[3] <= 0:
+        raise ValueError(f"无效的区域 {value}")
+    return tuple(region)
+
+
+def parse_bindings(value) -> Dict[str, str]:
+    """解析子工作流的参数绑定：name=value;name=value（也可换行分隔）或 {"name": value}"""
+    if isinstance(value, dict):
+        return {str(name): var_value for name, var_value in value.items()}
+    bindings = {}
+    for item in str(value or '').replace('\n', ';').split(';'):
+        if not item.strip():
+            continue
+        name, sep, var_value = item.partition('=')
+        if not sep or not name.strip():
+            raise ValueError(f"无效的参数绑定 {item.strip()}（应为 name=value）")
+        bindings[name.strip()] = var_value.strip()
+    return bindings
+
+
+def resolve_workflow_path(workflow: str, parent_file: str = None) -> str:
+    """解析子工作流路径：相对路径先相对上级工作流所在目录查找，再相对当前目录"""
+    if not workflow:
+        raise ValueError("子工作流未指定 workflow 文件")
+    if not os.path.isabs(workflow) and parent_file:
+        candidate = os.path.join(os.path.dirname(parent_file), workflow)
+        if os.path.isfile(candidate):
+            return os.path.abspath(candidate)
+    return os.path.abspath(workflow)
+
+
+class ExecutionPlan:
+    """编译后的工作流：后继索引只建立一次，多次执行（包括作为子工作流）共享"""
+
+    def __init__(self, nodes: Dict[str, Node], connections: List[Connection], path: str = None):
+        self.path = path
+        self.nodes = nodes
+        self.connections = connections
+        self.successors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+        self.has_input = set()
+        for from_node, to_node in connection_pairs(connections):
+            self.successors.setdefault(from_node, []).append(to_node)
+            self.has_input.add(to_node)
+        self._templated: Optional[List[str]] = None
+
+    def start_nodes(self) -> List[str]:
+        return [node_id for node_id in self.nodes if node_id not in self.has_input]
+
+    @property
+    def templated(self) -> List[str]:
+        """参数中含 ${name} 的节点"""
+        if self._templated is None:
+            self._templated = [node_id for node_id, node in self.nodes.items()
+                               if any(isinstance(v, str) and '${' in v for v in node.params.values())]
+        return self._templated
+
+    def bind(self, variables: Dict[str, str]) -> Dict[str, Node]:
+        """代入参数绑定后的节点表：只复制引用了变量的节点，其余节点与计划共享（不应修改）"""
+        if not variables or not self.templated:
+            return self.nodes
+        bound = {}
+        for node_id in self.templated:
+            source = self.nodes[node_id]
+            node = Node(source.id, source.type, source.x, source.y)
+            node.params = dict(source.params)
+            bound[node_id] = node
+        apply_variables(bound, variables)
+        nodes = dict(self.nodes)
+        nodes.update(bound)
+        return nodes
+
+
+def file_key(path: str) -> Optional[Tuple[float, int]]:
+    """文件的修改时间和大小，文件不存在时为 None"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class PlanCache:
+    """子工作流执行计划缓存
+
+    文件及其编辑日志的修改时间和大小未变时直接命中；变化时比较内容的 SHA-256，
+    内容相同（如只是被重新保存）仍沿用原计划
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[tuple, str, ExecutionPlan]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, filename: str) -> ExecutionPlan:
+        path = os.path.abspath(filename)
+        key = (file_key(path), file_key(path + JOURNAL_SUFFIX))  # 编辑器未压缩的日志也算作文件内容
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                SUBFLOW_PLANS.labels('hit').inc()
+                return entry[2]
+        snapshot, journal = read_workflow_bytes(path)
+        digest = hashlib.sha256(snapshot + b'\0' + journal).hexdigest()
+        if entry is not None and entry[1] == digest:
+            plan, result = entry[2], 'hit'
+        else:
+            nodes, connections = graph_from_dict(decode_workflow(snapshot, journal))
+            plan, result = ExecutionPlan(nodes, connections, path), 'miss'
+        with self._lock:
+            self._entries[path] = (key, digest, plan)
+            if result == 'hit':
+                self.hits += 1
+            else:
+                self.misses += 1
+        SUBFLOW_PLANS.labels(result).inc()
+        return plan
+
+
+# 进程内共享的子工作流计划缓存
+PLANS = PlanCache()
+
+
+class WorkflowExecutor:
+    """工作流执行器"""
+
+    def __init__(self, nodes: Dict[str, Node], connections: List[Connection], autobot,
+                 on_error: Optional[Callable[[Node, Exception], None]] = None,
+                 workflow_file: str = None, plans: PlanCache = None,
+                 plan: ExecutionPlan = None, call_stack: Tuple[str, ...] = (),
+                 branch_workers: int = 0):
+        """workflow_file: 工作流所在文件，子工作流的相对路径相对它解析
+        plan: 已编译的计划（执行子工作流时由缓存提供），nodes 可以是其代入参数后的节点表
+        call_stack: 上级工作流文件，用于发现循环引用
+        branch_workers: 大于 0 时按资源调度分支（见 BranchScheduler），不需要资源的分支用这么多线程并发执行；
+            0 为按连接顺序逐个执行。虚拟时钟（模拟屏幕）上的等待不能并发，应保持 0
+        """
+        self.nodes = nodes
+        self.connections = connections
+        self.autobot = autobot
+        self.on_error = on_error or self.print_error
+        self.error_count = 0
+        self.workflow_file = os.path.abspath(workflow_file) if workflow_file else None
+        self.plans = plans if plans is not None else PLANS
+        self.call_stack = call_stack
+        self.branch_workers = branch_workers
+        self._error_lock = threading.Lock()
+        self._resources: Dict[str, frozenset] = {}
+        if plan is not None:
+            self.successors, self.has_input = plan.successors, plan.has_input
+        else:
+            self.compile()
+
+    def compile(self):
+        """预先建立后继节点索引，避免执行时反复扫描全部连接"""
+        plan = ExecutionPlan(self.nodes, self.connections, self.workflow_file)
+        self.successors, self.has_input = plan.successors, plan.has_input
+
+    def next_nodes(self, node_id: str) -> List[str]:
+        """获取节点的后续节点（按连接添加顺序）"""
+        return self.successors.get(node_id, [])
+
+    def find_start_nodes(self) -> List[str]:
+        """找到起始节点（没有输入连接的节点）"""
+        return [node_id for node_id in self.nodes if node_id not in self.has_input]
+
+    def run(self, start_nodes: List[str] = None):
+        """从所有起始节点执行工作流"""
+        if start_nodes is None:
+            start_nodes = self.find_start_nodes()
+        errors_before = self.error_count
+        started = time.perf_counter()
+        executed = self.execute_from_starts(start_nodes)
+        RUN_SECONDS.observe(time.perf_counter() - started)
+        RUNS.labels('failed' if self.error_count > errors_before else 'ok').inc()
+        return executed
+
+    def execute_from_starts(self, start_nodes: List[str]) -> set:
+        """从起始节点执行，返回执行过的节点"""
+        executed = set()
+        if self.branch_workers > 0:
+            BranchScheduler(self, self.branch_workers).run(start_nodes, executed)
+        else:
+            for start_node in start_nodes:
+                self.execute_from_node(start_node, executed)
+        return executed
+
+    def execute_from_node(self, node_id: str, executed: set):
+        """从指定节点开始执行"""
+        if node_id in executed or node_id not in self.nodes:
+            return
+
+        executed.add(node_id)
+        node = self.nodes[node_id]
+
+        # 检查是否为for_loop节点
+        if node.type == 'for_loop':
+            self.execute_for_loop(node)
+
+            # 循环执行完毕后，查找loop_end节点并继续执行其后续节点
+            self.execute_after_loop(node_id, executed)
+        elif node.type == 'for_each_match':
+            self.execute_match_loop(node)
+            self.execute_after_loop(node_id, executed)
+        else:
+            # 执行普通节点操作，条件不满足时不执行后续节点
+            if not self.execute_node_operation(node):
+                return
+
+            # 执行后续节点
+            for next_node in self.next_nodes(node_id):
+                self.execute_from_node(next_node, executed)
+
+    def execute_for_loop(self, node: Node):
+        """按次数重复执行循环体"""
+        loop_count = node.params.get('loop_count', 3)
+        loop_name = node.params.get('loop_name', '循环1')
+
+        # 获取循环体的所有节点路径
+        loop_body_paths = self.find_loop_body_paths(node.id)
+
+        # 执行循环
+        for i in range(loop_count):
+            log.info("执行 %s 第 %d/%d 次", loop_name, i + 1, loop_count,
+                     extra={'node': node.id, 'action': 'for_loop', 'params': {'iteration': i + 1}})
+            self.execute_loop_paths(loop_body_paths)
+
+    def execute_unit(self, node_id: str) -> bool:
+        """执行一个调度单元：普通节点，或整个循环（循环体在单元内顺序执行）；返回是否继续执行后续节点"""
+        node = self.nodes[node_id]
+        if node.type == 'for_loop':
+            self.execute_for_loop(node)
+            return True
+        if node.type == 'for_each_match':
+            self.execute_match_loop(node)
+            return True
+        return self.execute_node_operation(node)
+
+    def nodes_after(self, node_id: str, executed: set) -> List[str]:
+        """调度单元之后要执行的节点：循环为其 loop_end 之后的节点（loop_end 记为已执行）"""
+        if self.nodes[node_id].type not in LOOP_TYPES:
+            return self.next_nodes(node_id)
+        after = []
+        for loop_end_id in self.find_loop_end_nodes(node_id):
+            if loop_end_id not in executed:
+                executed.add(loop_end_id)
+                after += self.next_nodes(loop_end_id)
+        return after
+
+    def resources_of(self, node_id: str) -> frozenset:
+        """调度单元需要的资源：循环包括整个循环体，子工作流包括被引用的全部节点"""
+        resources = self._resources.get(node_id)
+        if resources is None:
+            node = self.nodes[node_id]
+            resources = self.subflow_resources(node) if node.type == 'subflow' else node_resources(node)
+            if node.type in LOOP_TYPES:
+                for path in self.find_loop_body_paths(node_id):
+                    for body_id in path:
+                        body = self.nodes[body_id]
+                        resources |= (self.subflow_resources(body) if body.type == 'subflow'
+                                      else node_resources(body))
+            self._resources[node_id] = resources
+        return resources
+
+    def subflow_resources(self, node: Node, stack: Tuple[str, ...] = (),
+                          parent_file: str = None) -> frozenset:
+        """子工作流需要的资源，无法确定（路径含变量、文件无法加载、循环引用）时按需要屏幕处理
+
+        parent_file: 子工作流节点所在的文件，相对路径相对它解析（默认为本工作流文件）
+        """
+        try:
+            path = resolve_workflow_path(node.params.get('workflow', ''), parent_file or self.workflow_file)
+            if '${' in path or path in stack or len(stack) >= MAX_SUBFLOW_DEPTH:
+                return frozenset((SCREEN,))
+            plan = self.plans.get(path)
+        except (OSError, ValueError):
+            return frozenset((SCREEN,))
+        resources = frozenset()
+        for child in plan.nodes.values():
+            resources |= (self.subflow_resources(child, stack + (path,), path) if child.type == 'subflow'
+                          else node_resources(child))
+        return resources
+
+    def execute_loop_paths(self, loop_body_paths: List[List[str]]):
+        """执行一次完整的循环体路径"""
+        for path in loop_body_paths:
+            for path_node in path:
+                if path_node in self.nodes:
+                    node_obj = self.nodes[path_node]
+                    if node_obj.type != 'loop_end':  # 不执行loop_end节点
+                        if not self.execute_node_operation(node_obj):
+                            break  # 条件不满足，跳过这条路径的剩余节点
+
+    def execute_match_loop(self, node: Node):
+        """截屏一次找出所有匹配，对每个匹配执行动作和循环体"""
+        img = node.params.get('img', 'target.png')
+        confidence = node.params.get('confidence', 0.9)
+        action = node.params.get('action', 'click_left')
+        loop_name = node.params.get('loop_name', '匹配循环')
+        try:
+            if action not in MATCH_ACTIONS:
+                raise ValueError(f"未知的动作 {action}，可选：{', '.join(MATCH_ACTIONS)}")
+            matches = self.autobot.locate_all(img, confidence)
+        except Exception as e:
+            self.report_error(node, e)
+            return
+
+        loop_body_paths = self.find_loop_body_paths(node.id)
+        for i, (x, y) in enumerate(matches):
+            log.info("执行 %s 第 %d/%d 个匹配 (%d, %d)", loop_name, i + 1, len(matches), x, y,
+                     extra={'node': node.id, 'action': 'for_each_match',
+                            'params': {'iteration': i + 1, 'x': x, 'y': y}})
+            if MATCH_ACTIONS[action] is not None:
+                clicks, button = MATCH_ACTIONS[action]
+                try:
+                    self.autobot.click_at(x, y, clicks, button)
+                except Exception as e:
+                    self.report_error(node, e)
+                    continue
+            self.execute_loop_paths(loop_body_paths)
+
+    def find_loop_body_paths(self, loop_node_id: str):
+        """找到循环体的所有执行路径（从for_loop到loop_end之间的节点）"""
+        paths = []
+
+        # 为每个起始节点构建执行路径，直到遇到loop_end节点
+        for start_node in self.next_nodes(loop_node_id):
+            current_path = []
+            self.build_execution_path_until_end(start_node, current_path, paths, set())
+
+        return paths if paths else [[]]  # 如果没有路径，返回空路径列表
+
+    def build_execution_path_until_end(self, node_id: str, current_path: list, all_paths: list, visited: set):
+        """递归构建执行路径，直到遇到loop_end节点"""
+        if node_id in visited or node_id not in self.nodes:
+            return
+
+        visited.add(node_id)
+        current_path.append(node_id)
+
+        # 检查是否为loop_end节点
+        node = self.nodes[node_id]
+        if node.type == 'loop_end':
+            # 遇到循环结束节点，当前路径结束
+            all_paths.append(current_path.copy())
+            return
+
+        # 找到当前节点的后续节点
+        next_nodes = self.next_nodes(node_id)
+
+        if not next_nodes:  # 如果没有后续节点且不是loop_end，当前路径结束
+            all_paths.append(current_path.copy())
+        else:
+            # 继续构建路径
+            for next_node in next_nodes:
+                self.build_execution_path_until_end(next_node, current_path, all_paths, visited.copy())
+
+        current_path.pop()  # 回溯
+
+    def execute_after_loop(self, loop_node_id: str, executed: set):
+        """执行循环结束后的节点"""
+        # 查找与此循环相关的loop_end节点
+        loop_end_nodes = self.find_loop_end_nodes(loop_node_id)
+
+        # 执行loop_end节点之后的节点
+        for loop_end_id in loop_end_nodes:
+            if loop_end_id not in executed:
+                executed.add(loop_end_id)
+                # 执行loop_end节点后续的所有节点
+                for next_node in self.next_nodes(loop_end_id):
+                    self.execute_from_node(next_node, executed)
+
+    def find_loop_end_nodes(self, loop_node_id: str):
+        """查找与指定循环节点相关的loop_end节点"""
+        loop_end_nodes = []
+
+        # 从循环节点开始，递归查找所有可达的loop_end节点
+        visited = set()
+        self.search_loop_end_nodes(loop_node_id, loop_end_nodes, visited)
+
+        return loop_end_nodes
+
+    def search_loop_end_nodes(self, node_id: str, loop_end_nodes: list, visited: set):
+        """递归搜索loop_end节点"""
+        if node_id in visited or node_id not in self.nodes:
+            return
+
+        visited.add(node_id)
+        node = self.nodes[node_id]
+
+        # 如果是loop_end节点，添加到结果中
+        if node.type == 'loop_end':
+            loop_end_nodes.append(node_id)
+            return  # 找到loop_end后停止搜索
+
+        # 继续搜索后续节点
+        for next_node in self.next_nodes(node_id):
+            self.search_loop_end_nodes(next_node, loop_end_nodes, visited)
+
+    def execute_loop_body(self, node_id: str, executed: set):
+        """执行循环体内的节点"""
+        if node_id in executed or node_id not in self.nodes:
+            return
+
+        executed.add(node_id)
+        node = self.nodes[node_id]
+
+        # 如果遇到另一个循环节点，递归处理
+        if node.type in LOOP_TYPES:
+            self.execute_from_node(node_id, executed)
+        else:
+            # 执行普通节点操作
+            if not self.execute_node_operation(node):
+                return
+
+            # 执行后续节点
+            for next_node in self.next_nodes(node_id):
+                self.execute_loop_body(next_node, executed)
+
+    def execute_node_operation(self, node: Node) -> bool:
+        """执行节点操作，返回是否继续执行后续节点（条件节点不满足且 on_fail 为 stop 时返回 False）
+
+        执行期间记录的事件都带有该节点 id；详细模式下另记一条带参数和耗时的节点事件
+        """
+        token = current_node.set(node.id)
+        started = time.perf_counter()
+        try:
+            return self.dispatch_operation(node)
+        finally:
+            elapsed = time.perf_counter() - started
+            NODE_MS.labels(node.type).observe(elapsed * 1000)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("节点 %s 完成", node.type,
+                          extra={'action': node.type, 'params': dict(node.params),
+                                 'elapsed': round(elapsed, 6)})
+            current_node.reset(token)
+
+    def dispatch_operation(self, node: Node) -> bool:
+        """按节点类型调用 AutoBot"""
+        try:
+            if node.type in CLICK_TYPES:
+                return self.execute_click(node)
+
+            elif node.type == 'input_text':
+                text = node.params.get('text', '')
+                clear = node.params.get('clear', False)
+                if text:
+                    self.autobot.input_text(text, clear)
+
+            elif node.type == 'wait':
+                seconds = node.params.get('seconds', 1.0)
+                self.autobot.wait(seconds)
+
+            elif node.type == 'scroll':
+                amount = node.params.get('amount', 100)
+                repeat = node.params.get('repeat', 1)
+                self.autobot.scroll(amount, repeat)
+
+            elif node.type == 'hotkey':
+                keys = node.params.get('keys', 'ctrl+c')
+                repeat = node.params.get('repeat', 1)
+                # 将热键字符串拆分成多个参数
+                key_list = split_hotkey(keys)
+                for _ in range(repeat):
+                    self.autobot.hotkey(*key_list)
+
+            elif node.type in PROBE_TYPES:
+                return self.execute_probe(node)
+
+            elif node.type == 'subflow':
+                self.execute_subflow(node)
+
+            elif node.type == 'paste_time':
+                self.autobot.paste_time(node.params.get('time_format', '%Y-%m-%d %H:%M:%S'))
+
+            elif node.type == 'run_command':
+                command = node.params.get('command', '')
+                if command:
+                    self.autobot.run_command(command)
+
+            elif node.type in LOOP_TYPES:
+                # 循环节点不执行具体操作，只是标记循环开始
+                # 实际的循环逻辑在execute_from_node中处理
+                pass
+
+            elif node.type == 'loop_end':
+                # loop_end节点本身不执行具体操作，仅作为循环结束的标记
+                log.info("循环结束标记: %s", node.params.get('end_name', '循环结束'),
+                         extra={'action': 'loop_end'})
+
+        except Exception as e:
+            self.report_error(node, e)
+        return True
+
+    def execute_click(self, node: Node) -> bool:
+        """执行点击节点，按重试策略定位；旧工作流没有 on_fail 参数时找不到也继续执行"""
+        img = node.params.get('img', 'target.png')
+        policy = RetryPolicy.from_params(node.params.get('retry', 1), node.params.get('timeout', 0.0),
+                                         node.params.get('on_change', False))
+        click = getattr(self.autobot, node.type)
+        result = click(img, policy=policy)
+        return self.handle_failure(node, bool(result), node.params.get('on_fail', 'continue'),
+                                   f"未找到 {img}")
+
+    def handle_failure(self, node: Node, ok: bool, on_fail: str, message: str) -> bool:
+        """按 on_fail 处理失败，返回是否继续执行后续节点"""
+        if ok or on_fail == 'continue':
+            return True
+        if on_fail == 'error':
+            self.report_error(node, RuntimeError(message))
+        log.warning("%s，跳过节点 %s 之后的节点", message, node.id,
+                    extra={'node': node.id, 'action': node.type, 'params': {'on_fail': on_fail}})
+        return False
+
+    def execute_probe(self, node: Node) -> bool:
+        """执行像素/颜色条件节点"""
+        color = parse_color(node.params.get('color', '#4CAF50'))
+        tolerance = node.params.get('tolerance', 10)
+        expect = node.params.get('expect', True)
+        timeout = node.params.get('timeout', 0.0)
+        if node.type == 'pixel_check':
+            points = parse_points(node.params.get('points', '100,100'))
+            result = self.autobot.pixel_check(points, color, tolerance, expect, timeout)
+        else:
+            region = parse_region(node.params.get('region', '100,100,20,20'))
+            result = self.autobot.color_region_check(region, color, tolerance, expect, timeout)
+        return self.handle_failure(node, result, node.params.get('on_fail', 'stop'), "条件不满足")
+
+    def execute_subflow(self, node: Node):
+        """内联执行子工作流：计划按文件缓存只编译一次，参数绑定只复制引用了变量的节点"""
+        path = resolve_workflow_path(node.params.get('workflow', ''), self.workflow_file)
+        stack = self.call_stack or ((self.workflow_file,) if self.workflow_file else ())
+        if path in stack:
+            chain = ' -> '.join(os.path.basename(p) for p in stack + (path,))
+            raise RecursionError(f"子工作流循环引用: {chain}")
+        if len(stack) >= MAX_SUBFLOW_DEPTH:
+            raise RecursionError(f"子工作流嵌套超过 {MAX_SUBFLOW_DEPTH} 层")
+        bindings = parse_bindings(node.params.get('bindings', ''))
+        plan = self.plans.get(path)
+        log.info("执行子工作流 %s", os.path.basename(path),
+                 extra={'action': 'subflow', 'params': {'workflow': path, 'bindings': bindings}})
+        child = WorkflowExecutor(plan.bind(bindings), plan.connections, self.autobot, self.on_error,
+                                 path, self.plans, plan, stack + (path,), self.branch_workers)
+        try:
+            child.execute_from_starts(plan.start_nodes())
+        finally:
+            with self._error_lock:
+                self.error_count += child.error_count
+
+    def report_error(self, node: Node, error: Exception):
+        """统计节点错误并交给 on_error 处理（在分支工作线程中时由调度线程调用 on_error）"""
+        with self._error_lock:
+            self.error_count += 1
+        NODE_ERRORS.labels(node.type).inc()
+        _call_on_error(self.on_error, node, error)
+
+    def print_error(self, node: Node, error: Exception):
+        """默认的错误处理：记录错误后继续执行"""
+        log.error("执行节点 %s 时出错：%s", node.type, error,
+                  extra={'node': node.id, 'action': node.type,
+                         'params': {'error': type(error).__name__}})
+
+
+class BranchScheduler:
+    """按资源调度分支
+
+    需要屏幕或剪贴板的单元在调用线程中逐个执行（UI 通道，仍按深度优先、连接添加顺序），
+    不需要资源的单元（等待、系统命令、只含这些节点的循环和子工作流）交给线程池，与 UI 通道并发执行。
+    已执行集合和待完成计数只在调用线程中修改，工作线程执行完把结果放入完成队列，不等待任何锁；
+    汇合节点与顺序执行时一样，在第一个分支到达时执行。
+    """
+
+    def __init__(self, executor: WorkflowExecutor, workers: int = BRANCH_WORKERS):
+        self.executor = executor
+        self.workers = workers
+
+    def run(self, start_nodes: List[str], executed: set):
+        executor = self.executor
+        ui_stack: List[str] = []
+        done = queue.SimpleQueue()
+        pending = 0
+
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='branch') as pool:
+            def spawn(node_ids: List[str]):
+                nonlocal pending
+                ui_ready = []
+                for node_id in node_ids:
+                    if node_id in executed or node_id not in executor.nodes:
+                        continue
+                    executed.add(node_id)
+                    pending += 1
+                    if executor.resources_of(node_id):
+                        ui_ready.append(node_id)
+                    else:
+                        BRANCH_TASKS.labels('pool').inc()
+                        pool.submit(self.run_in_worker, node_id, done)
+                ui_stack.extend(reversed(ui_ready))  # 倒序入栈，先执行第一个后续节点及其分支
+
+            def finish(node_id: str, ok: bool):
+                nonlocal pending
+                pending -= 1
+                if ok:
+                    spawn(executor.nodes_after(node_id, executed))
+
+            def collect(node_id: str, ok: bool, errors: list):
+                for on_error, node, error in errors:
+                    _call_on_error(on_error, node, error)
+                finish(node_id, ok)
+
+            spawn(start_nodes)
+            while pending:
+                if not ui_stack:
+                    collect(*done.get())  # UI 通道无事可做，等待工作线程
+                    continue
+                while True:
+                    try:
+                        collect(*done.get_nowait())
+                    except queue.Empty:
+                        break
+                node_id = ui_stack.pop()
+                BRANCH_TASKS.labels('ui').inc()
+                finish(node_id, executor.execute_unit(node_id))
+
+    def run_in_worker(self, node_id: str, done: queue.SimpleQueue):
+        """在工作线程中执行一个单元，on_error 调用暂存后随结果交回调度线程"""
+        errors = _deferred.errors = []
+        ok = False
+        try:
+            ok = self.executor.execute_unit(node_id)
+        except Exception as e:
+            self.executor.report_error(self.executor.nodes[node_id], e)
+        finally:
+            _deferred.errors = None
+            done.put((node_id, ok, errors))
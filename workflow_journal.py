@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作流编辑日志
+每次编辑以一行紧凑 JSON 追加到 <工作流>.journal，保存单次编辑的开销与图的大小无关；
+日志达到一定长度后压缩：把当前图写成快照（即工作流 JSON 文件本身）并清空日志。
+加载时读取快照再重放日志，编辑器崩溃后也不会丢失已做的修改。
+日志是已保存内容的一部分：执行器、守护进程、预检和远程代理都通过 workflow_model.load_workflow_data
+读取快照加日志，不必等到压缩。
+
+日志操作：
+    {"op":"add","id":"node_1","type":"click_left","x":50,"y":100}
+    {"op":"move","id":"node_1","x":80,"y":120}
+    {"op":"params","id":"node_1","params":{"img":"ok.png"}}
+    {"op":"del","id":"node_1"}
+    {"op":"conn","from":"node_1","to":"node_2"}
+    {"op":"disconn","from":"node_1","to":"node_2"}
+    {"op":"clear"}
+所有操作都可以重复执行，压缩时在替换快照和清空日志之间崩溃，重放后结果不变。
+"""
+
+import os
+import sys
+import json
+import argparse
+from typing import Dict, List, Any, Tuple
+
+from workflow_model import (Node, Connection, JOURNAL_SUFFIX, load_workflow_data, workflow_from_dict,
+                            save_workflow_file)
+
+COMPACT_OPS = 500  # 日志超过该条数时压缩为快照
+
+
+class WorkflowJournal:
+    """绑定一个工作流文件的编辑日志"""
+
+    def __init__(self, filename: str, compact_ops: int = COMPACT_OPS):
+        self.filename = os.path.abspath(filename)
+        self.journal_path = self.filename + JOURNAL_SUFFIX
+        self.compact_ops = compact_ops
+        self.ops = 0  # 日志中尚未压缩的操作数
+        self._file = None
+
+    def load(self) -> Tuple[Dict[str, Node], List[Connection]]:
+        """读取快照并重放日志（与执行器等读取方相同的加载路径）"""
+        try:
+            nodes, connections = workflow_from_dict(load_workflow_data(self.filename))
+        except FileNotFoundError:
+            nodes, connections = {}, []
+        self.ops = self._count_ops()
+        return nodes, connections
+
+    def _count_ops(self) -> int:
+        """日志中的行数（崩溃时写了一半的行也计入，只影响何时压缩）"""
+        try:
+            with open(self.journal_path, 'rb') as f:
+                return sum(1 for line in f if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def append(self, op: Dict[str, Any]):
+        """追加一条操作并刷新到操作系统缓冲区"""
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+            self._file = open(self.journal_path, 'a', encoding='utf-8')
+            if not self._ends_with_newline():
+                # 上次写了一半的行单独成行，不影响之后的操作
+                self._file.write('\n')
+        self._file.write(json.dumps(op, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self.ops += 1
+
+    def _ends_with_newline(self) -> bool:
+        """日志为空或以换行结尾"""
+        with open(self.journal_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.ops >= self.compact_ops
+
+    def compact(self, nodes: Dict[str, Node], connections: List[Connection]):
+        """把当前图写成快照并清空日志"""
+        save_workflow_file(self.filename, nodes, connections)
+        self.close()
+        open(self.journal_path, 'w').close()
+        self.ops = 0
+
+    def discard(self):
+        """删除日志（放弃未压缩的修改）"""
+        self.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.ops = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="查看或压缩工作流编辑日志")
+    parser.add_argument('workflow', help="工作流 JSON 文件")
+    parser.add_argument('--compact', action='store_true', help="把日志合并进工作流文件")
+    args = parser.parse_args(argv)
+
+    journal = WorkflowJournal(args.workflow)
+    nodes, connections = journal.load()
+    print(f"快照 + {journal.ops} 条日志：{len(nodes)} 个节点，{len(connections)} 个连接")
+    if args.compact:
+        journal.compact(nodes, connections)
+        print(f"已压缩到 {journal.filename}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作流数据模型
+节点、连接以及工作流 JSON 的读写，不依赖 PyQt，可在无界面环境中使用。
+Node/Connection 为使用 __slots__ 的独立对象；GraphStore 以数组保存超大工作流，
+通过 NodeView/ConnectionView 提供相同的接口
+"""
+
+import os
+import sys
+import json
+from array import array
+from types import MappingProxyType
+from collections.abc import Mapping
+from typing import Dict, List, Any, Tuple, Iterator, Optional
+
+
+class NodeShape:
+    """节点尺寸与几何计算（所有节点尺寸相同）"""
+    __slots__ = ()
+    width = 120
+    height = 60
+
+    def contains_point(self, x: int, y: int) -> bool:
+        """检查点是否在节点内"""
+        return (self.x <= x <= self.x + self.width and
+                self.y <= y <= self.y + self.height)
+
+    def get_center(self) -> Tuple[int, int]:
+        """获取节点中心点"""
+        return (self.x + self.width // 2, self.y + self.height // 2)
+
+
+class Node(NodeShape):
+    """节点类"""
+    __slots__ = ('id', 'type', 'x', 'y', 'params', 'selected', 'hovered')
+
+    def __init__(self, node_id: str, node_type: str, x: int, y: int):
+        self.id = node_id
+        self.type = sys.intern(node_type)
+        self.x = x
+        self.y = y
+        self.params = {}
+        self.selected = False
+        self.hovered = False
+
+class Connection:
+    """连接类"""
+    __slots__ = ('from_node', 'to_node')
+
+    def __init__(self, from_node: str, to_node: str):
+        self.from_node = from_node
+        self.to_node = to_node
+
+
+#region 紧凑存储
+ALIVE, SELECTED, HOVERED = 1, 2, 4  # GraphStore.flags 的位
+COMPACT_NODES = 10000  # 节点数达到该值的工作流加载为 GraphStore
+EMPTY_PARAMS = MappingProxyType({})  # 无参数节点共享的只读参数
+
+
+class NodeView(NodeShape):
+    """GraphStore 中一个节点的视图，属性直接读写底层数组"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'GraphStore', index: int):
+        self._store = store
+        self._index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, NodeView) and other._store is self._store
+                and other._index == self._index)
+
+    def __hash__(self):
+        return hash((id(self._store), self._index))
+
+    @property
+    def id(self) -> str:
+        return self._store.ids[self._index]
+
+    @property
+    def type(self) -> str:
+        return self._store.types[self._index]
+
+    @type.setter
+    def type(self, value: str):
+        self._store.types[self._index] = sys.intern(value)
+
+    @property
+    def x(self) -> int:
+        return self._store.xs[self._index]
+
+    @x.setter
+    def x(self, value: int):
+        self._store.xs[self._index] = value
+
+    @property
+    def y(self) -> int:
+        return self._store.ys[self._index]
+
+    @y.setter
+    def y(self, value: int):
+        self._store.ys[self._index] = value
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        # 没有参数的节点不分配字典，读取时返回共享的只读空映射，需要修改时整体赋值
+        params = self._store.params[self._index]
+        return EMPTY_PARAMS if params is None else params
+
+    @params.setter
+    def params(self, value: Dict[str, Any]):
+        self._store.params[self._index] = value or None
+
+    def _flag(self, bit: int) -> bool:
+        return bool(self._store.flags[self._index] & bit)
+
+    def _set_flag(self, bit: int, value: bool):
+        if value:
+            self._store.flags[self._index] |= bit
+        else:
+            self._store.flags[self._index] &= ~bit
+
+    selected = property(lambda self: self._flag(SELECTED),
+                        lambda self, value: self._set_flag(SELECTED, value))
+    hovered = property(lambda self: self._flag(HOVERED),
+                       lambda self, value: self._set_flag(HOVERED, value))
+
+
+class ConnectionView:
+    """GraphStore 中一条边的视图"""
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store: 'GraphStore', index: int):
+        self._store = store
+        self._index = index
+
+    @property
+    def from_node(self) -> str:
+        return self._store.ids[self._store.edge_from[self._index]]
+
+    @property
+    def to_node(self) -> str:
+        return self._store.ids[self._store.edge_to[self._index]]
+
+
+class NodeMapping(Mapping):
+    """按节点编号访问 GraphStore 的只读字典接口，取值时才创建视图"""
+    __slots__ = ('_store',)
+
+    def __init__(self, store: 'GraphStore'):
+        self._store = store
+
+    def __getitem__(self, node_id: str) -> NodeView:
+        return NodeView(self._store, self._store.index[node_id])
+
+    def __contains__(self, node_id) -> bool:
+        return node_id in self._store.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._store.index)
+
+    def __len__(self) -> int:
+        return len(self._store.index)
+
+
+class EdgeList:
+    """GraphStore 中存活边的可迭代视图（与 List[Connection] 的遍历接口一致）"""
+    __slots__ = ('_store',)
+
+    def __init__(self, store: 'GraphStore'):
+        self._store = store
+
+    def __iter__(self) -> Iterator[ConnectionView]:
+        store = self._store
+        return (ConnectionView(store, e) for e in range(len(store.edge_alive)) if store.edge_alive[e])
+
+    def __len__(self) -> int:
+        return self._store.edge_count
+
+    def pairs(self) -> Iterator[Tuple[str, str]]:
+        """直接产生 (起点编号, 终点编号)，不创建视图"""
+        store = self._store
+        ids, edge_from, edge_to = store.ids, store.edge_from, store.edge_to
+        return ((ids[edge_from[e]], ids[edge_to[e]])
+                for e in range(len(store.edge_alive)) if store.edge_alive[e])
+
+
+class GraphStore:
+    """按列保存的工作流图
+
+    节点的编号、类型、坐标、参数和状态各存一列，节点之间以整数下标引用；
+    边保存为两个整数数组；类型字符串驻留，相同类型共享一个对象；
+    删除节点和边只打墓碑标记，compact() 时才重新排列
+    """
+
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self.types: List[Optional[str]] = []
+        self.xs = array('i')
+        self.ys = array('i')
+        self.params: List[Optional[Dict[str, Any]]] = []
+        self.flags = bytearray()
+        self.index: Dict[str, int] = {}  # 存活节点的编号 -> 下标
+        self.edge_from = array('i')
+        self.edge_to = array('i')
+        self.edge_alive = bytearray()
+        self.edge_count = 0
+        self._edge_keys = None  # 存活边的 起点下标 << 32 | 终点下标 -> 边下标，逐条增删边时才建立
+        self._incident = None  # 节点下标 -> 与其相连的边下标（可能含已删除的边），删除节点时才建立
+        self.nodes = NodeMapping(self)
+        self.connections = EdgeList(self)
+
+    def add_node(self, node_id: str, node_type: str, x: int, y: int,
+                 params: Dict[str, Any] = None) -> int:
+        """添加节点（编号已存在时覆盖其属性），返回下标"""
+        i = self.index.get(node_id)
+        if i is None:
+            i = len(self.ids)
+            self.ids.append(node_id)
+            self.types.append(sys.intern(node_type))
+            self.xs.append(x)
+            self.ys.append(y)
+            self.params.append(params or None)
+            self.flags.append(ALIVE)
+            self.index[node_id] = i
+        else:
+            self.types[i] = sys.intern(node_type)
+            self.xs[i], self.ys[i] = x, y
+            self.params[i] = params or None
+        return i
+
+    def remove_node(self, node_id: str):
+        """删除节点及其所有连接（打墓碑标记）"""
+        i = self.index.pop(node_id, None)
+        if i is None:
+            return
+        self.flags[i] = 0
+        self.params[i] = None
+        for e in self.incident_edges().pop(i, ()):
+            if self.edge_alive[e]:
+                self._kill_edge(e)
+
+    def edge_keys(self) -> Dict[int, int]:
+        """存活边的键 -> 边下标，用于去重和按端点查找边"""
+        if self._edge_keys is None:
+            self._edge_keys = {self.edge_from[e] << 32 | self.edge_to[e]: e
+                               for e in range(len(self.edge_alive)) if self.edge_alive[e]}
+        return self._edge_keys
+
+    def incident_edges(self) -> Dict[int, List[int]]:
+        """节点下标 -> 与其相连的边下标"""
+        if self._incident is None:
+            self._incident = {}
+            for e in range(len(self.edge_alive)):
+                if self.edge_alive[e]:
+                    self._incident.setdefault(self.edge_from[e], []).append(e)
+                    self._incident.setdefault(self.edge_to[e], []).append(e)
+        return self._incident
+
+    def add_edge(self, from_node: str, to_node: str, keys: Dict[int, int] = None) -> bool:
+        """添加连接，规则与画布一致（跳过自环、悬空和重复连接），返回是否添加"""
+        a, b = self.index.get(from_node), self.index.get(to_node)
+        keys = self.edge_keys() if keys is None else keys
+        if a is None or b is None or a == b or (a << 32 | b) in keys:
+            return False
+        e = len(self.edge_alive)
+        self.edge_from.append(a)
+        self.edge_to.append(b)
+        self.edge_alive.append(1)
+        keys[a << 32 | b] = e
+        if self._incident is not None:
+            self._incident.setdefault(a, []).append(e)
+            self._incident.setdefault(b, []).append(e)
+        self.edge_count += 1
+        return True
+
+    def remove_edge(self, from_node: str, to_node: str):
+        a, b = self.index.get(from_node), self.index.get(to_node)
+        if a is None or b is None:
+            return
+        e = self.edge_keys().get(a << 32 | b)
+        if e is not None:
+            self._kill_edge(e)
+
+    def _kill_edge(self, e: int):
+        self.edge_alive[e] = 0
+        if self._edge_keys is not None:
+            self._edge_keys.pop(self.edge_from[e] << 32 | self.edge_to[e], None)
+        self.edge_count -= 1
+
+    def compact(self):
+        """去掉墓碑，重新排列下标"""
+        pairs = list(self.connections.pairs())
+        live = list(self.index.items())
+        types, xs, ys, params, flags = self.types, self.xs, self.ys, self.params, self.flags
+        self.__init__()
+        for node_id, i in live:
+            self.add_node(node_id, types[i], xs[i], ys[i], params[i])
+            self.flags[-1] = flags[i]
+        keys = {}
+        for from_node, to_node in pairs:
+            self.add_edge(from_node, to_node, keys)
+
+    @classmethod
+    def from_dict(cls, workflow_data: Dict[str, Any]) -> 'GraphStore':
+        """从工作流字典构建"""
+        store = cls()
+        for node_id, node_data in workflow_data.get('nodes', {}).items():
+            store.add_node(node_id, node_data['type'], node_data['x'], node_data['y'],
+                           node_data.get('params'))
+        # 批量加载时只临时建立去重索引，加载完即释放
+        keys = {}
+        for conn_data in workflow_data.get('connections', []):
+            store.add_edge(conn_data['from'], conn_data['to'], keys)
+        return store
+#endregion
+
+
+def connection_pairs(connections) -> Iterator[Tuple[str, str]]:
+    """遍历连接的 (起点, 终点)，GraphStore 的边列表不必逐条创建视图"""
+    if isinstance(connections, EdgeList):
+        return connections.pairs()
+    return ((conn.from_node, conn.to_node) for conn in connections)
+
+
+def workflow_to_dict(nodes: Dict[str, Node], connections: List[Connection]) -> Dict[str, Any]:
+    """将节点和连接转换为工作流字典（保存格式）"""
+    return {
+        'nodes': {
+            node_id: {
+                'type': node.type,
+                'x': node.x,
+                'y': node.y,
+                'params': dict(node.params)
+            }
+            for node_id, node in nodes.items()
+        },
+        'connections': [
+            {'from': conn.from_node, 'to': conn.to_node}
+            for conn in connections
+        ]
+    }
+
+
+def workflow_from_dict(workflow_data: Dict[str, Any]) -> Tuple[Dict[str, Node], List[Connection]]:
+    """从工作流字典构建节点和连接，规则与画布添加连接一致"""
+    nodes: Dict[str, Node] = {}
+    for node_id, node_data in workflow_data.get('nodes', {}).items():
+        node = Node(node_id, node_data['type'], node_data['x'], node_data['y'])
+        node.params = node_data.get('params', {})
+        nodes[node_id] = node
+
+    # 跳过自环、悬空和重复连接
+    connections: List[Connection] = []
+    seen = set()
+    for conn_data in workflow_data.get('connections', []):
+        key = (conn_data['from'], conn_data['to'])
+        if key[0] != key[1] and key[0] in nodes and key[1] in nodes and key not in seen:
+            seen.add(key)
+            connections.append(Connection(*key))
+    return nodes, connections
+
+
+#region 编辑日志
+JOURNAL_SUFFIX = '.journal'  # 编辑器把尚未压缩的编辑追加到 <工作流>.journal（见 workflow_journal.py）
+
+
+def parse_journal(text: str) -> List[Dict[str, Any]]:
+    """解析日志中的操作，跳过崩溃时写了一半的行"""
+    ops = []
+    for line in text.splitlines():
+        try:
+            ops.append(json.loads(line))
+        except ValueError:
+            continue
+    return ops
+
+
+def replay(workflow_data: Dict[str, Any], ops: List[Dict[str, Any]]):
+    """按顺序把编辑操作应用到工作流字典上（原地修改），规则与画布一致"""
+    nodes = workflow_data.setdefault('nodes', {})
+    connections = workflow_data.setdefault('connections', [])
+    edges = {(conn['from'], conn['to']) for conn in connections}
+    for op in ops:
+        kind = op.get('op')
+        if kind == 'add':
+            nodes[op['id']] = {'type': op['type'], 'x': op['x'], 'y': op['y'],
+                               'params': op.get('params', {})}
+        elif kind == 'move':
+            if op['id'] in nodes:
+                nodes[op['id']]['x'], nodes[op['id']]['y'] = op['x'], op['y']
+        elif kind == 'params':
+            if op['id'] in nodes:
+                nodes[op['id']]['params'] = op['params']
+        elif kind == 'del':
+            if nodes.pop(op['id'], None) is not None:
+                connections[:] = [conn for conn in connections
+                                  if conn['from'] != op['id'] and conn['to'] != op['id']]
+                edges = {(conn['from'], conn['to']) for conn in connections}
+        elif kind == 'conn':
+            key = (op['from'], op['to'])
+            if key[0] != key[1] and key[0] in nodes and key[1] in nodes and key not in edges:
+                edges.add(key)
+                connections.append({'from': key[0], 'to': key[1]})
+        elif kind == 'disconn':
+            key = (op['from'], op['to'])
+            if key in edges:
+                edges.discard(key)
+                connections[:] = [conn for conn in connections
+                                  if (conn['from'], conn['to']) != key]
+        elif kind == 'clear':
+            nodes.clear()
+            connections.clear()
+            edges.clear()
+
+
+def read_workflow_bytes(filename: str) -> Tuple[bytes, bytes]:
+    """读取快照和日志的原始内容，不存在的文件为空"""
+    contents = []
+    for path in (filename, filename + JOURNAL_SUFFIX):
+        try:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        except FileNotFoundError:
+            contents.append(b'')
+    if not contents[0] and not contents[1]:
+        raise FileNotFoundError(f"工作流文件不存在: {filename}")
+    return contents[0], contents[1]
+
+
+def decode_workflow(snapshot: bytes, journal: bytes = b'') -> Dict[str, Any]:
+    """由快照和日志内容得到工作流字典"""
+    data = json.loads(snapshot.decode('utf-8')) if snapshot else {'nodes': {}, 'connections': []}
+    if journal:
+        replay(data, parse_journal(journal.decode('utf-8', errors='replace')))
+    return data
+
+
+def load_workflow_data(filename: str) -> Dict[str, Any]:
+    """读取工作流字典：快照加上编辑器尚未压缩的日志。所有读取工作流文件的地方都经过这里"""
+    return decode_workflow(*read_workflow_bytes(filename))
+#endregion
+
+
+def graph_from_dict(workflow_data: Dict[str, Any], compact: Optional[bool] = None
+                    ) -> Tuple[Dict[str, Node], List[Connection]]:
+    """构建节点和连接；compact 为 True 时使用 GraphStore 存储并返回其视图，
+    为 None 时节点数达到 COMPACT_NODES 才使用"""
+    if compact is None:
+        compact = len(workflow_data.get('nodes', {})) >= COMPACT_NODES
+    if compact:
+        store = GraphStore.from_dict(workflow_data)
+        return store.nodes, store.connections
+    return workflow_from_dict(workflow_data)
+
+
+def load_workflow_file(filename: str, compact: Optional[bool] = None
+                       ) -> Tuple[Dict[str, Node], List[Connection]]:
+    """从 JSON 文件（及其编辑日志）加载工作流，超大工作流使用 GraphStore（见 graph_from_dict）"""
+    return graph_from_dict(load_workflow_data(filename), compact)
+
+
+def save_workflow_file(filename: str, nodes: Dict[str, Node], connections: List[Connection]):
+    """将工作流保存为 JSON 文件（先写临时文件再替换，写入中途崩溃不会损坏原文件）"""
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(workflow_to_dict(nodes, connections), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, filename)
+
+
+def apply_variables(nodes: Dict[str, Node], variables: Dict[str, Any]):
+    """将字符串参数中的 ${name} 替换为变量值（用于数据分片和参数绑定）"""
+    if not variables:
+        return
+    for node in nodes.values():
+        for key, value in node.params.items():
+            if isinstance(value, str) and '${' in value:
+                for name, var_value in variables.items():
+                    value = value.replace('${' + name + '}', str(var_value))
+                node.params[key] = value
+